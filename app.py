@@ -1,15 +1,269 @@
-import gradio as gr
+import argparse
+import asyncio
+import atexit
 import subprocess
 import tempfile
 import uuid
 import os
 import re
+import json
+import zlib
+import hashlib
+import heapq
+import http.cookiejar
+import random
+import queue
+import shutil
+import signal
+import socket
+import sys
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import closing
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
-from typing import Generator, Tuple, List, Optional
+from typing import AsyncGenerator, Callable, Dict, Generator, Iterable, NamedTuple, Set, Tuple, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
 
 # Constants
 DEFAULT_OUT_DIR = "Downloads"
 TEMP_DIR = tempfile.gettempdir()
+# App state that must survive restarts (bulk job queue, caches)
+APP_DATA_DIR = os.environ.get("YOUOWN_DATA_DIR", ".youown")
+JOB_DB_PATH = os.path.join(APP_DATA_DIR, "jobs.sqlite3")
+# Distributed batches go to this queue and are run by `app.py worker` nodes that open the same file
+# (e.g. on a network share). A node that misses heartbeats for LEASE_SECONDS loses its jobs
+QUEUE_DB_PATH = os.environ.get("YOUOWN_QUEUE", JOB_DB_PATH)
+LEASE_SECONDS = float(os.environ.get("YOUOWN_LEASE_SECONDS", 60))
+HEARTBEAT_INTERVAL = LEASE_SECONDS / 4
+NODE_POLL_INTERVAL = 1.0
+LEASE_CANDIDATES = 50
+# Extracted yt-dlp metadata is reused for retries/re-downloads for a while, within a size budget
+INFO_CACHE_PATH = os.path.join(APP_DATA_DIR, "info_cache.sqlite3")
+INFO_CACHE_TTL = float(os.environ.get("YOUOWN_INFO_CACHE_TTL", 1800))
+INFO_CACHE_MAX_BYTES = int(os.environ.get("YOUOWN_INFO_CACHE_MB", 200)) * 1024 * 1024
+# Resume unfinished bulk batches when the app starts; finished batches are pruned after N days
+RESUME_ON_START = os.environ.get("YOUOWN_RESUME", "1") != "0"
+JOB_HISTORY_DAYS = int(os.environ.get("YOUOWN_JOB_HISTORY_DAYS", 7))
+# yt-dlp children mostly wait on the network, so bulk runs more of them than there are cores
+DEFAULT_MAX_WORKERS = int(os.environ.get("YOUOWN_MAX_WORKERS", max(2, min(8, (os.cpu_count() or 2) * 2))))
+MAX_WORKERS_LIMIT = 32
+# Progress logs keep only the newest lines and the UI is refreshed at most this often (seconds)
+LOG_MAX_LINES = int(os.environ.get("YOUOWN_LOG_LINES", 200))
+LOG_UPDATE_INTERVAL = float(os.environ.get("YOUOWN_LOG_INTERVAL", 0.25))
+# Gradio queue: how many downloads the UI runs at once across all users/tabs, and how many may wait
+UI_CONCURRENCY_LIMIT = int(os.environ.get("YOUOWN_UI_CONCURRENCY", 16))
+UI_QUEUE_MAX_SIZE = int(os.environ.get("YOUOWN_UI_QUEUE_SIZE", 100))
+# Headless JSON API (python app.py serve); set a token to require "Authorization: Bearer <token>"
+API_HOST = os.environ.get("YOUOWN_API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("YOUOWN_API_PORT", 7861))
+API_TOKEN = os.environ.get("YOUOWN_API_TOKEN", "")
+API_MAX_BODY = 16 * 1024 * 1024
+# Without a token the API only answers requests addressed to localhost, and only JSON POSTs
+# without a foreign Origin, so web pages open in the browser can't submit jobs
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1"}
+# url_files sent to the API must be inside this folder; finished API jobs are forgotten after a
+# day, or sooner once more than API_JOB_HISTORY have finished
+API_LIST_DIR = os.environ.get("YOUOWN_API_LIST_DIR", os.path.join(APP_DATA_DIR, "lists"))
+API_JOB_HISTORY = 100
+API_JOB_TTL = 24 * 3600.0
+# yt-dlp options the API accepts in extra_args (True: takes a value). Anything else, e.g. --exec,
+# --downloader or --config-locations, could run programs or read and write files on the host
+API_EXTRA_OPTIONS = {
+    "-r": True, "--limit-rate": True, "--throttled-rate": True, "-N": True, "--concurrent-fragments": True,
+    "-R": True, "--retries": True, "--fragment-retries": True, "--socket-timeout": True,
+    "--http-chunk-size": True, "--sleep-interval": True, "--max-sleep-interval": True,
+    "--sleep-requests": True, "-4": False, "--force-ipv4": False, "-6": False, "--force-ipv6": False,
+    "--geo-bypass": False, "--no-geo-bypass": False, "--geo-bypass-country": True, "--xff": True,
+    "--no-check-certificates": False, "--no-check-certificate": False, "--legacy-server-connect": False,
+    "--impersonate": True, "--referer": True, "--add-header": True, "--extractor-args": True,
+    "-f": True, "--format": True, "-S": True, "--format-sort": True, "--prefer-free-formats": False,
+    "--merge-output-format": True, "--remux-video": True, "-x": False, "--extract-audio": False,
+    "--audio-format": True, "--audio-quality": True, "--no-playlist": False, "--yes-playlist": False,
+    "-I": True, "--playlist-items": True, "--max-downloads": True, "--min-filesize": True,
+    "--max-filesize": True, "--date": True, "--datebefore": True, "--dateafter": True,
+    "--age-limit": True, "--embed-thumbnail": False, "--embed-metadata": False, "--embed-subs": False,
+    "--embed-chapters": False, "--write-subs": False, "--write-auto-subs": False, "--sub-langs": True,
+    "--sub-format": True, "--convert-subs": True, "--write-thumbnail": False, "--write-description": False,
+    "--sponsorblock-remove": True, "--sponsorblock-mark": True, "--no-mtime": False, "--no-warnings": False,
+}
+# Every finished download attempt is appended here as one JSON line ("" disables it); the
+# Prometheus text metrics are served on /metrics by the API, or on YOUOWN_METRICS_PORT with the UI
+EVENT_LOG_PATH = os.environ.get("YOUOWN_EVENT_LOG", os.path.join(APP_DATA_DIR, "events.jsonl"))
+EVENT_LOG_MAX_BYTES = int(os.environ.get("YOUOWN_EVENT_LOG_MB", 50)) * 1024 * 1024
+METRICS_PORT = int(os.environ.get("YOUOWN_METRICS_PORT", 0))
+METRIC_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+METRIC_HELP = {
+    "youown_jobs_total": ("counter", "Finished download attempts by outcome"),
+    "youown_retries_total": ("counter", "Download attempts that were retries"),
+    "youown_failures_total": ("counter", "Failed download attempts by failure kind"),
+    "youown_downloaded_bytes_total": ("counter", "Bytes of finished files"),
+    "youown_phase_seconds": ("histogram", "Time spent per phase (extract, disk_wait, download, merge_wait, merge, postprocess)"),
+    "youown_queue_wait_seconds": ("histogram", "Time a bulk URL waited for a worker and its site's limits"),
+    "youown_active_downloads": ("gauge", "yt-dlp runs in progress"),
+}
+# Per-host (max concurrent downloads, requests per minute) so bulk runs don't get throttled.
+# Override with YOUOWN_HOST_LIMITS="youtube.com=2/20,instagram.com=1/6"
+HOST_LIMITS = {
+    "youtube.com": (3, 20),
+    "instagram.com": (2, 10),
+    "tiktok.com": (4, 30),
+    "twitter.com": (4, 30),
+    "reddit.com": (4, 30),
+}
+DEFAULT_HOST_LIMIT = (4, 60)
+# Second-level labels of multi-part public suffixes under country domains (co.uk, com.au,
+# ne.jp...): the site is the label before them, so bbc.co.uk and itv.co.uk stay apart
+SECOND_LEVEL_SUFFIXES = {"co", "com", "net", "org", "gov", "edu", "ac", "ne", "or", "go", "gob", "nic", "ltd", "plc"}
+# Download budget shared by every running download, e.g. "50M" bytes/s (0 = unlimited).
+# Single/Restricted tab downloads get a bigger slice than bulk ones so they stay responsive
+BANDWIDTH_LIMIT = os.environ.get("YOUOWN_BANDWIDTH_LIMIT", "0")
+PRIORITY_WEIGHTS = {"interactive": 4.0, "bulk": 1.0}
+MIN_JOB_RATE = 64 * 1024
+# Parallel fragments for HLS/DASH: "auto" tunes them per site from measured speed and fragment
+# errors, a number fixes them. All running downloads together open at most FRAGMENT_STREAM_BUDGET
+CONCURRENT_FRAGMENTS = os.environ.get("YOUOWN_CONCURRENT_FRAGMENTS", "auto").lower()
+FRAGMENT_STREAM_BUDGET = int(os.environ.get("YOUOWN_FRAGMENT_STREAMS", 32))
+FRAGMENT_START, FRAGMENT_MAX = 4, 16
+FRAGMENT_ERRORS = re.compile(r"Retrying fragment|Skipping fragment|fragment \d+ not found", re.IGNORECASE)
+# Disk preflight: a download reserves its expected size (yt-dlp's filesize/filesize_approx, plus a
+# margin) before it starts and waits while no output volume has that much room left over
+# DISK_MIN_FREE. YOUOWN_OUTPUT_VOLUMES ("D:\\Media;E:\\Media", os.pathsep separated) adds volumes
+# that downloads spread over; YOUOWN_SHARDING="extractor/date" saves to <volume>/<site>/<YYYY-MM>/
+DISK_PREFLIGHT = os.environ.get("YOUOWN_DISK_PREFLIGHT", "1") != "0"
+DISK_MIN_FREE = int(os.environ.get("YOUOWN_DISK_MIN_FREE_MB", 1024)) * 1024 * 1024
+DISK_SIZE_MARGIN = 1.1
+DISK_POLL_INTERVAL = 1.0
+OUTPUT_VOLUMES = [path for path in os.environ.get("YOUOWN_OUTPUT_VOLUMES", "").split(os.pathsep) if path.strip()]
+OUTPUT_SHARDING = os.environ.get("YOUOWN_SHARDING", "").lower()
+# Video+audio merges (ffmpeg, CPU/disk bound) run in their own pool instead of holding a
+# download slot; 0 leaves merging to yt-dlp inside the download
+MERGE_WORKERS = int(os.environ.get("YOUOWN_MERGE_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+# Merges copy the streams into a container that can hold their codecs (mp4, else webm, else mkv).
+# YOUOWN_MERGE_CONTAINER forces one; YOUOWN_REENCODE=1 allows re-encoding streams it can't hold
+MERGE_CONTAINER = os.environ.get("YOUOWN_MERGE_CONTAINER", "").lower()
+MERGE_REENCODE = os.environ.get("YOUOWN_REENCODE", "0") == "1"
+CONTAINER_CODECS = {
+    "mp4": ({"h264", "hevc", "av1", "mpeg4"}, {"aac", "mp3", "ac3", "eac3", "alac"}),
+    "webm": ({"vp8", "vp9", "av1"}, {"opus", "vorbis"}),
+}
+CODEC_ALIASES = {
+    "avc1": "h264", "avc3": "h264", "h264": "h264", "hvc1": "hevc", "hev1": "hevc", "hevc": "hevc",
+    "h265": "hevc", "av01": "av1", "av1": "av1", "vp09": "vp9", "vp9": "vp9", "vp08": "vp8",
+    "vp8": "vp8", "mp4v": "mpeg4", "mpeg4": "mpeg4", "mp4a": "aac", "aac": "aac", "mp3": "mp3",
+    "ac-3": "ac3", "ac3": "ac3", "ec-3": "eac3", "eac3": "eac3", "alac": "alac", "opus": "opus",
+    "vorbis": "vorbis", "flac": "flac",
+}
+# Re-encode targets for a forced container (same settings as FixCodic.bat for mp4)
+REENCODE_ARGS = {
+    "mp4": (["-c:v", "libx264", "-preset", "medium", "-crf", "23"], ["-c:a", "aac", "-b:a", "128k"]),
+    "webm": (["-c:v", "libvpx-vp9", "-crf", "32", "-b:v", "0"], ["-c:a", "libopus", "-b:a", "128k"]),
+}
+# "subprocess" starts one yt-dlp executable per URL, "inprocess" drives yt_dlp.YoutubeDL inside
+# this process so bulk runs skip interpreter startup and extractor loading for every link
+DOWNLOAD_ENGINE = os.environ.get("YOUOWN_ENGINE", "subprocess").lower()
+# Transient failures (429/5xx, resets, timeouts) are retried with jittered exponential backoff
+RETRY_LIMIT = int(os.environ.get("YOUOWN_RETRIES", 3))
+RETRY_BASE_DELAY = float(os.environ.get("YOUOWN_RETRY_DELAY", 5))
+RETRY_MAX_DELAY = float(os.environ.get("YOUOWN_RETRY_MAX_DELAY", 300))
+TRANSIENT_ERRORS = re.compile(
+    r"HTTP Error (?:408|425|429|5\d\d)|Too Many Requests|Connection (?:reset|aborted|refused)|"
+    r"Remote end closed|RemoteDisconnected|IncompleteRead|timed out|Timeout|TransportError|"
+    r"Temporary failure in name resolution|fragment \d+ not found|Giving up after \d+ (?:fragment )?retries|"
+    r"Unable to download (?:webpage|JSON|API)|EOF occurred in violation of protocol|"
+    r"No space left on device|Errno 28|Disk quota exceeded",
+    re.IGNORECASE
+)
+PERMANENT_ERRORS = re.compile(
+    r"Unsupported URL|is not a valid URL|Private video|Video unavailable|not available|"
+    r"has been removed|HTTP Error (?:400|401|403|404|410)|Sign in to|login required|members[- ]only|"
+    r"Join this channel|Requested format is not available|copyright|No video formats found|"
+    r"invalid yt-dlp options|too large for every output volume|no separate video and audio streams",
+    re.IGNORECASE
+)
+# Only the in-process engine sees response headers and logs Retry-After; the yt-dlp executable
+# doesn't print them, so with the subprocess engine the backoff alone spaces out retries
+RETRY_AFTER = re.compile(r"Retry-After:?\s*(\d+)", re.IGNORECASE)
+# A 403 on a media fragment is often a short-lived CDN refusal (YouTube), unlike a 403 on the
+# page itself; it gets a few retries instead of failing the link for good
+FRAGMENT_FORBIDDEN = re.compile(r"HTTP Error 403[^\n]*Retrying fragment", re.IGNORECASE)
+FRAGMENT_FORBIDDEN_RETRIES = 2
+# A bulk batch's cookies count as rejected by a site after this many auth failures in a row
+# there; its remaining links then fail at once instead of each hitting the site
+COOKIE_AUTH_ERRORS = re.compile(
+    r"Sign in to|login required|log in to|registered users|cookies are no longer valid|"
+    r"Use --cookies|HTTP Error 401|account cookies",
+    re.IGNORECASE
+)
+COOKIE_AUTH_LIMIT = int(os.environ.get("YOUOWN_COOKIE_AUTH_LIMIT", 2))
+# Watchdog: yt-dlp is killed (and retried) when a download makes no progress for STALL_TIMEOUT
+# seconds or a phase runs past its wall-clock limit. Override limits with
+# YOUOWN_PHASE_TIMEOUTS="extract=300,download=21600,merge=3600"
+STALL_TIMEOUT = float(os.environ.get("YOUOWN_STALL_TIMEOUT", 120))
+PHASE_TIMEOUTS = {
+    "extract": 600.0,
+    "download": 6 * 3600.0,
+    "merge": 3600.0,
+    "postprocess": 3600.0,
+}
+WATCHDOG_TICK = 1.0
+# Bounds every socket read so a dead connection errors out instead of hanging the worker
+SOCKET_TIMEOUT = os.environ.get("YOUOWN_SOCKET_TIMEOUT", "30")
+# yt-dlp prints progress as JSON after this marker so nothing has to be scraped from human output
+PROGRESS_PREFIX = "YOUOWN_PROGRESS "
+PROGRESS_ARGS = [
+    "--newline",
+    "--progress-template",
+    "download:" + PROGRESS_PREFIX + "%(progress.{status,downloaded_bytes,total_bytes,"
+    "total_bytes_estimate,speed,eta,elapsed,fragment_index,fragment_count,filename})j",
+    "--progress-template",
+    "postprocess:" + PROGRESS_PREFIX + "%(progress.{status,postprocessor})j",
+]
+# Per output directory index of everything already downloaded (extractor + video ID)
+ARCHIVE_FILENAME = ".youown_archive.sqlite3"
+ARCHIVE_SKIP_MARKER = "has already been recorded in the archive"
+# Metadata yt-dlp writes for every finished file (read back after the download)
+RESULT_TEMPLATE = ("after_move:%(.{id,extractor_key,title,uploader,duration,format_id,ext,vcodec,acodec,"
+                   "filepath,filesize,filesize_approx,webpage_url})j")
+# Searchable catalog of every finished download (YOUOWN_CATALOG, "" disables it). Rescans pick up
+# files added, moved or removed outside the app and only probe the new or changed ones
+CATALOG_PATH = os.environ.get("YOUOWN_CATALOG", os.path.join(APP_DATA_DIR, "catalog.sqlite3"))
+CATALOG_PROBE_WORKERS = 4
+MEDIA_EXTENSIONS = {"mp4", "mkv", "webm", "mov", "m4v", "avi", "flv", "ts", "3gp",
+                    "m4a", "mp3", "opus", "ogg", "aac", "flac", "wav"}
+# The "_<uid>" that the output template adds to every file name
+DOWNLOAD_UID_SUFFIX = re.compile(r"_[0-9a-f]{8}$")
+# Query parameters that only track where a link was shared from
+TRACKING_PARAMS = re.compile(r"^(utm_\w+|si|feature|fbclid|gclid|igshid|igsh|ref_src|ref_url|share_id)$", re.IGNORECASE)
+# URL list files are read lazily and queued in chunks of this many lines (or every 0.25 s), so
+# the first downloads start while the rest of a large list is still being read
+INGEST_CHUNK = 500
+INGEST_FLUSH_INTERVAL = 0.25
+# Links that list many items (playlists, channels, profiles); bulk expands them entry by entry
+COLLECTION_URL = re.compile(
+    r"[?&]list=|/playlist\b|/channel/|/c/[^/]+/?$|/user/[^/?#]+(?:/(?:videos|shorts|streams|playlists))?/?(?:[?#]|$)|"
+    r"youtube\.com/@|tiktok\.com/@[^/]+/?$|"
+    r"/@[^/]+/(?:videos|shorts|streams|playlists)/?$|/sets/|/album/",
+    re.IGNORECASE
+)
+HOST_ALIASES = {
+    "youtu.be": "youtube.com",
+    "redd.it": "reddit.com",
+    "x.com": "twitter.com",
+    "instagr.am": "instagram.com",
+}
+# Cloudflare quick tunnels (Tunnel tab): cloudflared must print its URL within the timeout; a
+# tunnel that dies is restarted with backoff, and given up after this many crashes in a row
+TUNNEL_START_TIMEOUT = float(os.environ.get("YOUOWN_TUNNEL_TIMEOUT", 30))
+TUNNEL_MAX_RESTARTS = 5
+TUNNEL_STABLE_SECONDS = 60
+TUNNEL_LOG_LINES = 50
+TUNNEL_URL = re.compile(r"https://[-\w]+\.trycloudflare\.com")
+
 COOKIE_WARNING = """⚠️ <span style="font-size:1.3em; font-weight:bold">EXTREME SECURITY RISK</span> ⚠️
 
 • <span style="color:yellow; font-weight:bold">NEVER</span> use personal/main account cookies
@@ -18,8 +272,8 @@ COOKIE_WARNING = """⚠️ <span style="font-size:1.3em; font-weight:bold">EXTRE
 • We <span style="color:lime; font-weight:bold">DO NOT STORE</span> any cookie data
 • Misuse of Cookies Can result in <span style="color:Black; font-weight:bold">PERMANENT ACCOUNT BANS</span>"""
 
-DUPLICATE_WARNING = """<span style="font-size:1em; font-weight:bold">DUPLICATE DOWNLOAD WARNING❗</span> 
-This tool&nbsp;&nbsp;<span style="color:Black; font-weight:bold">WILL DOWNLOAD DUPLICATES</span>&nbsp if you feed the same link multiple times"""
+DUPLICATE_WARNING = """<span style="font-size:1em; font-weight:bold">DUPLICATE DOWNLOAD NOTE❗</span> 
+Links already downloaded to the same Save Location are&nbsp;&nbsp;<span style="color:Black; font-weight:bold">SKIPPED</span>&nbsp; Untick "Skip Already Downloaded" to fetch them again"""
 
 README_CONTENT = """# Secure Media Downloader
 
@@ -30,13 +284,16 @@ This tool allows you to download media in highest possible Quality content while
 - Single video downloads
 - Bulk downloads (multiple URLs)
 - Restricted content access (with cookies)
+- Searchable library of everything downloaded
 - Cloudflare tunnel for remote access
 
 ## Note
 - Tested For Yt/Insta/TikTok/Reddit/Twitter
 - Will Not Work For Broken/Unsupported Links
 - Bulk Download Skips Broken/Unsupported Links
-- Each link on a new line. No gaps (Bulk Downloader)
+- Each link on a new line (Bulk Downloader); duplicate links in a batch are downloaded once
+- Already downloaded links are skipped per Save Location (and per Audio/Video mode)
+- Bulk Download limits how many links hit the same site at once (and per minute)
 
 ## How to Use
 
@@ -47,9 +304,15 @@ This tool allows you to download media in highest possible Quality content while
 4. Click Download
 
 ### Bulk Download
-1. Enter one URL per line
+1. Enter one URL per line, or upload a text file with one URL per line (large lists)
 2. Configure options
-3. Click Start Bulk Download
+3. Set Parallel Downloads (how many links are fetched at once)
+4. Click Start Bulk Download
+5. Interrupted batches resume when the app restarts, or with Resume Unfinished Batches
+
+### Library
+1. Search by title, uploader or site (word beginnings are enough), or paste a video URL to see if you have it
+2. Rescan Folders picks up files added, renamed or deleted outside the app
 
 ### Security Warning
 When using the Restricted tab:
@@ -57,7 +320,7 @@ When using the Restricted tab:
 - Use temporary accounts only
 - All cookie data is deleted after use
 - We do not store any sensitive information
-- Avoid Youtube PlayLists
+- Playlists/channels are listed entry by entry and run like a bulk download
 
 ### Advanced Options
 Use advanced options to customize your downloads:
@@ -74,14 +337,1926 @@ Following is a Great Cookie-Editor by Moustachauve:
 - [GitHub](https://github.com/Moustachauve/cookie-editor)
 """
 
-def clean_temp_files(uid: str) -> None:
-    """Clean up any temporary files created during the download process."""
-    cookie_path = os.path.join(TEMP_DIR, f"cookies_{uid}.txt")
-    if os.path.exists(cookie_path):
+def parse_host_limits(spec: str) -> Dict[str, Tuple[int, int]]:
+    """Parse 'host=concurrency/per_minute,...' into a host limit table."""
+    limits = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        host, _, value = item.partition("=")
+        concurrency, _, per_minute = value.partition("/")
+        try:
+            limits[host.strip().lower()] = (
+                max(1, int(concurrency)),
+                max(1, int(per_minute or DEFAULT_HOST_LIMIT[1]))
+            )
+        except ValueError:
+            continue
+    return limits
+
+HOST_LIMITS.update(parse_host_limits(os.environ.get("YOUOWN_HOST_LIMITS", "")))
+
+def host_key(url: str) -> str:
+    """Group a URL by the site it hits, folding short links and subdomains together."""
+    host = (urlparse(url if "://" in url else f"https://{url}").hostname or "").lower()
+    host = HOST_ALIASES.get(host, host)
+    labels = host.split(".")
+    if ":" in host or labels[-1].isdigit():
+        return host  # IP address
+    keep = 3 if len(labels[-1]) == 2 and len(labels) > 2 and labels[-2] in SECOND_LEVEL_SUFFIXES else 2
+    if len(labels) > keep:
+        host = ".".join(labels[-keep:])
+    return HOST_ALIASES.get(host, host)
+
+class TokenBucket:
+    """Requests-per-minute limiter that refills continuously and allows short bursts."""
+
+    def __init__(self, per_minute: int, burst: int) -> None:
+        self.rate = per_minute / 60.0
+        self.capacity = float(max(1, burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def delay(self) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+class HostScheduler:
+    """Hands out bulk jobs while honouring per-host concurrency caps and rate limits."""
+
+    def __init__(self, jobs: Iterable[Tuple[int, str]], limits: Dict[str, Tuple[int, int]] = None) -> None:
+        self.limits = HOST_LIMITS if limits is None else limits
+        self.pending: "OrderedDict[str, deque]" = OrderedDict()
+        self.running: Counter = Counter()
+        self.buckets: Dict[str, TokenBucket] = {}
+        # Jobs waiting out a retry backoff: (ready_at, i, url)
+        self.delayed: List[Tuple[float, int, str]] = []
+        # Playlists still being listed; workers wait for their entries instead of exiting
+        self.feeding = 0
+        # When each job became ready to run, for the queue-wait metric
+        self.enqueued: Dict[int, float] = {}
+        # Host slot held by each running job
+        self.holding: Dict[int, str] = {}
+        self.closed = False
+        self.cond = threading.Condition()
+        for i, url in jobs:
+            self.add(i, url)
+
+    def add(self, i: int, url: str) -> None:
+        with self.cond:
+            self.pending.setdefault(host_key(url), deque()).append((i, url))
+            self.enqueued[i] = time.monotonic()
+            self.cond.notify_all()
+
+    def start_feeding(self) -> None:
+        with self.cond:
+            self.feeding += 1
+
+    def stop_feeding(self) -> None:
+        with self.cond:
+            self.feeding -= 1
+            self.cond.notify_all()
+
+    def limit_for(self, host: str) -> Tuple[int, int]:
+        return self.limits.get(host, DEFAULT_HOST_LIMIT)
+
+    def next_job(self) -> Optional[Tuple[int, str, str]]:
+        """Block until some host may start another download. Returns None when done."""
+        with self.cond:
+            while not self.closed and (self.pending or self.delayed or self.feeding):
+                now = time.monotonic()
+                while self.delayed and self.delayed[0][0] <= now:
+                    _, i, url = heapq.heappop(self.delayed)
+                    self.add(i, url)
+                wait = self.delayed[0][0] - now if self.delayed else None
+                for host, items in self.pending.items():
+                    concurrency, per_minute = self.limit_for(host)
+                    if self.running[host] >= concurrency:
+                        continue
+                    bucket = self.buckets.setdefault(host, TokenBucket(per_minute, concurrency))
+                    delay = bucket.delay()
+                    if delay > 0:
+                        wait = delay if wait is None else min(wait, delay)
+                        continue
+
+                    bucket.take()
+                    self.running[host] += 1
+                    i, url = items.popleft()
+                    self.holding[i] = host
+                    if items:
+                        # Round-robin across hosts so one long list doesn't starve the others
+                        self.pending.move_to_end(host)
+                    else:
+                        del self.pending[host]
+                    return i, url, host
+
+                # Every host is at its cap, out of tokens, or only retries are left
+                self.cond.wait(timeout=wait)
+            return None
+
+    def queue_wait(self, i: int) -> float:
+        """Seconds job i waited since it became ready to run."""
+        with self.cond:
+            return time.monotonic() - self.enqueued.pop(i, time.monotonic())
+
+    def release(self, i: int) -> None:
+        """Free the host slot held by job i (again is a no-op)."""
+        with self.cond:
+            host = self.holding.pop(i, None)
+            if host is None:
+                return
+            self.running[host] -= 1
+            self.cond.notify_all()
+
+    def retry(self, i: int, url: str, delay: float) -> None:
+        """Queue a job again once its backoff delay has passed, without holding a slot meanwhile."""
+        with self.cond:
+            heapq.heappush(self.delayed, (time.monotonic() + delay, i, url))
+            self.cond.notify_all()
+
+    def close(self) -> None:
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+def format_bytes(num: Optional[float]) -> str:
+    """Human readable byte count (1.50MiB)."""
+    if num is None:
+        return "Unknown B"
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(num) < 1024:
+            return f"{num:.2f}{unit}"
+        num /= 1024
+    return f"{num:.2f}TiB"
+
+def format_eta(seconds: Optional[float]) -> str:
+    """Format seconds as MM:SS (or HH:MM:SS)."""
+    if seconds is None:
+        return "Unknown"
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}" if hours else f"{minutes:02d}:{secs:02d}"
+
+def parse_rate(value: str) -> float:
+    """Parse a yt-dlp style rate ("500K", "5M", "1.5G") into bytes per second; 0 when unset."""
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMG]?)i?B?\s*", value or "", re.IGNORECASE)
+    if not match:
+        return 0.0
+    return float(match.group(1)) * 1024 ** " KMG".index(match.group(2).upper() or " ")
+
+class BandwidthScheduler:
+    """Splits a process-wide download budget across running downloads, weighted by priority class.
+
+    Downloads that use less than their slice hand the rest to the others. In-process downloads
+    are re-rated live as jobs start and finish; subprocess ones keep the rate they started with.
+    """
+
+    def __init__(self, limit: float, weights: Optional[Dict[str, float]] = None) -> None:
+        self.limit = limit
+        self.weights = PRIORITY_WEIGHTS if weights is None else weights
+        # token -> weight, demand (None while it wants more), current share, live rate setter
+        self.jobs: Dict[int, dict] = {}
+        self.lock = threading.Lock()
+        self._next_token = 0
+        self._last_rebalance = 0.0
+
+    def register(self, priority: str, live: bool) -> int:
+        """Add a starting download and return its token; share() tells it its initial rate."""
+        with self.lock:
+            self._next_token += 1
+            token = self._next_token
+            self.jobs[token] = {"weight": self.weights.get(priority, 1.0), "demand": None,
+                                "share": 0.0, "apply": None}
+            self._rebalance()
+            if not live:
+                # Can't be changed once yt-dlp runs, so budget it as what it starts with
+                self.jobs[token]["demand"] = self.jobs[token]["share"]
+            return token
+
+    def share(self, token: int) -> float:
+        with self.lock:
+            return self.jobs[token]["share"]
+
+    def set_apply(self, token: int, apply: Callable[[float], None]) -> None:
+        with self.lock:
+            self.jobs[token]["apply"] = apply
+
+    def report(self, token: int, speed: float) -> None:
+        """Record a live download's measured speed; well below its share means it can't use it all."""
+        with self.lock:
+            job = self.jobs.get(token)
+            if job is None or job["apply"] is None:
+                return
+            job["demand"] = speed * 1.25 if speed < job["share"] * 0.8 else None
+            if time.monotonic() - self._last_rebalance >= 2:
+                self._rebalance()
+
+    def unregister(self, token: int) -> None:
+        with self.lock:
+            if self.jobs.pop(token, None) is not None:
+                self._rebalance()
+
+    def _rebalance(self) -> None:
+        """Water-fill the budget: capped jobs get their demand, the rest split what's left by weight."""
+        self._last_rebalance = time.monotonic()
+        remaining = self.limit
+        active = set(self.jobs)
+        shares: Dict[int, float] = {}
+        while active:
+            total_weight = sum(self.jobs[t]["weight"] for t in active)
+            capped = [t for t in active if self.jobs[t]["demand"] is not None
+                      and self.jobs[t]["demand"] < remaining * self.jobs[t]["weight"] / total_weight]
+            if not capped:
+                for t in active:
+                    shares[t] = remaining * self.jobs[t]["weight"] / total_weight
+                break
+            for t in capped:
+                shares[t] = self.jobs[t]["demand"]
+                remaining -= shares[t]
+                active.discard(t)
+
+        for t, share in shares.items():
+            job = self.jobs[t]
+            share = max(MIN_JOB_RATE, share)
+            # Small changes aren't worth disturbing a running download for
+            if job["apply"] is not None and abs(share - job["share"]) > job["share"] * 0.05:
+                job["apply"](share)
+            job["share"] = share
+
+BANDWIDTH = BandwidthScheduler(parse_rate(BANDWIDTH_LIMIT))
+
+class FragmentTuner:
+    """Picks --concurrent-fragments per download from how earlier ones on the same site went.
+
+    More fragments while throughput keeps improving, back off when it doesn't, halve on
+    fragment errors, and split FRAGMENT_STREAM_BUDGET fairly across running downloads.
+    yt-dlp fixes the count when a download starts, so tuning happens from job to job.
+    """
+
+    def __init__(self, budget: int = FRAGMENT_STREAM_BUDGET, start: int = FRAGMENT_START,
+                 maximum: int = FRAGMENT_MAX) -> None:
+        self.budget = budget
+        self.start = start
+        self.maximum = maximum
+        # host -> {"n": next count to use, "last_n": count measured last, "speed": its speed}
+        self.hosts: Dict[str, dict] = {}
+        self.running = 0
+        self.lock = threading.Lock()
+
+    def acquire(self, host: str) -> int:
+        """Fragment count for a download that is about to start."""
+        with self.lock:
+            self.running += 1
+            n = self.hosts.get(host, {}).get("n", self.start)
+            return max(1, min(n, self.budget // self.running))
+
+    def release(self, host: str, used: int, speed: Optional[float], fragments: int, errors: int) -> None:
+        """Learn from a finished download (only fragmented ones say anything about fragments)."""
+        with self.lock:
+            self.running -= 1
+            if not fragments:
+                return
+            state = self.hosts.setdefault(host, {"n": self.start, "last_n": 0, "speed": 0.0})
+            if errors > max(1, fragments // 50):
+                # Server pushes back on parallel fragment requests
+                state.update(n=max(1, used // 2), last_n=0, speed=0.0)
+                return
+            if not speed:
+                return
+            if speed > state["speed"] * 1.1:
+                state["n"] = min(self.maximum, used + 2)
+            elif speed < state["speed"] * 0.9 and used > state["last_n"] > 0:
+                # The extra fragments didn't pay off
+                state["n"] = state["last_n"]
+            else:
+                state["n"] = used
+            state.update(last_n=used, speed=speed)
+
+FRAGMENTS = FragmentTuner()
+
+class DiskSpace:
+    """Free space bookkeeping for the output volumes, shared by every running download.
+
+    A download reserves its expected size before it starts; the part of a reservation that isn't
+    written yet counts as used, so parallel jobs can't all claim the same free space. Placement
+    picks the volume with the most room left and keeps a retried job on the volume holding its
+    partial files.
+    """
+
+    def __init__(self, min_free: int = DISK_MIN_FREE) -> None:
+        self.min_free = min_free
+        self.cond = threading.Condition()
+        self.reserved: Dict[str, List[int]] = {}  # uid -> [device, bytes reserved, bytes written]
+        self.placements: "OrderedDict[str, str]" = OrderedDict()
+
+    def _headroom(self, volume: str) -> Optional[Tuple[int, int]]:
+        """(device, bytes a new download may use) for a volume, None if it can't be read."""
+        try:
+            device = os.stat(volume).st_dev
+            free = shutil.disk_usage(volume).free
+        except OSError:
+            return None
+        pending = sum(max(0, size - written) for dev, size, written in self.reserved.values() if dev == device)
+        return device, free - pending - self.min_free
+
+    def place(self, uid: str, volumes: List[str], size: int) -> Tuple[Optional[str], int]:
+        """Reserve size bytes on a volume: (the volume or None if none has room, most room found)."""
+        with self.cond:
+            rooms = {volume: room for volume, room in ((v, self._headroom(v)) for v in volumes) if room is not None}
+            chosen = self.placements.get(uid)
+            if chosen not in rooms or rooms[chosen][1] < size:
+                chosen = max(rooms, key=lambda v: rooms[v][1], default=None)
+            best = max((room for _, room in rooms.values()), default=0)
+            if chosen is None or rooms[chosen][1] < size:
+                return None, best
+            self.reserved[uid] = [rooms[chosen][0], size, 0]
+            self.placements[uid] = chosen
+            self.placements.move_to_end(uid)
+            if len(self.placements) > 4096:
+                self.placements.popitem(last=False)
+            return chosen, best
+
+    def prefer(self, uid: str, volume: str) -> None:
+        """Place uid on volume again if it has room (its partial files are there)."""
+        with self.cond:
+            self.placements[uid] = volume
+            self.placements.move_to_end(uid)
+
+    def capacity(self, volumes: List[str]) -> int:
+        """Largest download any of the volumes could ever hold."""
+        sizes = []
+        for volume in volumes:
+            try:
+                sizes.append(shutil.disk_usage(volume).total - self.min_free)
+            except OSError:
+                continue
+        return max(sizes, default=0)
+
+    def written(self, uid: str, written: int) -> None:
+        with self.cond:
+            if uid in self.reserved:
+                self.reserved[uid][2] = written
+
+    def grow(self, uid: str, size: int) -> None:
+        """Raise a reservation made without a known size once yt-dlp reports one."""
+        with self.cond:
+            if uid in self.reserved:
+                self.reserved[uid][1] = max(self.reserved[uid][1], size)
+
+    def release(self, uid: str) -> None:
+        with self.cond:
+            if self.reserved.pop(uid, None) is not None:
+                self.cond.notify_all()
+
+    def wait(self, timeout: float) -> None:
+        """Block until a reservation is released (or timeout, space may also be freed outside the app)."""
+        with self.cond:
+            self.cond.wait(timeout)
+
+DISK = DiskSpace()
+
+def output_volumes(out_dir: str) -> List[str]:
+    """The save location followed by the YOUOWN_OUTPUT_VOLUMES that exist or can be created."""
+    volumes = {os.path.abspath(out_dir): out_dir}
+    for path in OUTPUT_VOLUMES:
+        try:
+            os.makedirs(path, exist_ok=True)
+        except OSError:
+            continue
+        volumes.setdefault(os.path.abspath(path), path)
+    return list(volumes.values())
+
+def shard_dir(volume: str) -> str:
+    """Directory (yt-dlp output template) for a new file on a volume, per OUTPUT_SHARDING."""
+    parts = [volume]
+    for key in OUTPUT_SHARDING.split("/"):
+        if key == "extractor":
+            parts.append("%(extractor_key|Other)s")
+        elif key == "date":
+            parts.append(time.strftime("%Y-%m"))
+    return os.path.join(*parts)
+
+def expected_space(info: Optional[dict]) -> int:
+    """Bytes to reserve for a download from its yt-dlp metadata (0 when the size is unknown)."""
+    if not info:
+        return 0
+    formats = info.get("requested_formats") or [info]
+    total = 0.0
+    for fmt in formats:
+        size = fmt.get("filesize") or fmt.get("filesize_approx")
+        if not size and fmt.get("tbr") and info.get("duration"):
+            size = fmt["tbr"] * 1000 / 8 * info["duration"]
+        if not size:
+            return 0
+        total += size
+    # Separate streams stay on disk next to the merged file until the merge is done
+    return int(total * DISK_SIZE_MARGIN * (2 if len(formats) > 1 else 1))
+
+def reserve_space(
+    uid: str,
+    volumes: List[str],
+    size: int,
+    cancel: Optional[threading.Event],
+    log: "LogBuffer"
+) -> Generator[Tuple[str, float, bool], None, Optional[str]]:
+    """Wait until an output volume has room for size bytes and reserve it there.
+
+    Returns the volume, or None when cancelled or no volume could ever hold the download.
+    """
+    waiting = False
+    while True:
+        volume, room = DISK.place(uid, volumes, size)
+        if volume is not None:
+            if waiting:
+                log.append(f"💾 Disk space available on {volume}\n")
+            return volume
+        capacity = DISK.capacity(volumes)
+        if size > capacity:
+            log.append(f"ERROR: {format_bytes(size)} needed, too large for every output volume "
+                       f"(largest holds {format_bytes(max(capacity, 0))})\n")
+            return None
+        if cancel is not None and cancel.is_set():
+            log.append("ERROR: Download cancelled\n")
+            return None
+        if not waiting:
+            waiting = True
+            log.append(f"💾 Queued until there is disk space: {format_bytes(size)} needed, "
+                       f"{format_bytes(max(room, 0))} free on the output volumes\n")
+            yield log.text(), 0.0, True
+        DISK.wait(DISK_POLL_INTERVAL)
+
+@dataclass
+class ProgressEvent:
+    """One structured progress update from yt-dlp's progress or postprocessor hooks."""
+    phase: str  # "download", "merge" or "postprocess"
+    status: str
+    downloaded_bytes: Optional[int] = None
+    total_bytes: Optional[int] = None
+    speed: Optional[float] = None
+    eta: Optional[float] = None
+    elapsed: Optional[float] = None
+    fragment_index: Optional[int] = None
+    fragment_count: Optional[int] = None
+    filename: Optional[str] = None
+    postprocessor: Optional[str] = None
+
+    @classmethod
+    def from_hook(cls, d: dict) -> "ProgressEvent":
+        """Build an event from a yt-dlp hook dict (in-process) or its JSON dump (subprocess)."""
+        postprocessor = d.get("postprocessor")
+        if postprocessor:
+            phase = "merge" if postprocessor == "Merger" else "postprocess"
+        else:
+            phase = "download"
+        return cls(
+            phase=phase,
+            status=d.get("status") or "",
+            downloaded_bytes=d.get("downloaded_bytes"),
+            total_bytes=d.get("total_bytes") or d.get("total_bytes_estimate"),
+            speed=d.get("speed"),
+            eta=d.get("eta"),
+            elapsed=d.get("elapsed"),
+            fragment_index=d.get("fragment_index"),
+            fragment_count=d.get("fragment_count"),
+            filename=d.get("filename"),
+            postprocessor=postprocessor
+        )
+
+    @property
+    def fraction(self) -> Optional[float]:
+        """Completed fraction of the current download, if known."""
+        if self.phase != "download":
+            return None
+        if self.status == "finished":
+            return 1.0
+        if self.downloaded_bytes is not None and self.total_bytes:
+            return min(1.0, self.downloaded_bytes / self.total_bytes)
+        return None
+
+    def describe(self) -> str:
+        """Render the event as a familiar yt-dlp style log line."""
+        if self.phase != "download":
+            return f"[{self.postprocessor}] {self.status}"
+        fraction = self.fraction
+        percent = f"{fraction * 100:5.1f}%" if fraction is not None else "  ???%"
+        line = f"[download] {percent} of {format_bytes(self.total_bytes)}"
+        if self.status == "finished":
+            return line + (f" in {format_eta(self.elapsed)}" if self.elapsed is not None else "")
+        line += f" at {format_bytes(self.speed)}/s ETA {format_eta(self.eta)}"
+        if self.fragment_index is not None and self.fragment_count:
+            line += f" (frag {self.fragment_index}/{self.fragment_count})"
+        return line
+
+def parse_phase_timeouts(spec: str) -> Dict[str, float]:
+    """Parse 'phase=seconds,...' into a phase timeout table."""
+    timeouts = {}
+    for item in (spec or "").split(","):
+        phase, _, value = item.partition("=")
+        try:
+            timeouts[phase.strip().lower()] = float(value)
+        except ValueError:
+            continue
+    return timeouts
+
+PHASE_TIMEOUTS.update(parse_phase_timeouts(os.environ.get("YOUOWN_PHASE_TIMEOUTS", "")))
+
+class Watchdog:
+    """Tracks the phase of one yt-dlp run and reports when it has stalled or overrun its limits."""
+
+    def __init__(self, stall_timeout: float = STALL_TIMEOUT,
+                 phase_timeouts: Optional[Dict[str, float]] = None) -> None:
+        self.stall_timeout = stall_timeout
+        self.phase_timeouts = PHASE_TIMEOUTS if phase_timeouts is None else phase_timeouts
+        self.phase = "extract"
+        self.phase_started = self.last_progress = time.monotonic()
+        self.durations: Counter = Counter()
+
+    def observe(self, event: Optional[ProgressEvent]) -> None:
+        """Record a progress event; a change of phase restarts that phase's clock."""
+        if event is None:
+            return
+        now = time.monotonic()
+        if event.phase != self.phase:
+            self.durations[self.phase] += now - self.phase_started
+            self.phase, self.phase_started = event.phase, now
+        self.last_progress = now
+
+    def phase_durations(self) -> Dict[str, float]:
+        """Seconds spent in each phase so far (extract, download, merge, postprocess)."""
+        durations = Counter(self.durations)
+        durations[self.phase] += time.monotonic() - self.phase_started
+        return dict(durations)
+
+    def check(self) -> Optional[str]:
+        """Why the run should be killed, or None while it is healthy."""
+        now = time.monotonic()
+        if self.phase == "download" and self.stall_timeout and now - self.last_progress > self.stall_timeout:
+            return f"no download progress for {now - self.last_progress:.0f}s"
+        limit = self.phase_timeouts.get(self.phase)
+        if limit and now - self.phase_started > limit:
+            return f"{self.phase} phase ran longer than {limit:.0f}s"
+        return None
+
+def kill_process_tree(proc: subprocess.Popen) -> None:
+    """Kill a child started in its own process group along with everything it spawned (ffmpeg)."""
+    if proc.poll() is not None:
+        return
+    try:
+        if os.name == "nt":
+            subprocess.run(["taskkill", "/T", "/F", "/PID", str(proc.pid)],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30)
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except (OSError, subprocess.SubprocessError):
+        proc.kill()
+
+class Metrics:
+    """Process-wide counters, gauges and histograms, rendered in the Prometheus text format."""
+
+    def __init__(self, buckets: Tuple[float, ...] = METRIC_BUCKETS) -> None:
+        self.buckets = buckets
+        self.values: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        # (name, labels) -> [count per bucket..., +Inf count, sum]
+        self.histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], List[float]] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1.0, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            counts = self.histograms.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for n, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[n] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def render(self) -> str:
+        def fmt(labels: Iterable[Tuple[str, str]]) -> str:
+            text = ",".join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                            for k, v in labels)
+            return "{" + text + "}" if text else ""
+
+        lines = []
+        with self.lock:
+            values, histograms = dict(self.values), {k: list(v) for k, v in self.histograms.items()}
+        for name, (kind, help_text) in METRIC_HELP.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for (metric, labels), value in sorted(values.items()):
+                if metric == name:
+                    lines.append(f"{name}{fmt(labels)} {value:g}")
+            for (metric, labels), counts in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(f"{name}_bucket{fmt(labels + (('le', f'{bound:g}'),))} {count:g}")
+                lines.append(f"{name}_bucket{fmt(labels + (('le', '+Inf'),))} {counts[-2]:g}")
+                lines.append(f"{name}_count{fmt(labels)} {counts[-2]:g}")
+                lines.append(f"{name}_sum{fmt(labels)} {counts[-1]:g}")
+        return "\n".join(lines) + "\n"
+
+METRICS = Metrics()
+
+class EventLog:
+    """Append-only JSON-lines log of job events, rotated to <path>.1 when it grows too large."""
+
+    def __init__(self, path: str, max_bytes: int = EVENT_LOG_MAX_BYTES) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+    def write(self, event: dict) -> None:
+        if not self.path:
+            return
+        line = json.dumps(event, ensure_ascii=False) + "\n"
+        with self.lock:
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError:
+                pass  # metrics must never break a download
+
+EVENT_LOG = EventLog(EVENT_LOG_PATH)
+
+@dataclass
+class JobTrace:
+    """Timings and outcome of one download attempt, reported to METRICS and the event log."""
+    url: str
+    attempt: int = 1
+    queue_wait: float = 0.0
+    priority: str = "interactive"
+    phases: Counter = field(default_factory=Counter)
+    started: float = field(default_factory=time.time)
+    finished: bool = False
+
+    def add_phases(self, durations: Dict[str, float]) -> None:
+        self.phases.update(durations)
+
+    def finish(self, outcome: str, results: Optional[List[dict]] = None, output: str = "") -> None:
+        """Record the attempt once: outcome is done, skipped, failed or cancelled."""
+        if self.finished:
+            return
+        self.finished = True
+        site = host_key(self.url)
+        results = results or []
+        size = sum(info.get("filesize") or info.get("filesize_approx") or 0 for info in results)
+        failure = classify_failure(output) if outcome == "failed" else None
+
+        METRICS.inc("youown_jobs_total", site=site, outcome=outcome)
+        if self.attempt > 1:
+            METRICS.inc("youown_retries_total", site=site)
+        if failure:
+            METRICS.inc("youown_failures_total", site=site, kind=failure.kind)
+        if size:
+            METRICS.inc("youown_downloaded_bytes_total", size, site=site)
+        for phase, seconds in self.phases.items():
+            METRICS.observe("youown_phase_seconds", seconds, site=site, phase=phase)
+        if self.priority == "bulk":
+            METRICS.observe("youown_queue_wait_seconds", self.queue_wait, site=site)
+
+        EVENT_LOG.write({
+            "time": time.time(), "url": self.url, "site": site,
+            "extractor": results[0].get("extractor_key") if results else None,
+            "priority": self.priority, "attempt": self.attempt, "outcome": outcome,
+            "duration": round(time.time() - self.started, 3), "queue_wait": round(self.queue_wait, 3),
+            "phases": {phase: round(seconds, 3) for phase, seconds in self.phases.items()},
+            "bytes": size, "files": [info.get("filepath") for info in results],
+            "failure_kind": failure.kind if failure else None, "failure": failure.reason if failure else None,
+        })
+
+_yt_dlp = None
+_yt_dlp_lock = threading.Lock()
+
+def load_yt_dlp():
+    """Import yt_dlp once for the in-process engine. Returns None if it isn't installed."""
+    global _yt_dlp
+    with _yt_dlp_lock:
+        if _yt_dlp is None:
+            try:
+                import yt_dlp
+            except ImportError:
+                return None
+            _yt_dlp = yt_dlp
+    return _yt_dlp
+
+class _YDLLogger:
+    """Routes YoutubeDL messages into an in-process download's line stream."""
+
+    def __init__(self, emit) -> None:
+        self.emit = emit
+
+    def debug(self, msg: str) -> None:
+        self.emit(f"{msg}\n", None)
+
+    info = debug
+
+    def warning(self, msg: str) -> None:
+        self.emit(f"WARNING: {msg}\n", None)
+
+    def error(self, msg: str) -> None:
+        self.emit(f"{msg}\n", None)
+
+class DownloadRunner:
+    """Feeds (line, progress event) pairs from a running download through a queue."""
+
+    def __init__(self) -> None:
+        self._events: "queue.Queue[Optional[Tuple[str, Optional[ProgressEvent]]]]" = queue.Queue()
+
+    def _emit(self, line: str, event: Optional[ProgressEvent]) -> None:
+        self._events.put((line, event))
+
+    def lines(self, tick: Optional[float] = None) -> Generator[Optional[Tuple[str, Optional[ProgressEvent]]], None, None]:
+        """Yield (line, progress event) pairs until the download finishes, and None every
+        tick seconds without output so the caller can run its watchdog."""
+        while True:
+            try:
+                item = self._events.get(timeout=tick)
+            except queue.Empty:
+                yield None
+                continue
+            if item is None:
+                return
+            yield item
+
+class SubprocessDownload(DownloadRunner):
+    """Runs the yt-dlp executable in its own process group; a reader thread decodes its output."""
+
+    def __init__(self, cmd: List[str]) -> None:
+        super().__init__()
+        # A separate process group lets kill() take down ffmpeg children as well
+        group = ({"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP} if os.name == "nt"
+                 else {"start_new_session": True})
+        self.proc = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
+            **group
+        )
+        self._thread = threading.Thread(target=self._read, daemon=True)
+        self._thread.start()
+
+    def _read(self) -> None:
+        try:
+            for line, event in _subprocess_lines(self.proc):
+                self._emit(line, event)
+        except (OSError, ValueError):
+            pass  # pipe closed by kill()
+        finally:
+            self._events.put(None)
+
+    def kill(self) -> None:
+        kill_process_tree(self.proc)
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[int]:
         try:
-            os.remove(cookie_path)
+            return self.proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            return None
+
+class InProcessDownload(DownloadRunner):
+    """Runs yt_dlp.YoutubeDL on a background thread; kill() aborts it at the next hook call."""
+
+    def __init__(self, args: List[str], archive: Optional["DownloadArchive"] = None) -> None:
+        super().__init__()
+        yt_dlp = load_yt_dlp()
+        if yt_dlp is None:
+            raise RuntimeError("yt_dlp module is not installed")
+        try:
+            parsed = yt_dlp.parse_options(args)
+        except SystemExit:
+            # optparse reports bad options by exiting
+            raise ValueError(f"invalid yt-dlp options: {' '.join(args)}")
+
+        opts = dict(parsed.ydl_opts)
+        opts.update({
+            "logger": _YDLLogger(self._log),
+            "progress_hooks": [self._progress_hook] + list(opts.get("progress_hooks") or []),
+            "postprocessor_hooks": [self._progress_hook] + list(opts.get("postprocessor_hooks") or []),
+            "noprogress": True,
+            "color": {"stdout": "no_color", "stderr": "no_color"},
+        })
+        if archive is not None:
+            # yt-dlp checks the archive itself, before extraction when the ID is in the URL
+            opts["download_archive"] = archive
+        self.urls = parsed.urls
+        self.info_file = parsed.options.load_info_filename
+        self.returncode: Optional[int] = None
+        self._cancelled = threading.Event()
+        self._cancel_error = yt_dlp.utils.DownloadCancelled
+        # YoutubeDL keeps this dict as its params, so later changes reach the running download
+        self.opts = opts
+        self._thread = threading.Thread(target=self._run, args=(yt_dlp, opts), daemon=True)
+        self._thread.start()
+
+    def _check_cancelled(self) -> None:
+        if self._cancelled.is_set():
+            # Threads can't be killed; raising from a hook or the logger makes yt-dlp abort
+            raise self._cancel_error("Download cancelled")
+
+    def _log(self, line: str, event: Optional[ProgressEvent]) -> None:
+        self._check_cancelled()
+        self._emit(line, event)
+
+    def _progress_hook(self, d: dict) -> None:
+        self._check_cancelled()
+        event = ProgressEvent.from_hook(d)
+        self._emit(event.describe() + "\n", event)
+
+    def _run(self, yt_dlp, opts: dict) -> None:
+        code = 1
+        try:
+            with yt_dlp.YoutubeDL(opts) as ydl:
+                if self.info_file:
+                    code = ydl.download_with_info_file(self.info_file)
+                else:
+                    code = ydl.download(self.urls)
+        except yt_dlp.utils.DownloadError as e:
+            # Already reported through the logger; surface Retry-After for the retry policy
+            exc = (e.exc_info or (None, None))[1]
+            response = getattr(exc, "response", None) or getattr(getattr(exc, "cause", None), "response", None)
+            retry_after = response.get_header("Retry-After") if response is not None else None
+            if retry_after:
+                self._emit(f"Retry-After: {retry_after}\n", None)
         except Exception as e:
+            self._emit(f"ERROR: {e}\n", None)
+        finally:
+            self.returncode = code
+            self._events.put(None)
+
+    def kill(self) -> None:
+        self._cancelled.set()
+
+    def set_ratelimit(self, rate: float) -> None:
+        """Change the download speed limit (bytes/s) of the running download."""
+        self.opts["ratelimit"] = int(rate)
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[int]:
+        self._thread.join(timeout)
+        return self.returncode
+
+def _subprocess_lines(proc: subprocess.Popen) -> Generator[Tuple[str, Optional[ProgressEvent]], None, None]:
+    """Yield (line, progress event) pairs from yt-dlp's stdout, decoding the JSON progress lines."""
+    if proc.stdout:
+        for line in proc.stdout:
+            if not line.startswith(PROGRESS_PREFIX):
+                yield line, None
+                continue
+            try:
+                event = ProgressEvent.from_hook(json.loads(line[len(PROGRESS_PREFIX):]))
+            except (ValueError, AttributeError):
+                yield line, None
+                continue
+            yield event.describe() + "\n", event
+
+class LogBuffer:
+    """Ring buffer of log lines. Consecutive progress lines overwrite each other like a terminal."""
+
+    def __init__(self, max_lines: int = LOG_MAX_LINES) -> None:
+        self.lines: deque = deque(maxlen=max(1, max_lines))
+        self.dropped = 0
+        self._progress_tail = False
+        self._text: Optional[str] = None
+
+    def append(self, line: str, is_progress: bool = False) -> None:
+        line = line.rstrip("\n")
+        if is_progress and self._progress_tail:
+            self.lines[-1] = line
+        else:
+            if len(self.lines) == self.lines.maxlen:
+                self.dropped += 1
+            self.lines.append(line)
+        self._progress_tail = is_progress
+        self._text = None
+
+    def text(self) -> str:
+        if self._text is None:
+            hidden = f"… {self.dropped} earlier lines hidden\n" if self.dropped else ""
+            self._text = hidden + "".join(f"{line}\n" for line in self.lines)
+        return self._text
+
+class UpdateThrottle:
+    """Lets an update through at most once per interval, or when the whole percentage changes."""
+
+    def __init__(self, interval: float = LOG_UPDATE_INTERVAL) -> None:
+        self.interval = interval
+        self.last_time = 0.0
+        self.last_percent = -1
+
+    def ready(self, progress: Optional[float] = None) -> bool:
+        now = time.monotonic()
+        percent = int(progress * 100) if progress is not None else self.last_percent
+        if percent != self.last_percent or now - self.last_time >= self.interval:
+            self.last_time = now
+            self.last_percent = percent
+            return True
+        return False
+
+class DownloadArchive:
+    """SQLite index of finished downloads keyed by extractor + video ID, stored in the output directory.
+
+    Also works as yt-dlp's download_archive container (``in`` / ``add``) for the in-process engine.
+    Entries are per mode so an audio-only download doesn't block the full video.
+    """
+
+    def __init__(self, out_dir: str, mode: str) -> None:
+        self.path = os.path.join(out_dir, ARCHIVE_FILENAME)
+        self.mode = mode
+        with closing(self._connect()) as db, db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS archive ("
+                "archive_id TEXT NOT NULL, mode TEXT NOT NULL, added REAL NOT NULL, "
+                "PRIMARY KEY (archive_id, mode)) WITHOUT ROWID"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def __contains__(self, archive_id: str) -> bool:
+        with closing(self._connect()) as db:
+            row = db.execute(
+                "SELECT 1 FROM archive WHERE archive_id = ? AND mode = ?", (archive_id, self.mode)
+            ).fetchone()
+        return row is not None
+
+    def add(self, archive_id: str) -> None:
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "INSERT OR IGNORE INTO archive VALUES (?, ?, ?)", (archive_id, self.mode, time.time())
+            )
+
+    def record(self, info: dict) -> None:
+        """Record a finished download from its yt-dlp metadata."""
+        if info.get("extractor_key") and info.get("id"):
+            self.add(make_archive_id(info["extractor_key"], info["id"]))
+
+def make_archive_id(extractor_key: str, video_id: str) -> str:
+    """Same key format as yt-dlp's --download-archive ("youtube dQw4w9WgXcQ")."""
+    return f"{extractor_key.lower()} {video_id}"
+
+_extractors = None
+
+def extractor_matchers(yt_dlp) -> List[tuple]:
+    """(pattern match, extractor) pairs in yt-dlp's order, with each _VALID_URL compiled once.
+
+    Matching the compiled patterns directly skips the per-extractor overhead of ie.suitable(),
+    which is what made URLs no site extractor knows cost milliseconds. Extractors without a plain
+    pattern (and Generic) get None and are always asked.
+    """
+    matchers = []
+    for ie in yt_dlp.extractor.gen_extractor_classes():
+        patterns = getattr(ie, "_VALID_URL", None)
+        patterns = [patterns] if isinstance(patterns, str) else patterns
+        if ie.ie_key() == "Generic" or not patterns or not all(isinstance(p, str) for p in patterns):
+            matchers.append((None, ie))
+            continue
+        matchers.extend((re.compile(p).match, ie) for p in patterns)
+    return matchers
+
+def archive_id_for_url(url: str) -> Optional[str]:
+    """Work out the archive key from the URL alone (no network), using yt-dlp's extractor matching."""
+    global _extractors
+    yt_dlp = load_yt_dlp()
+    if yt_dlp is None:
+        return None
+    if _extractors is None:
+        _extractors = extractor_matchers(yt_dlp)
+    for match, ie in _extractors:
+        # suitable() is only asked once the pattern matched; overrides only narrow it further
+        if (match is None or match(url)) and ie.suitable(url):
+            if ie.ie_key() == "Generic":
+                return None
+            temp_id = ie.get_temp_id(url)
+            return make_archive_id(ie.ie_key(), temp_id) if temp_id else None
+    return None
+
+def download_mode(audio_only: bool, video_only: bool) -> str:
+    return "audio" if audio_only else "video" if video_only else "av"
+
+def read_results(path: str) -> List[dict]:
+    """Read the per-file metadata yt-dlp printed with RESULT_TEMPLATE."""
+    results = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    results.append(json.loads(line))
+                except ValueError:
+                    continue
+    except OSError:
+        pass
+    return results
+
+class Job(NamedTuple):
+    id: int
+    position: int
+    url: str
+    uid: str
+    attempts: int
+    volume: Optional[str] = None  # output volume holding the partial download
+    digest: Optional[int] = None  # url_digest of the URL, computed once when it was queued
+
+class JobStore:
+    """Durable record of bulk batches and the state of every URL in them.
+
+    Jobs move pending -> running -> done/skipped/failed. Each job keeps the uid used in its
+    file name so a resumed download reuses the same name and yt-dlp continues the .part file.
+    Cookies are never written here.
+
+    Jobs of distributed batches are leased by worker nodes: the lease is extended by the node's
+    heartbeat, and a job whose lease ran out goes back to pending for another node.
+
+    A batch is owned by the process running (or watching) it, which heartbeats the ownership;
+    other processes only resume it once that process is gone.
+    """
+
+    OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+    def __init__(self, path: str = JOB_DB_PATH) -> None:
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with closing(self._connect()) as db, db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS batches (
+                    id TEXT PRIMARY KEY,
+                    created REAL NOT NULL,
+                    options TEXT NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'running'
+                );
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    batch_id TEXT NOT NULL REFERENCES batches(id) ON DELETE CASCADE,
+                    position INTEGER NOT NULL,
+                    url TEXT NOT NULL,
+                    uid TEXT NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    output_path TEXT,
+                    error TEXT,
+                    updated REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS jobs_batch_state ON jobs (batch_id, state);
+                CREATE TABLE IF NOT EXISTS nodes (
+                    id TEXT PRIMARY KEY,
+                    heartbeat REAL NOT NULL,
+                    running INTEGER NOT NULL DEFAULT 0,
+                    state TEXT NOT NULL DEFAULT 'running'
+                );
+            """)
+            # Columns added for distributed batches; older databases get them here
+            added = {
+                "batches": [("distributed", "INTEGER NOT NULL DEFAULT 0"), ("owner", "TEXT"), ("heartbeat", "REAL")],
+                "jobs": [("lease_owner", "TEXT"), ("lease_expires", "REAL"), ("not_before", "REAL NOT NULL DEFAULT 0"),
+                         ("progress", "REAL NOT NULL DEFAULT 0"), ("log", "TEXT"), ("finished_seq", "INTEGER"),
+                         ("volume", "TEXT"), ("digest", "INTEGER")],
+            }
+            for table, columns in added.items():
+                existing = {row[1] for row in db.execute(f"PRAGMA table_info({table})")}
+                for name, decl in columns:
+                    if name not in existing:
+                        db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_lease ON jobs (state, lease_expires)")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_finished_seq ON jobs (batch_id, finished_seq)")
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, timeout=30)
+        db.execute("PRAGMA foreign_keys=ON")
+        return db
+
+    def create_batch(self, options: dict, distributed: bool = False) -> str:
+        batch_id = uuid.uuid4().hex[:12]
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "INSERT INTO batches (id, created, options, distributed, owner, heartbeat) VALUES (?, ?, ?, ?, ?, ?)",
+                (batch_id, time.time(), json.dumps(options), int(distributed), self.OWNER, time.time())
+            )
+        return batch_id
+
+    def claim_batch(self, batch_id: str) -> bool:
+        """Take ownership of a batch unless another live process holds it."""
+        with closing(self._connect()) as db, db:
+            row = db.execute("SELECT owner, heartbeat FROM batches WHERE id = ?", (batch_id,)).fetchone()
+            if row is None:
+                return False
+            owner, heartbeat = row
+            if owner and owner != self.OWNER and not owner_gone(owner, heartbeat):
+                return False
+            # Compare-and-set, in case another process claims it at the same moment
+            return bool(db.execute(
+                "UPDATE batches SET owner = ?, heartbeat = ? WHERE id = ? AND owner IS ? AND heartbeat IS ?",
+                (self.OWNER, time.time(), batch_id, owner, heartbeat)
+            ).rowcount)
+
+    def beat_batch(self, batch_id: str) -> None:
+        with closing(self._connect()) as db, db:
+            db.execute("UPDATE batches SET heartbeat = ? WHERE id = ? AND owner = ?",
+                       (time.time(), batch_id, self.OWNER))
+
+    def release_batch(self, batch_id: str) -> None:
+        with closing(self._connect()) as db, db:
+            db.execute("UPDATE batches SET owner = NULL, heartbeat = NULL WHERE id = ? AND owner = ?",
+                       (batch_id, self.OWNER))
+
+    def add_jobs(self, batch_id: str, entries: Iterable[Tuple[int, str, int]]) -> List[Job]:
+        """Add (position, URL, url_digest) entries to a batch."""
+        jobs = []
+        with closing(self._connect()) as db, db:
+            for position, url, digest in entries:
+                uid = uuid.uuid4().hex[:8]
+                cursor = db.execute(
+                    "INSERT INTO jobs (batch_id, position, url, uid, digest, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                    (batch_id, position, url, uid, digest, time.time())
+                )
+                jobs.append(Job(cursor.lastrowid, position, url, uid, 0, digest=digest))
+        return jobs
+
+    def append_jobs(self, batch_id: str, entries: List[Tuple[str, int]]) -> List[Job]:
+        """Add (URL, url_digest) entries after the batch's last position (found while the batch runs)."""
+        with closing(self._connect()) as db:
+            last, = db.execute("SELECT COALESCE(MAX(position), 0) FROM jobs WHERE batch_id = ?", (batch_id,)).fetchone()
+        return self.add_jobs(batch_id, ((position, url, digest) for position, (url, digest) in enumerate(entries, last + 1)))
+
+    def batch_digests(self, batch_id: str) -> Set[int]:
+        """url_digest of every URL in the batch, finished or not (playlist entries are only queued once)."""
+        with closing(self._connect()) as db:
+            rows = db.execute("SELECT url, digest FROM jobs WHERE batch_id = ?", (batch_id,)).fetchall()
+        # Jobs queued before digests were stored get theirs computed here
+        return {url_digest(url) if digest is None else digest for url, digest in rows}
+
+    def unfinished_jobs(self, batch_id: str) -> List[Job]:
+        with closing(self._connect()) as db:
+            rows = db.execute(
+                "SELECT id, position, url, uid, attempts, volume, digest FROM jobs "
+                "WHERE batch_id = ? AND state IN ('pending', 'running') ORDER BY position",
+                (batch_id,)
+            ).fetchall()
+        return [Job(*row) for row in rows]
+
+    def set_volume(self, job_id: int, volume: str) -> None:
+        """Remember where a job is downloading to, so a resume continues its partial files there."""
+        with closing(self._connect()) as db, db:
+            db.execute("UPDATE jobs SET volume = ? WHERE id = ?", (volume, job_id))
+
+    def unfinished_batches(self, distributed: bool = False) -> List[Tuple[str, dict]]:
+        with closing(self._connect()) as db:
+            rows = db.execute(
+                "SELECT id, options FROM batches WHERE state IN ('running', 'paused') AND distributed = ? "
+                "ORDER BY created", (int(distributed),)
+            ).fetchall()
+        return [(batch_id, json.loads(options)) for batch_id, options in rows]
+
+    def set_batch_state(self, batch_id: str, state: str) -> None:
+        """Pause ("paused") or continue ("running") a distributed batch; nodes stop paused jobs."""
+        with closing(self._connect()) as db, db:
+            db.execute("UPDATE batches SET state = ? WHERE id = ? AND state != 'finished'", (state, batch_id))
+
+    def lease_job(self, node: str, allowed: Callable[[str], bool],
+                  lease_seconds: float = LEASE_SECONDS) -> Optional[Tuple[Job, str, dict]]:
+        """Lease the next pending job of a running distributed batch that allowed() accepts."""
+        now = time.time()
+        with closing(self._connect()) as db, db:
+            # Jobs of nodes that stopped heartbeating go back to the queue (or fail after too many tries)
+            db.execute(
+                "UPDATE jobs SET state = CASE WHEN attempts > ? THEN 'failed' ELSE 'pending' END, "
+                "error = CASE WHEN attempts > ? THEN 'Worker node stopped responding' ELSE error END, "
+                "finished_seq = CASE WHEN attempts > ? THEN (SELECT COALESCE(MAX(finished_seq), 0) + 1 FROM jobs) END, "
+                "lease_owner = NULL, updated = ? "
+                "WHERE state = 'running' AND lease_owner IS NOT NULL AND lease_expires < ?",
+                (RETRY_LIMIT, RETRY_LIMIT, RETRY_LIMIT, now, now)
+            )
+            candidates = db.execute(
+                "SELECT j.id, j.position, j.url, j.uid, j.attempts, j.batch_id, b.options "
+                "FROM jobs j JOIN batches b ON b.id = j.batch_id "
+                "WHERE b.state = 'running' AND b.distributed = 1 AND j.state = 'pending' AND j.not_before <= ? "
+                "ORDER BY b.created, j.position LIMIT ?",
+                (now, LEASE_CANDIDATES)
+            ).fetchall()
+        for job_id, position, url, uid, attempts, batch_id, options in candidates:
+            if not allowed(url):
+                continue
+            with closing(self._connect()) as db, db:
+                # Another node may have taken it since the SELECT
+                leased = db.execute(
+                    "UPDATE jobs SET state = 'running', lease_owner = ?, lease_expires = ?, attempts = attempts + 1, "
+                    "progress = 0, log = NULL, updated = ? WHERE id = ? AND state = 'pending'",
+                    (node, time.time() + lease_seconds, time.time(), job_id)
+                ).rowcount
+            if leased:
+                return Job(job_id, position, url, uid, attempts + 1), batch_id, json.loads(options)
+        return None
+
+    def heartbeat(self, node: str, progress: Dict[int, Tuple[float, str]],
+                  lease_seconds: float = LEASE_SECONDS) -> List[int]:
+        """Extend a node's leases and record its progress; returns the jobs it must stop
+        (lease taken over, or the batch was paused)."""
+        now = time.time()
+        lost = []
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "INSERT INTO nodes (id, heartbeat, running, state) VALUES (?, ?, ?, 'running') "
+                "ON CONFLICT(id) DO UPDATE SET heartbeat = excluded.heartbeat, running = excluded.running, state = 'running'",
+                (node, now, len(progress))
+            )
+            for job_id, (fraction, line) in progress.items():
+                kept = db.execute(
+                    "UPDATE jobs SET lease_expires = ?, progress = ?, log = ?, updated = ? "
+                    "WHERE id = ? AND lease_owner = ? AND state = 'running' "
+                    "AND batch_id IN (SELECT id FROM batches WHERE state = 'running')",
+                    (now + lease_seconds, fraction, line, now, job_id, node)
+                ).rowcount
+                if not kept:
+                    lost.append(job_id)
+        return lost
+
+    def stop_node(self, node: str) -> None:
+        with closing(self._connect()) as db, db:
+            db.execute("UPDATE nodes SET state = 'stopped', running = 0, heartbeat = ? WHERE id = ?", (time.time(), node))
+
+    def release_job(self, job_id: int, node: str, delay: float = 0.0, error: Optional[str] = None) -> None:
+        """Hand a leased job back to the queue, to be leased again after delay seconds."""
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "UPDATE jobs SET state = 'pending', lease_owner = NULL, lease_expires = NULL, not_before = ?, "
+                "progress = 0, error = COALESCE(?, error), updated = ? "
+                "WHERE id = ? AND lease_owner = ? AND state = 'running'",
+                (time.time() + delay, error, time.time(), job_id, node)
+            )
+
+    def finish_leased(self, job_id: int, node: str, state: str, output_path: Optional[str] = None,
+                      error: Optional[str] = None, log: Optional[str] = None) -> bool:
+        """finish_job for a leased job; ignored (False) if the node no longer holds the lease."""
+        with closing(self._connect()) as db, db:
+            return bool(db.execute(
+                "UPDATE jobs SET state = ?, output_path = COALESCE(?, output_path), error = ?, log = ?, "
+                "progress = 1, lease_owner = NULL, updated = ?, "
+                "finished_seq = (SELECT COALESCE(MAX(finished_seq), 0) + 1 FROM jobs) "
+                "WHERE id = ? AND lease_owner = ? AND state = 'running'",
+                (state, output_path, error, log, time.time(), job_id, node)
+            ).rowcount)
+
+    def batch_snapshot(self, batch_id: str, after_seq: int) -> Tuple[Counter, int, List[tuple], List[tuple]]:
+        """State of a distributed batch for its coordinator: (counts by state, retries, jobs that
+        finished after after_seq, running jobs)."""
+        with closing(self._connect()) as db:
+            counts = Counter(dict(db.execute(
+                "SELECT state, COUNT(*) FROM jobs WHERE batch_id = ? GROUP BY state", (batch_id,)
+            ).fetchall()))
+            retries, = db.execute(
+                "SELECT COALESCE(SUM(MAX(attempts - 1, 0)), 0) FROM jobs WHERE batch_id = ?", (batch_id,)
+            ).fetchone()
+            finished = db.execute(
+                "SELECT finished_seq, position, url, state, error, log FROM jobs "
+                "WHERE batch_id = ? AND finished_seq > ? ORDER BY finished_seq", (batch_id, after_seq)
+            ).fetchall()
+            running = db.execute(
+                "SELECT position, url, lease_owner, progress, log FROM jobs "
+                "WHERE batch_id = ? AND state = 'running' ORDER BY position", (batch_id,)
+            ).fetchall()
+        return counts, retries, finished, running
+
+    def live_nodes(self) -> List[Tuple[str, int]]:
+        """Worker nodes that sent a heartbeat within the lease time, with their running jobs."""
+        with closing(self._connect()) as db:
+            return db.execute(
+                "SELECT id, running FROM nodes WHERE state = 'running' AND heartbeat > ? ORDER BY id",
+                (time.time() - LEASE_SECONDS,)
+            ).fetchall()
+
+    def start_job(self, job_id: int) -> None:
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "UPDATE jobs SET state = 'running', attempts = attempts + 1, updated = ? WHERE id = ?",
+                (time.time(), job_id)
+            )
+
+    def finish_job(self, job_id: int, state: str, output_path: Optional[str] = None,
+                   error: Optional[str] = None) -> None:
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "UPDATE jobs SET state = ?, output_path = COALESCE(?, output_path), error = ?, updated = ? "
+                "WHERE id = ?",
+                (state, output_path, error, time.time(), job_id)
+            )
+
+    def finish_batch(self, batch_id: str) -> None:
+        """Mark the batch finished once none of its jobs are left to run."""
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "UPDATE batches SET state = 'finished' WHERE id = ? AND NOT EXISTS ("
+                "SELECT 1 FROM jobs WHERE batch_id = ? AND state IN ('pending', 'running'))",
+                (batch_id, batch_id)
+            )
+
+    def prune(self, days: int = JOB_HISTORY_DAYS) -> None:
+        """Forget finished batches older than the given number of days."""
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "DELETE FROM batches WHERE state = 'finished' AND created < ?",
+                (time.time() - days * 86400,)
+            )
+
+class BatchResult(NamedTuple):
+    """Counts of a finished bulk batch (what its summary reports)."""
+    total: int
+    succeeded: int
+    skipped: int
+    failed: int
+    retries: int
+    failed_urls: List[str]
+
+class Failure(NamedTuple):
+    kind: str  # "transient", "permanent" or "unknown"
+    reason: str
+    retry_after: Optional[float] = None
+    max_retries: Optional[int] = None  # tighter cap than RETRY_LIMIT for this kind of error
+
+    @property
+    def retryable(self) -> bool:
+        return self.kind == "transient"
+
+    def can_retry(self, attempt: int, limit: int = RETRY_LIMIT) -> bool:
+        """Whether a transient failure on this attempt (1-based) gets another one."""
+        if self.max_retries is not None:
+            limit = min(limit, self.max_retries)
+        return self.retryable and attempt <= limit
+
+def classify_failure(output: str) -> Failure:
+    """Classify a failed download from yt-dlp's ERROR lines."""
+    lines = [line for line in output.splitlines() if line.strip()]
+    errors = [line for line in lines if line.startswith("ERROR:")]
+    message = errors[-1] if errors else (lines[-1] if lines else "Unknown error")
+    # "ERROR: [youtube] abc: Private video" -> "Private video"
+    reason = re.sub(r"^ERROR:\s*(\[[^\]]+\]\s*[^:\s]+:\s*)?", "", message).strip()
+
+    match = RETRY_AFTER.search(output)
+    retry_after = float(match.group(1)) if match else None
+    text = "\n".join(errors) or message
+    permanent = PERMANENT_ERRORS.search(text)
+    if FRAGMENT_FORBIDDEN.search(output) and (not permanent or "403" in permanent.group(0)):
+        return Failure("transient", reason, retry_after, FRAGMENT_FORBIDDEN_RETRIES)
+    if permanent:
+        return Failure("permanent", reason)
+    if retry_after is not None or TRANSIENT_ERRORS.search(text):
+        return Failure("transient", reason, retry_after)
+    return Failure("unknown", reason)
+
+def retry_delay(attempt: int, failure: Failure) -> float:
+    """Jittered exponential backoff that never undercuts the server's Retry-After."""
+    ceiling = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1))
+    delay = random.uniform(ceiling / 2, ceiling)
+    if failure.retry_after is not None:
+        delay = max(delay, min(failure.retry_after, RETRY_MAX_DELAY))
+    return delay
+
+def normalize_url(url: str) -> str:
+    """Lower-case the host and drop fragments and tracking parameters so variants of a link match."""
+    parts = urlparse(url.strip() if "://" in url else f"https://{url.strip()}")
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not TRACKING_PARAMS.match(k)]
+    return urlunparse((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", "", urlencode(query), ""))
+
+def metadata_cache_key(url: str) -> str:
+    """Cache key: the extractor + video ID when the URL reveals it, else the normalized URL."""
+    return archive_id_for_url(url) or f"url {normalize_url(url)}"
+
+def url_digest(url: str) -> int:
+    """64-bit fingerprint of a URL's canonical ID; short links, tracking parameters etc. match."""
+    key = metadata_cache_key(url.strip()).encode("utf-8")
+    # Signed, so it fits an SQLite INTEGER
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "big", signed=True)
+
+def iter_url_files(paths: Iterable[str]) -> Generator[str, None, None]:
+    """Yield the URLs in files (one per line, "-" for stdin) as they are read, skipping # comments."""
+    for path in paths:
+        f = sys.stdin if path == "-" else open(path, encoding="utf-8-sig", errors="replace")
+        try:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    yield line
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+class MetadataCache:
+    """SQLite cache of extracted yt-dlp info JSON with a TTL and size-bounded LRU eviction.
+
+    Entries also expire early when the stream URLs inside them do (``expire=`` query parameter).
+    """
+
+    def __init__(self, path: str = INFO_CACHE_PATH, ttl: float = INFO_CACHE_TTL,
+                 max_bytes: int = INFO_CACHE_MAX_BYTES) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with closing(self._connect()) as db, db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS info ("
+                "key TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, "
+                "expires REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS info_accessed ON info (accessed)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the cached info JSON, or None if missing or expired."""
+        now = time.time()
+        with closing(self._connect()) as db, db:
+            row = db.execute("SELECT data, expires FROM info WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                db.execute("DELETE FROM info WHERE key = ?", (key,))
+                return None
+            db.execute("UPDATE info SET accessed = ? WHERE key = ?", (now, key))
+        return zlib.decompress(row[0])
+
+    def get_info(self, key: str) -> Optional[dict]:
+        data = self.get(key)
+        try:
+            return json.loads(data) if data else None
+        except ValueError:
+            return None
+
+    def put(self, key: str, data: bytes) -> None:
+        try:
+            info = json.loads(data)
+        except ValueError:
+            return
+        if not isinstance(info, dict) or info.get("_type", "video") != "video":
+            # Playlists are expanded per entry; only single items are worth caching
+            return
+
+        now = time.time()
+        expires = min([now + self.ttl] + stream_url_expiry(info))
+        blob = zlib.compress(json.dumps(strip_credentials(info)).encode())
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "INSERT OR REPLACE INTO info VALUES (?, ?, ?, ?, ?)", (key, blob, len(blob), expires, now)
+            )
+            self._evict(db)
+
+    def _evict(self, db: sqlite3.Connection) -> None:
+        """Drop expired entries, then least recently used ones until under the size budget."""
+        db.execute("DELETE FROM info WHERE expires <= ?", (time.time(),))
+        excess = (db.execute("SELECT COALESCE(SUM(size), 0) FROM info").fetchone()[0]) - self.max_bytes
+        if excess <= 0:
+            return
+        victims = []
+        for key, size in db.execute("SELECT key, size FROM info ORDER BY accessed"):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        db.executemany("DELETE FROM info WHERE key = ?", victims)
+
+    def invalidate(self, key: str) -> None:
+        with closing(self._connect()) as db, db:
+            db.execute("DELETE FROM info WHERE key = ?", (key,))
+
+CREDENTIAL_HEADERS = {"cookie", "authorization", "proxy-authorization"}
+
+def strip_credentials(info: dict) -> dict:
+    """Remove cookies and auth headers from an info dict and its formats before it is stored."""
+    def clean(item: dict) -> dict:
+        item = {k: v for k, v in item.items() if k != "cookies"}
+        if isinstance(item.get("http_headers"), dict):
+            item["http_headers"] = {k: v for k, v in item["http_headers"].items()
+                                    if k.lower() not in CREDENTIAL_HEADERS}
+        return item
+
+    info = clean(info)
+    for field in ("formats", "requested_formats", "requested_downloads"):
+        if isinstance(info.get(field), list):
+            info[field] = [clean(f) if isinstance(f, dict) else f for f in info[field]]
+    return info
+
+def stream_url_expiry(info: dict) -> List[float]:
+    """Expiry timestamps (with a safety margin) found in the info dict's format URLs."""
+    expiries = []
+    for fmt in info.get("formats") or []:
+        url = fmt.get("url") or ""
+        match = re.search(r"[?&/]expire[=/](\d+)", url)
+        if match:
+            expiries.append(float(match.group(1)) - 300)
+    return [min(expiries)] if expiries else []
+
+_metadata_cache = None
+
+def open_metadata_cache() -> Optional[MetadataCache]:
+    """Shared metadata cache, or None if it can't be opened (downloads still work without it)."""
+    global _metadata_cache
+    if _metadata_cache is None:
+        try:
+            _metadata_cache = MetadataCache()
+        except (sqlite3.Error, OSError):
+            return None
+    return _metadata_cache
+
+class MediaCatalog:
+    """SQLite catalog of downloaded files with full-text search over title, uploader, site and URL.
+
+    Rows are keyed by file path. ``rescan`` reconciles them with what is on disk: moved files are
+    matched by size and mtime, and only new or changed files are probed. Without FTS5 in the
+    SQLite build, search falls back to LIKE.
+    """
+
+    COLUMNS = ("path", "root", "source_url", "extractor", "video_id", "title", "uploader",
+               "duration", "format", "ext", "size", "mtime", "added")
+
+    def __init__(self, path: str = CATALOG_PATH) -> None:
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with closing(self._connect()) as db, db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS media ("
+                "id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE, root TEXT NOT NULL, source_url TEXT, "
+                "extractor TEXT, video_id TEXT, title TEXT, uploader TEXT, duration REAL, format TEXT, "
+                "ext TEXT, size INTEGER, mtime REAL, added REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS media_root ON media (root)")
+            db.execute("CREATE INDEX IF NOT EXISTS media_video ON media (video_id)")
+            db.execute("CREATE INDEX IF NOT EXISTS media_source ON media (source_url)")
+            self.fts = self._create_fts(db)
+
+    def _create_fts(self, db: sqlite3.Connection) -> bool:
+        """Full-text index kept in sync with the media table by triggers; False without FTS5."""
+        fields = "title, uploader, extractor, source_url, path"
+        existed = db.execute("SELECT 1 FROM sqlite_master WHERE name = 'media_fts'").fetchone()
+        try:
+            db.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS media_fts USING fts5({fields}, content='media', "
+                "content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+            )
+        except sqlite3.OperationalError:
+            return False
+        new = ", ".join(f"new.{name}" for name in fields.split(", "))
+        old = ", ".join(f"old.{name}" for name in fields.split(", "))
+        remove = f"INSERT INTO media_fts(media_fts, rowid, {fields}) VALUES ('delete', old.id, {old});"
+        add = f"INSERT INTO media_fts(rowid, {fields}) VALUES (new.id, {new});"
+        db.execute(f"CREATE TRIGGER IF NOT EXISTS media_ai AFTER INSERT ON media BEGIN {add} END")
+        db.execute(f"CREATE TRIGGER IF NOT EXISTS media_ad AFTER DELETE ON media BEGIN {remove} END")
+        db.execute(f"CREATE TRIGGER IF NOT EXISTS media_au AFTER UPDATE ON media BEGIN {remove} {add} END")
+        if not existed:
+            # Rows written by a build without FTS5
+            db.execute("INSERT INTO media_fts(media_fts) VALUES ('rebuild')")
+        return True
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, timeout=30)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def _upsert(self, db: sqlite3.Connection, rows: List[tuple]) -> None:
+        # Fields a rescan couldn't find (source URL, ID, ...) keep what the download recorded
+        updates = ", ".join(f"{name} = COALESCE(excluded.{name}, media.{name})"
+                            for name in self.COLUMNS if name not in ("path", "added"))
+        db.executemany(
+            f"INSERT INTO media ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))}) "
+            f"ON CONFLICT(path) DO UPDATE SET {updates}", rows
+        )
+
+    @staticmethod
+    def _row(info: dict, root: str, source_url: Optional[str], stat: os.stat_result) -> tuple:
+        path = os.path.abspath(info["filepath"])
+        return (path, os.path.abspath(root), source_url or info.get("webpage_url"), info.get("extractor_key"),
+                info.get("id"), info.get("title"), info.get("uploader"), info.get("duration"),
+                info.get("format_id"), info.get("ext") or os.path.splitext(path)[1][1:].lower(),
+                stat.st_size, stat.st_mtime, time.time())
+
+    def record(self, source_url: str, infos: List[dict], root: str) -> None:
+        """Add the files a download wrote (yt-dlp metadata) under its save location."""
+        rows = []
+        for info in infos:
+            path = info.get("filepath")
+            try:
+                rows.append(self._row(info, root, source_url, os.stat(path)))
+            except (OSError, TypeError):
+                continue  # not on disk (yet), a rescan will find it
+        if rows:
+            with closing(self._connect()) as db, db:
+                self._upsert(db, rows)
+
+    def search(self, query: str, limit: int = 50) -> List[dict]:
+        """Files matching every word of query (prefixes count), best matches first.
+
+        A video URL finds the files downloaded from it; an empty query lists the newest files.
+        """
+        query = query.strip()
+        with closing(self._connect()) as db:
+            if re.match(r"https?://", query):
+                archive_id = archive_id_for_url(query)
+                if archive_id:
+                    extractor, video_id = archive_id.split(" ", 1)
+                    rows = db.execute(
+                        "SELECT * FROM media WHERE video_id = ? AND lower(extractor) = ? ORDER BY added DESC LIMIT ?",
+                        (video_id, extractor, limit)
+                    ).fetchall()
+                else:
+                    rows = db.execute(
+                        "SELECT * FROM media WHERE source_url IN (?, ?) ORDER BY added DESC LIMIT ?",
+                        (query, normalize_url(query), limit)
+                    ).fetchall()
+                return [dict(row) for row in rows]
+            terms = re.findall(r"\w+", query)
+            if not terms:
+                rows = db.execute("SELECT * FROM media ORDER BY added DESC LIMIT ?", (limit,)).fetchall()
+            elif self.fts:
+                match = " ".join(f'"{term}"*' for term in terms)
+                rows = db.execute(
+                    "SELECT media.* FROM media_fts JOIN media ON media.id = media_fts.rowid "
+                    "WHERE media_fts MATCH ? ORDER BY media_fts.rank LIMIT ?", (match, limit)
+                ).fetchall()
+            else:
+                text = "(COALESCE(title, '') || ' ' || COALESCE(uploader, '') || ' ' || COALESCE(extractor, '') " \
+                       "|| ' ' || COALESCE(source_url, '') || ' ' || path)"
+                where = " AND ".join(f"{text} LIKE ?" for _ in terms)
+                rows = db.execute(
+                    f"SELECT * FROM media WHERE {where} ORDER BY added DESC LIMIT ?",
+                    [f"%{term}%" for term in terms] + [limit]
+                ).fetchall()
+        return [dict(row) for row in rows]
+
+    def roots(self) -> List[str]:
+        with closing(self._connect()) as db:
+            return [row[0] for row in db.execute("SELECT DISTINCT root FROM media ORDER BY root")]
+
+    def rescan(self, dirs: Optional[Iterable[str]] = None) -> Counter:
+        """Reconcile the catalog with the files in dirs (default: every save location in it).
+
+        Returns counts of added, updated, moved, removed and unchanged files.
+        """
+        counts = Counter(dict.fromkeys(("added", "updated", "moved", "removed", "unchanged"), 0))
+        for root in dict.fromkeys(os.path.abspath(d) for d in dirs) if dirs else self.roots():
+            on_disk = scan_media_files(root)
+            prefix = root.rstrip(os.sep) + os.sep
+            with closing(self._connect()) as db:
+                known = {row["path"]: (row["size"], row["mtime"]) for row in db.execute(
+                    "SELECT path, size, mtime FROM media WHERE root = ? OR (path >= ? AND path < ?)",
+                    (root, prefix, prefix[:-1] + chr(ord(os.sep) + 1))
+                )}
+            missing = {path: stat for path, stat in known.items() if path not in on_disk}
+            new = [path for path in on_disk if path not in known]
+            changed = [path for path in on_disk if path in known and known[path] != on_disk[path]]
+            counts["unchanged"] += len(on_disk) - len(new) - len(changed)
+
+            # A file renamed or moved within the folder keeps its size and mtime, and its row
+            by_stat = {stat: path for path, stat in missing.items()}
+            moves = []
+            for path in list(new):
+                old = by_stat.pop(on_disk[path], None)
+                if old is not None:
+                    moves.append((path, root, old))
+                    new.remove(path)
+                    del missing[old]
+
+            with ThreadPoolExecutor(CATALOG_PROBE_WORKERS) as pool:
+                probed = list(pool.map(probe_media_file, new + changed))
+            rows = []
+            for info in probed:
+                try:
+                    rows.append(self._row(info, root, None, os.stat(info["filepath"])))
+                except OSError:
+                    continue
+            with closing(self._connect()) as db, db:
+                db.executemany("UPDATE media SET path = ?, root = ? WHERE path = ?", moves)
+                db.executemany("DELETE FROM media WHERE path = ?", [(path,) for path in missing])
+                self._upsert(db, rows)
+            counts["added"] += len(new)
+            counts["updated"] += len(changed)
+            counts["moved"] += len(moves)
+            counts["removed"] += len(missing)
+        return counts
+
+def scan_media_files(root: str) -> Dict[str, Tuple[int, float]]:
+    """(size, mtime) of every finished media file below root, skipping partial and hidden files."""
+    found = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+        for name in filenames:
+            ext = os.path.splitext(name)[1][1:].lower()
+            if ext not in MEDIA_EXTENSIONS or name.startswith(".") or ".merging." in name:
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            found[path] = (stat.st_size, stat.st_mtime)
+    return found
+
+def probe_media_file(path: str) -> dict:
+    """Metadata for a file found on disk, from yt-dlp's .info.json next to it or ffprobe and its name."""
+    stem, ext = os.path.splitext(path)
+    info = {"filepath": path, "ext": ext[1:].lower(), "title": DOWNLOAD_UID_SUFFIX.sub("", os.path.basename(stem))}
+    sidecar = f"{stem}.info.json"
+    if os.path.isfile(sidecar):
+        try:
+            with open(sidecar, encoding="utf-8") as f:
+                data = json.load(f)
+            for key in ("id", "extractor_key", "title", "uploader", "duration", "format_id", "webpage_url"):
+                if data.get(key) is not None:
+                    info[key] = data[key]
+            return info
+        except (OSError, ValueError):
             pass
+    if shutil.which("ffprobe") is None:
+        return info
+    try:
+        proc = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration:format_tags=title,artist",
+             "-of", "json", path],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, timeout=60
+        )
+        fmt = json.loads(proc.stdout or "{}").get("format") or {}
+    except (subprocess.TimeoutExpired, ValueError):
+        return info
+    tags = {key.lower(): value for key, value in (fmt.get("tags") or {}).items()}
+    if fmt.get("duration"):
+        info["duration"] = float(fmt["duration"])
+    info["title"] = tags.get("title") or info["title"]
+    info["uploader"] = tags.get("artist")
+    return info
+
+_catalog = None
+
+def open_catalog() -> Optional[MediaCatalog]:
+    """Shared media catalog, or None if disabled or it can't be opened (downloads still work)."""
+    global _catalog
+    if _catalog is None and CATALOG_PATH:
+        try:
+            _catalog = MediaCatalog()
+        except (sqlite3.Error, OSError):
+            return None
+    return _catalog
+
+def clean_temp_files(uid: str) -> None:
+    """Clean up any temporary files created during the download process."""
+    for name in (f"cookies_{uid}.txt", f"youown_result_{uid}.jsonl",
+                 f"youown_info_{uid}.info.json", f"youown_info_{uid}.cached.json"):
+        temp_path = os.path.join(TEMP_DIR, name)
+        if os.path.exists(temp_path):
+            try:
+                os.remove(temp_path)
+            except Exception as e:
+                pass
+
+def wipe_file(path: str) -> None:
+    """Overwrite a secret file with zeros before deleting it."""
+    try:
+        size = os.path.getsize(path)
+        with open(path, "r+b") as f:
+            f.write(b"\0" * size)
+            f.flush()
+            os.fsync(f.fileno())
+        os.remove(path)
+    except OSError:
+        pass
+
+_cookie_sessions = set()
+_cookie_sessions_lock = threading.Lock()
+
+class CookieSession:
+    """A bulk batch's cookies: validated once, shared by its downloads, wiped when the batch ends.
+
+    Every yt-dlp run gets its own copy of the jar in a private temp directory (yt-dlp rewrites
+    the file on exit), and the cookies a site set or cleared during the run are merged back.
+    """
+
+    def __init__(self, cookies_txt: str) -> None:
+        self.dir = tempfile.mkdtemp(prefix="youown_cookies_")  # mode 0700
+        self.lock = threading.Lock()
+        self.jar: Optional[http.cookiejar.MozillaCookieJar] = None
+        self.closed = False
+        self.snapshots: Dict[str, set] = {}
+        self.auth_failures: Counter = Counter()
+        self.rejections: Dict[str, str] = {}
+        with _cookie_sessions_lock:
+            _cookie_sessions.add(self)
+        source = os.path.join(self.dir, "cookies.txt")
+        try:
+            with open(os.open(source, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "w", encoding="utf-8") as f:
+                f.write(cookies_txt if cookies_txt.endswith("\n") else cookies_txt + "\n")
+            self.jar = self._new_jar()
+            self.jar.load(source, ignore_discard=True, ignore_expires=True)
+        except (http.cookiejar.LoadError, OSError, UnicodeError) as e:
+            self.close()
+            message = str(e) if e.args and source not in str(e) else "not a Netscape format cookies file"
+            raise ValueError(message) from e
+        finally:
+            wipe_file(source)
+
+        now = time.time()
+        self.expired = sum(1 for c in self.jar if c.expires and c.is_expired(now))
+        if len(self.jar) == 0:
+            self.close()
+            raise ValueError("no cookies found")
+        if self.expired == len(self.jar):
+            self.close()
+            raise ValueError(f"all {self.expired} cookies have expired")
+
+    @staticmethod
+    def _new_jar() -> http.cookiejar.MozillaCookieJar:
+        """yt-dlp's jar when available (it reads #HttpOnly_ entries and session cookies like yt-dlp does)."""
+        yt_dlp = load_yt_dlp()
+        return yt_dlp.cookies.YoutubeDLCookieJar() if yt_dlp else http.cookiejar.MozillaCookieJar()
+
+    def describe(self, urls: Iterable[str]) -> str:
+        """Batch header lines: what the jar holds, and the batch's sites it has no cookies for."""
+        sites = {host_key(cookie.domain.lstrip(".")) for cookie in self.jar}
+        expired = f", {self.expired} expired" if self.expired else ""
+        text = (f"🍪 Cookie session: {len(self.jar)} cookies for {len(sites)} site(s){expired}, "
+                "shared by this batch and deleted when it ends\n")
+        missing = sorted({host_key(url) for url in urls} - sites)
+        if missing:
+            text += f"⚠️ No cookies for: {', '.join(missing)}\n"
+        return text
+
+    def checkout(self, uid: str) -> str:
+        """Write the current jar to a private file for one yt-dlp run and return its path."""
+        path = os.path.join(self.dir, f"cookies_{uid}.txt")
+        with self.lock:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            os.close(fd)
+            self.jar.save(path, ignore_discard=True, ignore_expires=True)
+            self.snapshots[path] = {(c.domain, c.path, c.name) for c in self.jar}
+        return path
+
+    def merge(self, path: str) -> None:
+        """Take over the cookies a finished run refreshed or cleared, then wipe its copy."""
+        run_jar = self._new_jar()
+        try:
+            run_jar.load(path, ignore_discard=True, ignore_expires=True)
+        except (http.cookiejar.LoadError, OSError, UnicodeError):
+            run_jar = None
+        with self.lock:
+            snapshot = self.snapshots.pop(path, set())
+            if run_jar is not None and not self.closed:
+                kept = set()
+                for cookie in run_jar:
+                    self.jar.set_cookie(cookie)
+                    kept.add((cookie.domain, cookie.path, cookie.name))
+                for domain, cookie_path, name in snapshot - kept:
+                    try:
+                        self.jar.clear(domain, cookie_path, name)
+                    except KeyError:
+                        pass
+        wipe_file(path)
+
+    def report(self, host: str, outcome: str, output: str) -> None:
+        """Count login/auth failures per site; enough in a row mark the cookies as rejected there."""
+        with self.lock:
+            if outcome == "failed" and COOKIE_AUTH_ERRORS.search(output):
+                self.auth_failures[host] += 1
+                if self.auth_failures[host] >= COOKIE_AUTH_LIMIT:
+                    self.rejections[host] = classify_failure(output).reason
+            elif outcome == "done":
+                self.auth_failures[host] = 0
+
+    def rejected(self, host: str) -> Optional[str]:
+        """Why the site rejected these cookies, or None."""
+        return self.rejections.get(host)
+
+    def close(self) -> None:
+        """Wipe every copy of the jar. Safe to call more than once."""
+        with self.lock:
+            self.closed = True
+            if self.jar is not None:
+                self.jar.clear()
+            if os.path.isdir(self.dir):
+                for name in os.listdir(self.dir):
+                    wipe_file(os.path.join(self.dir, name))
+                shutil.rmtree(self.dir, ignore_errors=True)
+        with _cookie_sessions_lock:
+            _cookie_sessions.discard(self)
+
+@atexit.register
+def _close_cookie_sessions() -> None:
+    """Wipe the cookies of batches still running when the app exits."""
+    with _cookie_sessions_lock:
+        sessions = list(_cookie_sessions)
+    for session in sessions:
+        session.close()
 
 def validate_inputs(url: str, out_dir: str) -> Tuple[bool, str]:
     """Validate user inputs before processing."""
@@ -99,6 +2274,152 @@ def validate_inputs(url: str, out_dir: str) -> Tuple[bool, str]:
     
     return True, ""
 
+_merge_pool: Optional[ThreadPoolExecutor] = None
+_merge_pool_lock = threading.Lock()
+
+def merge_pool() -> Optional[ThreadPoolExecutor]:
+    """The shared merge pool, or None when merges stay inside yt-dlp (disabled or no ffmpeg)."""
+    global _merge_pool
+    if MERGE_WORKERS <= 0 or shutil.which("ffmpeg") is None:
+        return None
+    with _merge_pool_lock:
+        if _merge_pool is None:
+            _merge_pool = ThreadPoolExecutor(MERGE_WORKERS, thread_name_prefix="youown-merge")
+        return _merge_pool
+
+def normalize_codec(codec: Optional[str]) -> Optional[str]:
+    """Map yt-dlp ("avc1.64001F", "mp4a.40.2") and ffprobe ("h264") codec names to one name."""
+    if not codec or codec == "none":
+        return None
+    return CODEC_ALIASES.get(codec.split(".")[0].lower(), codec.split(".")[0].lower())
+
+_codec_cache: "OrderedDict[str, Optional[str]]" = OrderedDict()
+_codec_cache_lock = threading.Lock()
+
+def stream_codec(info: dict, kind: str) -> Optional[str]:
+    """Codec of a downloaded stream file ("video" or "audio").
+
+    Taken from yt-dlp's metadata when it has it, otherwise from ffprobe. Results are kept per
+    extractor and format ID, since a site's format ID always carries the same codec.
+    """
+    codec = normalize_codec(info.get("vcodec" if kind == "video" else "acodec"))
+    if codec:
+        return codec
+    key = f"{info.get('extractor_key')}:{info.get('format_id')}:{kind}"
+    with _codec_cache_lock:
+        if key in _codec_cache:
+            _codec_cache.move_to_end(key)
+            return _codec_cache[key]
+    if shutil.which("ffprobe") is None:
+        return None
+    try:
+        proc = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "v:0" if kind == "video" else "a:0",
+             "-show_entries", "stream=codec_name", "-of", "csv=p=0", info["filepath"]],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, timeout=PHASE_TIMEOUTS["merge"]
+        )
+    except subprocess.TimeoutExpired:
+        # Unknown codec: the merge falls back to a container that holds anything
+        return None
+    codec = normalize_codec(proc.stdout.strip()) if proc.returncode == 0 else None
+    with _codec_cache_lock:
+        _codec_cache[key] = codec
+        if len(_codec_cache) > 1024:
+            _codec_cache.popitem(last=False)
+    return codec
+
+def choose_container(vcodec: Optional[str], acodec: Optional[str]) -> Tuple[str, bool, bool]:
+    """Pick (container, re-encode video, re-encode audio) for a merge, preferring pure stream copy."""
+    if MERGE_CONTAINER in CONTAINER_CODECS:
+        video_codecs, audio_codecs = CONTAINER_CODECS[MERGE_CONTAINER]
+        copy_video, copy_audio = vcodec in video_codecs, acodec in audio_codecs
+        if copy_video and copy_audio:
+            return MERGE_CONTAINER, False, False
+        if MERGE_REENCODE:
+            return MERGE_CONTAINER, not copy_video, not copy_audio
+        # Not allowed to re-encode: keep the streams as they are in a container that takes anything
+        return "mkv", False, False
+    if MERGE_CONTAINER == "mkv":
+        return "mkv", False, False
+    for container, (video_codecs, audio_codecs) in CONTAINER_CODECS.items():
+        if vcodec in video_codecs and acodec in audio_codecs:
+            return container, False, False
+    # Matroska holds any codec, so copying still works
+    return "mkv", False, False
+
+def is_stream_only(info: dict) -> bool:
+    """Whether a downloaded file (yt-dlp metadata) holds only the video or only the audio stream."""
+    return (info.get("vcodec") == "none") != (info.get("acodec") == "none")
+
+def unsplit_stream(info: dict) -> dict:
+    """Drop the .f<format_id> stream marker from a split download that turned out complete."""
+    path = info.get("filepath") or ""
+    marker = f".f{info.get('format_id')}."
+    if marker not in path:
+        return info
+    target = path.replace(marker, ".", 1)
+    try:
+        os.replace(path, target)
+    except OSError:
+        return info
+    return dict(info, filepath=target)
+
+def remove_partial(path: Optional[str]) -> None:
+    for candidate in (path, f"{path}.part") if path else ():
+        if os.path.exists(candidate):
+            try:
+                os.remove(candidate)
+            except OSError:
+                pass
+
+def merge_streams(video: dict, audio: dict) -> Tuple[bool, str, dict]:
+    """Merge separately downloaded video and audio files (yt-dlp metadata) into one file.
+
+    Streams are copied into a container that can hold their codecs; they are re-encoded only
+    when a container is forced and YOUOWN_REENCODE allows it. Returns (ok, report, metadata of
+    the merged file); the stream files are removed once the merge succeeded.
+    """
+    marker = f".f{video['format_id']}."
+    base = video["filepath"][:video["filepath"].rindex(marker)]
+    vcodec, acodec = stream_codec(video, "video"), stream_codec(audio, "audio")
+    container, reencode_video, reencode_audio = choose_container(vcodec, acodec)
+    output = f"{base}.{container}"
+    partial = f"{base}.merging.{container}"
+    video_args, audio_args = REENCODE_ARGS.get(container, ([], []))
+    cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-i", video["filepath"], "-i", audio["filepath"],
+           "-map", "0:v:0", "-map", "1:a:0"]
+    cmd += video_args if reencode_video else ["-c:v", "copy"]
+    cmd += audio_args if reencode_audio else ["-c:a", "copy"]
+    if container == "mp4":
+        cmd += ["-movflags", "+faststart"]
+    cmd.append(partial)
+
+    started = time.monotonic()
+    try:
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                              timeout=PHASE_TIMEOUTS["merge"])
+    except subprocess.TimeoutExpired:
+        proc = None
+    if proc is None or proc.returncode != 0:
+        if os.path.exists(partial):
+            os.remove(partial)
+        reason = f"timed out after {PHASE_TIMEOUTS['merge']:.0f}s" if proc is None else \
+            _last_line(proc.stdout) or proc.returncode
+        return False, f"❌ Merge failed: {reason}", video
+    os.replace(partial, output)
+    for part in (video["filepath"], audio["filepath"]):
+        if os.path.exists(part):
+            os.remove(part)
+
+    size = os.path.getsize(output)
+    merged = dict(video, filepath=output, ext=container, acodec=audio.get("acodec"),
+                  format_id=f"{video['format_id']}+{audio['format_id']}", filesize=size, filesize_approx=None)
+    reencoded = [kind for kind, flag in (("video", reencode_video), ("audio", reencode_audio)) if flag]
+    path = f"re-encoding {' and '.join(reencoded)}" if reencoded else "stream copy"
+    report = (f"🔧 Merged {vcodec or '?'}+{acodec or '?'} into {container} by {path} in "
+              f"{time.monotonic() - started:.1f}s, {format_bytes(size)} written: {output}")
+    return True, report, merged
+
 def download_stream(
     url: str, 
     out_dir: str, 
@@ -106,18 +2427,83 @@ def download_stream(
     video_only: bool, 
     extra_args: str, 
     use_cookies: bool, 
-    cookies_txt: str
+    cookies_txt: str,
+    engine: str = DOWNLOAD_ENGINE,
+    on_progress: Optional[Callable[[ProgressEvent], None]] = None,
+    skip_duplicates: bool = True,
+    uid: Optional[str] = None,
+    on_complete: Optional[Callable[[List[dict]], None]] = None,
+    cancel: Optional[threading.Event] = None,
+    priority: str = "interactive",
+    on_merge: Optional[Callable[[Future], None]] = None,
+    trace: Optional[JobTrace] = None,
+    cookie_session: Optional[CookieSession] = None,
+    on_reserve: Optional[Callable[[str], None]] = None
 ) -> Generator[Tuple[str, float, bool], None, None]:
-    """Stream download progress from yt-dlp. Returns (output, progress, success)"""
+    """Stream download progress from yt-dlp. Returns (output, progress, success)
+
+    on_progress receives every structured ProgressEvent (bytes, speed, ETA, fragments, phase).
+    With skip_duplicates, items already in the output directory's archive are not fetched again.
+    Passing the uid of an earlier attempt reuses its file names so partial downloads continue.
+    on_complete receives the metadata of every file written by a successful run.
+    yt-dlp is killed when cancel is set, the generator is closed, or the watchdog sees a stall.
+    priority ("interactive" or "bulk") sets its slice of the global bandwidth budget.
+    With on_merge, a video+audio merge is handed over as a Future of the final (output, success)
+    instead of being waited for.
+    Phase timings, bytes and the outcome are recorded on trace (a new one if not given).
+    Finished files are added to the media catalog. Space for the download is reserved on an output
+    volume first; while none has room the download waits. on_reserve receives the chosen volume.
+    A bulk batch's cookie_session replaces cookies_txt; cookies refreshed by the run go back into it.
+    """
     # Input validation
     is_valid, error_msg = validate_inputs(url, out_dir)
     if not is_valid:
         yield error_msg, 0.0, False
         return
+    trace = trace or JobTrace(url.strip(), priority=priority)
+
+    # Metadata extracted recently (retry, other mode) skips yt-dlp's page/player fetches.
+    # Runs with cookies never use it: their info JSON is tied to the account and carries its cookies
+    cache = open_metadata_cache() if cookie_session is None and not use_cookies else None
+    # Archive key from the URL alone, worked out once: extractor matching can take milliseconds
+    url_archive_id = archive_id_for_url(url.strip()) if cache or skip_duplicates else None
+    cache_key = (url_archive_id or f"url {normalize_url(url.strip())}") if cache else None
+    cached_info = cache.get(cache_key) if cache else None
+
+    archive = None
+    if skip_duplicates and not (audio_only and video_only):
+        try:
+            archive = DownloadArchive(out_dir, download_mode(audio_only, video_only))
+        except sqlite3.Error as e:
+            yield f"⚠️ Download archive unavailable, duplicates won't be skipped: {e}\n", 0.0, True
+        # Checked before yt-dlp starts, so no page or media bytes are requested
+        archive_id = url_archive_id if archive is not None else None
+        if archive is not None and not archive_id and cached_info:
+            info = json.loads(cached_info)
+            if info.get("extractor_key") and info.get("id"):
+                archive_id = make_archive_id(info["extractor_key"], info["id"])
+        if archive_id and archive_id in archive:
+            trace.finish("skipped")
+            yield f"⏭️ Already downloaded, skipped: {url}\n", 1.0, True
+            return
+
+    catalog = open_catalog()
+    volume = out_dir
+
+    def record(infos: List[dict]) -> None:
+        if archive is not None:
+            for info in infos:
+                archive.record(info)
+        if catalog is not None:
+            try:
+                catalog.record(url.strip(), infos, volume)
+            except sqlite3.Error:
+                pass  # the file is there; a rescan adds it later
+        if on_complete:
+            on_complete(infos)
 
     # Generate unique ID for this download
-    uid = uuid.uuid4().hex[:8]
-    out_tmpl = os.path.join(out_dir, f"%(title)s_{uid}.%(ext)s")
+    uid = uid or uuid.uuid4().hex[:8]
     
     # Determine format based on user selection
     if audio_only and video_only:
@@ -129,84 +2515,1095 @@ def download_stream(
            else "bestvideo[ext=mp4]+bestaudio[ext=m4a]/bestvideo+bestaudio/best[ext=mp4]/best")
     
     # Prepare command
-    cmd: List[str] = ["yt-dlp", "-f", fmt, "-o", out_tmpl]
+    result_path = os.path.join(TEMP_DIR, f"youown_result_{uid}.jsonl")
+    info_tmpl = os.path.join(TEMP_DIR, f"youown_info_{uid}")
+    info_file = f"{info_tmpl}.info.json"
+    extra = extra_args.split() if extra_args and extra_args.strip() else []
+
+    # Separate video and audio streams are downloaded as two files and merged in the merge
+    # pool, so a bulk download slot isn't held while ffmpeg works. One yt-dlp run fetches both:
+    # "," downloads each selection as its own file
+    split_merge = (not audio_only and not video_only and merge_pool() is not None
+                   and not {"-f", "--format"} & set(extra) and not is_collection_url(url.strip()))
+    split_fmt = "bestvideo[ext=mp4]/bestvideo/best[ext=mp4]/best,bestaudio[ext=m4a]/bestaudio"
     
+    opts: List[str] = []
     if not audio_only and not video_only:
-        cmd += ["--merge-output-format", "mp4"]
+        opts += ["--merge-output-format", "mp4"]
     
-    # Handle cookies if provided
-    cookie_path = None
-    if use_cookies and cookies_txt and cookies_txt.strip():
-        try:
-            cookie_path = os.path.join(TEMP_DIR, f"cookies_{uid}.txt")
-            with open(cookie_path, "w") as f:
-                f.write(cookies_txt)
-            os.chmod(cookie_path, 0o600)  # Set secure permissions
-            cmd += ["--cookies", cookie_path]
-            yield "🔒 Using secure cookies (will be deleted after download)\n", 0.0, True
-        except Exception as e:
-            yield f"❌ Failed to process cookies: {e}", 0.0, False
+    merging = False
+    cleaned = False
+    try:
+        # Handle cookies if provided
+        cookie_path = None
+        if cookie_session is not None:
+            cookie_path = cookie_session.checkout(uid)
+            opts += ["--cookies", cookie_path]
+        elif use_cookies and cookies_txt and cookies_txt.strip():
+            try:
+                cookie_path = os.path.join(TEMP_DIR, f"cookies_{uid}.txt")
+                with open(cookie_path, "w") as f:
+                    f.write(cookies_txt)
+                os.chmod(cookie_path, 0o600)  # Set secure permissions
+                opts += ["--cookies", cookie_path]
+                yield "🔒 Using secure cookies (will be deleted after download)\n", 0.0, True
+            except Exception as e:
+                yield f"❌ Failed to process cookies: {e}", 0.0, False
+                clean_temp_files(uid)
+                return
+        elif use_cookies and not cookies_txt:
+            yield "❌ Cookie data required but not provided", 0.0, False
+            return
+
+        # Add extra arguments if provided
+        opts += extra
+        if SOCKET_TIMEOUT and "--socket-timeout" not in opts:
+            opts += ["--socket-timeout", SOCKET_TIMEOUT]
+
+        # Add URL, or the cached metadata (yt-dlp re-resolves from the page if its stream URLs expired)
+        if cached_info:
+            cached_path = f"{info_tmpl}.cached.json"
+            with open(cached_path, "wb") as f:
+                f.write(cached_info)
+            source = ["--load-info-json", cached_path]
+            yield "♻️ Using cached metadata\n", 0.0, True
+        else:
+            source = [url]
+
+        if engine == "inprocess" and load_yt_dlp() is None:
+            yield "⚠️ yt_dlp module not found, falling back to the yt-dlp executable\n", 0.0, True
+            engine = "subprocess"
+
+        # Stream progress; the log stays bounded and the UI only gets throttled updates
+        log = LogBuffer()
+        throttle = UpdateThrottle()
+        host = host_key(url)
+        written: Dict[str, int] = {}
+        sizes: Dict[str, int] = {}
+        reserved = 0
+
+        def run(args: List[str], downloading: bool = True) -> Generator[Tuple[str, float, bool], None, Optional[int]]:
+            """Run yt-dlp once under the watchdog; returns its exit code (None if it didn't start)."""
+            # A --limit-rate from Advanced Options wins over the shared budget
+            bandwidth_token = None
+            if downloading and BANDWIDTH.limit and not {"-r", "--limit-rate"} & set(args):
+                bandwidth_token = BANDWIDTH.register(priority, live=engine == "inprocess")
+                args = ["--limit-rate", str(int(BANDWIDTH.share(bandwidth_token)))] + args
+
+            # Fragment parallelism for HLS/DASH, unless Advanced Options set it
+            fragments_used = None
+            if downloading and not {"-N", "--concurrent-fragments"} & set(args):
+                if CONCURRENT_FRAGMENTS == "auto":
+                    fragments_used = FRAGMENTS.acquire(host)
+                    args = ["--concurrent-fragments", str(fragments_used)] + args
+                elif CONCURRENT_FRAGMENTS.isdigit():
+                    args = ["--concurrent-fragments", CONCURRENT_FRAGMENTS] + args
+
+            try:
+                if engine == "inprocess":
+                    # Split downloads are recorded once merged, not per stream
+                    proc = InProcessDownload(args, archive if downloading and not split_merge else None)
+                    if bandwidth_token is not None:
+                        BANDWIDTH.set_apply(bandwidth_token, proc.set_ratelimit)
+                else:
+                    proc = SubprocessDownload(["yt-dlp"] + PROGRESS_ARGS + args)
+            except Exception as e:
+                if bandwidth_token is not None:
+                    BANDWIDTH.unregister(bandwidth_token)
+                if fragments_used is not None:
+                    FRAGMENTS.release(host, fragments_used, None, 0, 0)
+                log.append(f"❌ Launch failed: {e}\n")
+                return None
+
+            watchdog = Watchdog()
+            METRICS.inc("youown_active_downloads")
+            fragment_counts: Dict[str, int] = {}
+            fragment_speeds: List[float] = []
+            fragment_errors = 0
+            finished = False
+            try:
+                for item in proc.lines(tick=WATCHDOG_TICK):
+                    if cancel is not None and cancel.is_set():
+                        proc.kill()
+                        log.append("ERROR: Download cancelled\n")
+                        break
+                    stalled = watchdog.check()
+                    if stalled:
+                        # Worded so classify_failure treats it as transient and the retry path takes over
+                        proc.kill()
+                        log.append(f"ERROR: Watchdog killed yt-dlp, {stalled} (timed out)\n")
+                        break
+                    if item is None:
+                        continue
+                    line, event = item
+                    watchdog.observe(event)
+                    if result_path in line or info_tmpl in line:
+                        # yt-dlp announcing its metadata files, not useful to the user
+                        continue
+                    prog = event.fraction if event else None
+                    log.append(line, is_progress=prog is not None)
+                    if event and on_progress:
+                        on_progress(event)
+                    if event and event.downloaded_bytes is not None and downloading:
+                        # What's on disk no longer needs to be held back in the space reservation
+                        written[event.filename or ""] = event.downloaded_bytes
+                        DISK.written(uid, sum(written.values()))
+                        if not reserved and event.total_bytes:
+                            # Started without a known size: hold the rest of it back from other jobs
+                            sizes[event.filename or ""] = event.total_bytes
+                            DISK.grow(uid, int(sum(sizes.values()) * DISK_SIZE_MARGIN))
+                    if event and event.speed and bandwidth_token is not None:
+                        BANDWIDTH.report(bandwidth_token, event.speed)
+                    if event and event.fragment_count:
+                        fragment_counts[event.filename or ""] = event.fragment_count
+                        if event.speed:
+                            fragment_speeds.append(event.speed)
+                    elif event is None and FRAGMENT_ERRORS.search(line):
+                        fragment_errors += 1
+
+                    # Format and yield the line with progress
+                    if throttle.ready(prog):
+                        yield log.text(), prog if prog is not None else 0.0, True
+                finished = True
+            finally:
+                METRICS.inc("youown_active_downloads", -1)
+                trace.add_phases(watchdog.phase_durations())
+                if bandwidth_token is not None:
+                    # Hands this download's slice back to the others
+                    BANDWIDTH.unregister(bandwidth_token)
+                if fragments_used is not None:
+                    FRAGMENTS.release(
+                        host, fragments_used,
+                        sum(fragment_speeds) / len(fragment_speeds) if fragment_speeds and finished else None,
+                        sum(fragment_counts.values()), fragment_errors
+                    )
+                if not finished:
+                    # The consumer went away (browser disconnect closes the generator): stop yt-dlp
+                    # and remove cookies/temp files here, nothing below will run
+                    proc.kill()
+                    proc.wait(timeout=WATCHDOG_TICK * 5)
+                    clean_temp_files(uid)
+                    trace.finish("cancelled", output=log.text())
+
+            # A killed in-process run may linger until its socket times out
+            return proc.wait(timeout=WATCHDOG_TICK * 5)
+
+        # yt-dlp saves the extracted metadata here for the cache (and the split download)
+        write_info = ["--write-info-json", "--no-write-playlist-metafiles", "-o", f"infojson:{info_tmpl}"]
+        fmt_args = ["-f", split_fmt if split_merge else fmt]
+        info = json.loads(cached_info) if cached_info else None
+        yield f"🚀 Starting download: {url}\n", 0.0, True
+        if DISK_PREFLIGHT and info is None and engine == "inprocess" and not is_collection_url(url.strip()):
+            # Pick the formats first (no media is fetched), then download the chosen streams from
+            # the saved metadata without extracting again; their sizes feed the disk preflight.
+            # Not worth a second yt-dlp process otherwise: the size is then taken from its progress
+            return_code = yield from run(["-f", fmt, "--skip-download"] + write_info + opts + source, downloading=False)
+            if return_code == 0 and os.path.exists(info_file):
+                with open(info_file, encoding="utf-8") as f:
+                    info = json.load(f)
+                chosen = info.get("format_id") or ""
+                if "+" not in chosen:
+                    split_merge = False  # a single combined format, nothing to merge
+                if chosen:
+                    fmt_args = ["-f", chosen.replace("+", ",") if split_merge else chosen]
+                source = ["--load-info-json", info_file]
+                write_info = []
+            else:
+                split_merge = False
+        else:
+            return_code = 0
+        if return_code == 0 and DISK_PREFLIGHT:
+            waited_from = time.monotonic()
+            reserved = expected_space(info)
+            volume = yield from reserve_space(uid, output_volumes(out_dir), reserved, cancel, log)
+            trace.add_phases({"disk_wait": time.monotonic() - waited_from})
+            if volume is None:
+                return_code = 1
+                volume = out_dir
+            elif on_reserve:
+                on_reserve(volume)
+        target = shard_dir(volume)
+        name = f"%(title)s_{uid}.f%(format_id)s.%(ext)s" if split_merge else f"%(title)s_{uid}.%(ext)s"
+        if return_code == 0:
+            cmd = fmt_args + ["-o", os.path.join(target, name), "--print-to-file", RESULT_TEMPLATE, result_path]
+            return_code = yield from run(cmd + (write_info if cache else []) + opts + source)
+        results = read_results(result_path)
+        if return_code == 0 and split_merge and len(results) == 1 and not is_stream_only(results[0]):
+            # The site only offers combined formats: a complete file, nothing to merge
+            results = [unsplit_stream(results[0])]
+            split_merge = False
+        elif return_code == 0 and split_merge and len(results) != 2 and (results or ARCHIVE_SKIP_MARKER not in log.text()):
+            for stream in results:
+                remove_partial(stream.get("filepath"))
+            log.append(f"ERROR: Got {len(results)} file(s), no separate video and audio streams to merge; "
+                       "partial files removed\n")
+            return_code = 1
+        output = log.text()
+        if cookie_session is not None:
+            cookie_session.merge(cookie_path)
+
+        # Cache freshly extracted (or re-resolved) metadata; drop cached metadata that didn't work
+        if cache:
+            refreshed = not cached_info or "The info failed to download" in output
+            if refreshed and len({info.get("id") for info in results}) <= 1 and os.path.exists(info_file):
+                with open(info_file, "rb") as f:
+                    cache.put(cache_key, f.read())
+            elif cached_info and return_code != 0 and classify_failure(output).kind != "permanent":
+                cache.invalidate(cache_key)
+
+        # Clean up temporary files and report completion
+        clean_temp_files(uid)
+        cleaned = True
+        cookie_note = " Cookies securely deleted." if cookie_path and cookie_session is None else ""
+        if return_code == 0 and split_merge and len(results) == 2:
+            queued_at = time.monotonic()
+
+            def finish_merge() -> Tuple[str, bool]:
+                started = time.monotonic()
+                try:
+                    ok, message, merged = merge_streams(results[0], results[1])
+                except Exception as e:
+                    ok, message, merged = False, f"❌ Merge failed: {e}", None
+                finally:
+                    # The streams and the merged file no longer sit side by side
+                    DISK.release(uid)
+                trace.add_phases({"merge_wait": started - queued_at, "merge": time.monotonic() - started})
+                if not ok:
+                    trace.finish("failed", output=message)
+                    return f"{output}\n{message}\n❌ Download Failed.{cookie_note}\n", False
+                record([merged])
+                trace.finish("done", [merged])
+                return f"{output}\n{message}\n✅ Download completed.{cookie_note}\n", True
+
+            future = merge_pool().submit(finish_merge)
+            merging = True
+            if on_merge:
+                # The caller finishes this download when the merge is done; its slot is free now
+                on_merge(future)
+                yield f"{output}\n📦 Streams downloaded, queued for merging\n", 1.0, True
+            else:
+                yield f"{output}\n🔧 Merging video and audio...\n", 1.0, True
+                text, ok = future.result()
+                yield text, 1.0 if ok else 0.0, ok
+        elif return_code == 0:
+            # Success
+            record(results)
+            if not results and ARCHIVE_SKIP_MARKER in output:
+                trace.finish("skipped")
+                yield f"{output}\n⏭️ Already downloaded, skipped.\n", 1.0, True
+            else:
+                trace.finish("done", results)
+                yield f"{output}\n✅ Download completed.{cookie_note}\n", 1.0, True
+        else:
+            # Failure
+            trace.finish("cancelled" if cancel is not None and cancel.is_set() else "failed", output=output)
+            yield f"{output}\n❌ Download Failed.{cookie_note}\n", 0.0, False
+    finally:
+        if not merging:
+            DISK.release(uid)
+        if not cleaned:
+            # Closed (or failed) before the end: don't leave cookies or metadata behind
             clean_temp_files(uid)
+            trace.finish("cancelled" if cancel is not None and cancel.is_set() else "failed")
+
+def download_with_retry(
+    url: str,
+    *args,
+    retries: int = RETRY_LIMIT,
+    **kwargs
+) -> Generator[Tuple[str, float, bool], None, None]:
+    """download_stream that retries transient failures with backoff and fails fast on permanent ones."""
+    # Same file names on every attempt so yt-dlp continues the partial download
+    kwargs["uid"] = kwargs.get("uid") or uuid.uuid4().hex[:8]
+    notes = ""
+    for attempt in range(1, retries + 2):
+        output, success = "", False
+        kwargs["trace"] = JobTrace(url.strip(), attempt=attempt, priority=kwargs.get("priority", "interactive"))
+        for output, progress, success in download_stream(url, *args, **kwargs):
+            yield notes + output, progress, success
+        if download_outcome(output, success) != "failed":
+            return
+
+        failure = classify_failure(output)
+        if not failure.can_retry(attempt, retries):
+            yield f"{notes}{output}💥 {failure.kind.capitalize()} failure: {failure.reason}\n", 0.0, False
             return
-    elif use_cookies and not cookies_txt:
-        yield "❌ Cookie data required but not provided", 0.0, False
+        delay = retry_delay(attempt, failure)
+        notes += f"🔁 Attempt {attempt} failed ({failure.reason}), retrying in {delay:.0f}s\n"
+        yield notes, 0.0, True
+        cancel = kwargs.get("cancel")
+        if cancel is not None and cancel.wait(delay):
+            return
+        if cancel is None:
+            time.sleep(delay)
+
+def is_collection_url(url: str) -> bool:
+    """Whether a link lists many items (playlist, channel, profile) rather than one."""
+    return bool(COLLECTION_URL.search(url))
+
+def expand_collection(
+    url: str,
+    engine: str = DOWNLOAD_ENGINE,
+    cancel: Optional[threading.Event] = None
+) -> Generator[str, None, None]:
+    """Yield the entry URLs of a playlist/channel as yt-dlp pages through it.
+
+    Flat, lazy listing: entries are not extracted, and the first ones arrive before the last
+    page is fetched. Raises RuntimeError with yt-dlp's error when the listing fails.
+    """
+    # The in-process engine may not have the executable, but its module can run as one
+    exe = [sys.executable, "-m", "yt_dlp"] if engine == "inprocess" and load_yt_dlp() else ["yt-dlp"]
+    cmd = exe + ["--flat-playlist", "--lazy-playlist", "--ignore-errors", "--no-warnings",
+                 "--socket-timeout", SOCKET_TIMEOUT or "30", "--print", "%(url,webpage_url|)s", url]
+    listing = SubprocessDownload(cmd)
+    errors: List[str] = []
+    idle_since = time.monotonic()
+    try:
+        for item in listing.lines(tick=WATCHDOG_TICK):
+            if cancel is not None and cancel.is_set():
+                return
+            if item is None:
+                if STALL_TIMEOUT and time.monotonic() - idle_since > STALL_TIMEOUT:
+                    raise RuntimeError(f"Playlist listing stalled for {STALL_TIMEOUT:.0f}s (timed out)")
+                continue
+            idle_since = time.monotonic()
+            line = item[0].strip()
+            if line.startswith(("http://", "https://")):
+                yield line
+            elif line:
+                errors.append(line)
+    finally:
+        listing.kill()
+    if listing.wait(timeout=WATCHDOG_TICK * 5) != 0:
+        raise RuntimeError(errors[-1] if errors else "Playlist listing failed")
+
+def _expand_job(
+    i: int,
+    url: str,
+    add_entry: Callable[[str], bool],
+    events: "queue.Queue[Tuple[int, str, str, float, Optional[str]]]",
+    stop: threading.Event,
+    download_kwargs: dict
+) -> Tuple[str, bool]:
+    """List a playlist/channel job into the batch. Returns (log, success)."""
+    added = 0
+    try:
+        for entry in expand_collection(url, download_kwargs.get("engine", DOWNLOAD_ENGINE), stop):
+            if add_entry(entry):
+                added += 1
+                events.put((i, url, f"📃 Listing playlist: {added} new entries queued", 0.0, None))
+    except (RuntimeError, OSError) as e:
+        return f"📃 Listed {added} new entries\n❌ {e}\n", False
+    return f"📃 Listed {added} new entries\n", not stop.is_set()
+
+def _bulk_worker(
+    scheduler: HostScheduler,
+    jobs: Dict[int, Job],
+    store: Optional[JobStore],
+    events: "queue.Queue[Tuple[int, str, str, float, Optional[str]]]",
+    stop: threading.Event,
+    download_kwargs: dict,
+    speeds: Dict[int, float],
+    attempts: Counter,
+    add_entry: Callable[[str], bool]
+) -> None:
+    """Take URLs from the host scheduler and report every download update as an event.
+
+    Transient failures go back to the scheduler with a backoff delay; permanent ones finish at once.
+    Playlist/channel links are listed instead, and their entries join the batch as they arrive.
+    """
+    while not stop.is_set():
+        next_job = scheduler.next_job()
+        if next_job is None:
+            return
+        i, url, host = next_job
+        try:
+            _bulk_job(i, url, host, scheduler, jobs, store, events, stop, download_kwargs, speeds, attempts,
+                      add_entry)
+        except Exception as e:
+            # One broken job must not kill the worker or leave the batch waiting for its outcome
+            scheduler.release(i)
+            speeds.pop(i, None)
+            error = f"{type(e).__name__}: {e}"
+            if store:
+                try:
+                    store.finish_job(jobs[i].id, "failed", error=error)
+                except sqlite3.Error:
+                    pass
+            events.put((i, url, f"❌ Download Failed: {url}\n💥 Unexpected error: {error}\n", 1.0, "failed"))
+
+def _bulk_job(
+    i: int,
+    url: str,
+    host: str,
+    scheduler: HostScheduler,
+    jobs: Dict[int, Job],
+    store: Optional[JobStore],
+    events: "queue.Queue[Tuple[int, str, str, float, Optional[str]]]",
+    stop: threading.Event,
+    download_kwargs: dict,
+    speeds: Dict[int, float],
+    attempts: Counter,
+    add_entry: Callable[[str], bool]
+) -> None:
+    """Run one job taken from the scheduler (holding a slot for host) and post its events."""
+    job = jobs[i]
+
+    if is_collection_url(url):
+        # Listing is a few light page requests; free the host slot for the entries at once
+        scheduler.release(i)
+        scheduler.start_feeding()
+        attempts[i] += 1
+        if store:
+            store.start_job(job.id)
+        try:
+            output, listed = _expand_job(i, url, add_entry, events, stop, download_kwargs)
+        finally:
+            scheduler.stop_feeding()
+        if stop.is_set():
+            if store:
+                store.finish_job(job.id, "pending")
+            return
+        if not listed:
+            failure = classify_failure(output)
+            if failure.can_retry(attempts[i]):
+                delay = retry_delay(attempts[i], failure)
+                if store:
+                    store.finish_job(job.id, "pending", error=failure.reason)
+                events.put((i, url, f"🔁 Listing failed ({failure.reason}), retrying in {delay:.0f}s", 0.0, None))
+                scheduler.retry(i, url, delay)
+                return
+        if store:
+            store.finish_job(job.id, "expanded" if listed else "failed", error=None if listed else _last_line(output))
+        events.put((i, url, output, 1.0, "expanded" if listed else "failed"))
+        return
+
+    cookie_session = download_kwargs.get("cookie_session")
+    rejected = cookie_session.rejected(host) if cookie_session else None
+    if rejected:
+        # The site keeps refusing this batch's cookies; don't spend requests proving it again
+        scheduler.release(i)
+        error = f"Cookies rejected by {host}: {rejected}"
+        if store:
+            store.finish_job(job.id, "failed", error=error)
+        events.put((i, url, f"❌ Not attempted: {url}\n💥 {error}\n", 1.0, "failed"))
         return
+
+    def track_speed(event: ProgressEvent, i: int = i) -> None:
+        if event.phase == "download" and event.status == "downloading" and event.speed:
+            speeds[i] = event.speed
+
+    results: List[dict] = []
+    merges: List[Future] = []
+    output = ""
+    download_success = False
+    attempts[i] += 1
+    queue_wait = scheduler.queue_wait(i)
+    trace = JobTrace(url, attempt=attempts[i], queue_wait=queue_wait,
+                     priority=download_kwargs.get("priority", "bulk"))
+    if job.volume:
+        # Resumed: its partial files are on the volume an earlier run picked
+        DISK.prefer(job.uid, job.volume)
+    if store:
+        store.start_job(job.id)
+    try:
+        for output, progress, download_success in download_stream(
+            url, on_progress=track_speed, uid=job.uid, on_complete=results.extend, cancel=stop,
+            on_merge=merges.append, trace=trace,
+            on_reserve=(lambda volume: store.set_volume(job.id, volume)) if store else None, **download_kwargs
+        ):
+            events.put((i, url, output, progress, None))
+            if stop.is_set():
+                break
+    finally:
+        scheduler.release(i)
+        speeds.pop(i, None)
+
+    if merges:
+        # The streams are on disk; the merge pool finishes this URL while the worker moves on
+        def finish_merged(future: Future, i: int = i, url: str = url, job: Job = job,
+                          results: List[dict] = results, host: str = host) -> None:
+            # Exceptions in a done callback are swallowed, so the batch must get an outcome anyway
+            output, outcome = "", "failed"
+            try:
+                output, success = future.result()
+                outcome = download_outcome(output, success)
+                if cookie_session:
+                    cookie_session.report(host, outcome, output)
+                if store:
+                    output_path = results[-1].get("filepath") if results else None
+                    store.finish_job(job.id, outcome, output_path, None if success else _last_line(output))
+            except Exception as e:
+                output, outcome = f"{output}\n❌ Merge failed: {e}\n", "failed"
+            finally:
+                events.put((i, url, output, 1.0, outcome))
+
+        merges[0].add_done_callback(finish_merged)
+        return
+
+    outcome = download_outcome(output, download_success)
+    if cookie_session:
+        cookie_session.report(host, outcome, output)
+    if outcome == "failed" and stop.is_set():
+        # Interrupted, not failed: leave it for the next resume
+        if store:
+            store.finish_job(job.id, "pending")
+        return
+
+    error = None
+    if outcome == "failed":
+        failure = classify_failure(output)
+        error = failure.reason
+        if failure.can_retry(attempts[i]):
+            delay = retry_delay(attempts[i], failure)
+            if store:
+                store.finish_job(job.id, "pending", error=error)
+            events.put((i, url, f"🔁 Attempt {attempts[i]} failed ({error}), retrying in {delay:.0f}s", 0.0, None))
+            scheduler.retry(i, url, delay)
+            return
+        output += f"💥 {failure.kind.capitalize()} failure: {error}\n"
+
+    if store:
+        output_path = results[-1].get("filepath") if results else None
+        store.finish_job(job.id, outcome, output_path, error)
+
+    # Final event for this URL carries the outcome
+    events.put((i, url, output, 1.0, outcome))
+
+def download_outcome(output: str, success: bool) -> str:
+    """Classify a finished download_stream run as "done", "skipped" or "failed"."""
+    if success and "⏭️ Already downloaded" in output:
+        return "skipped"
+    if success and "✅ Download completed" in output:
+        return "done"
+    return "failed"
+
+def _last_line(text: str) -> str:
+    """Return the last non-empty line of a download log."""
+    lines = text.strip().splitlines()
+    return lines[-1] if lines else ""
+
+def owner_gone(owner: str, heartbeat: Optional[float]) -> bool:
+    """Whether the process that owns a batch ("host:pid") has stopped: no heartbeat for
+    LEASE_SECONDS, or, on this machine, its PID no longer exists."""
+    if heartbeat is None or heartbeat < time.time() - LEASE_SECONDS:
+        return True
+    host, _, pid = owner.rpartition(":")
+    # Signal 0 only probes on POSIX; on Windows os.kill would terminate the process
+    if os.name == "nt" or host != socket.gethostname() or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass  # exists, owned by another user
+    return False
+
+def hold_batch(store: JobStore, batch_id: str) -> threading.Event:
+    """Heartbeat this process's ownership of a batch until the returned event is set."""
+    done = threading.Event()
+
+    def beat() -> None:
+        while not done.wait(HEARTBEAT_INTERVAL):
+            try:
+                store.beat_batch(batch_id)
+            except sqlite3.Error:
+                pass
+        try:
+            store.release_batch(batch_id)
+        except sqlite3.Error:
+            pass
+
+    threading.Thread(target=beat, daemon=True).start()
+    return done
+
+def open_job_store(path: str = JOB_DB_PATH) -> Optional[JobStore]:
+    """Open the durable job queue, or None (batches still run, just not resumable)."""
+    try:
+        return JobStore(path)
+    except (sqlite3.Error, OSError):
+        return None
+
+_active_batches = set()
+_active_batches_lock = threading.Lock()
+
+def _run_batch(
+    store: Optional[JobStore],
+    batch_id: Optional[str],
+    job_list: List[Job],
+    download_kwargs: dict,
+    max_workers: int,
+    header: str,
+    cancel: Optional[threading.Event] = None,
+    feed: Optional[Iterable[str]] = None
+) -> Generator[Tuple[str, float], None, Optional[BatchResult]]:
+    """Run a batch of jobs concurrently, yielding (log, overall progress) and then the summary.
+
+    URLs from feed (e.g. a large list file, read lazily) join the batch as they are read.
+    Setting cancel (or closing the generator) kills the running downloads and leaves them pending.
+    Returns the BatchResult once the summary has been yielded.
+    """
+    total_urls = len(job_list)
+    jobs = {i: job for i, job in enumerate(job_list, 1)}
+    expanding = feed is not None or any(is_collection_url(job.url) for job in job_list)
+    # A playlist or list file grows the batch, so it gets the full worker pool
+    workers = max(1, min(int(max_workers or 1), MAX_WORKERS_LIMIT, total_urls if not expanding else MAX_WORKERS_LIMIT))
+    scheduler = HostScheduler((i, job.url) for i, job in jobs.items())
+    if feed is not None:
+        header += f"🔄 Processing {total_urls} URLs and reading the list file(s), downloads start as links are read ({workers} parallel)\n"
+    else:
+        header += f"🔄 Processing {total_urls} URLs from {len(scheduler.pending)} sites ({workers} parallel)\n"
+    yield header, 0.0
     
-    # Add extra arguments if provided
-    if extra_args and extra_args.strip():
-        cmd += extra_args.split()
+    successful_downloads = 0
+    skipped_downloads = 0
+    failed_downloads = 0
+    expanded_lists = 0
+    failed_urls = []
+
+    events: "queue.Queue[Tuple[int, str, str, float, Optional[str]]]" = queue.Queue()
+    stop = cancel if cancel is not None else threading.Event()
+    speeds: Dict[int, float] = {}
+    attempts: Counter = Counter()
+
+    # Links already in this batch (also from before a resume) are not queued again; 8-byte
+    # fingerprints of their canonical IDs keep this small for very large lists. They are stored
+    # with the jobs, since working one out can take milliseconds (yt-dlp's extractor matching)
+    earlier = store.batch_digests(batch_id) if store and batch_id else set()
+    seen = earlier | {url_digest(job.url) if job.digest is None else job.digest for job in job_list}
+    jobs_lock = threading.Lock()
+    next_position = [max((job.position for job in job_list), default=0)]
+    duplicates = [0]
+
+    def add_entries(urls: List[str]) -> int:
+        """Queue the links not in the batch yet (one job-store write per call); returns how many."""
+        keys = [url_digest(url) for url in urls]
+        with jobs_lock:
+            fresh = []
+            for url, key in zip(urls, keys):
+                if key in seen:
+                    if key not in earlier:  # re-read on resume, not a duplicate
+                        duplicates[0] += 1
+                    continue
+                seen.add(key)
+                next_position[0] += 1
+                fresh.append((next_position[0], url, key))
+            if store and batch_id:
+                new_jobs = store.add_jobs(batch_id, fresh) if fresh else []
+            else:
+                new_jobs = [Job(0, position, url, uuid.uuid4().hex[:8], 0, digest=key) for position, url, key in fresh]
+            added = []
+            for job in new_jobs:
+                i = len(jobs) + 1
+                jobs[i] = job
+                added.append((i, job.url))
+        for i, url in added:
+            # Announced before the scheduler can hand it out, so the total is never behind
+            events.put((i, url, "", 0.0, "queued"))
+            scheduler.add(i, url)
+        return len(added)
+
+    def add_entry(url: str) -> bool:
+        return add_entries([url]) == 1
+
+    def feed_batch() -> None:
+        chunk: List[str] = []
+        flushed = 0.0
+        error = ""
+        try:
+            for url in feed:
+                if stop.is_set():
+                    break
+                chunk.append(url)
+                if len(chunk) >= INGEST_CHUNK or time.monotonic() - flushed >= INGEST_FLUSH_INTERVAL:
+                    add_entries(chunk)
+                    chunk, flushed = [], time.monotonic()
+            if chunk and not stop.is_set():
+                add_entries(chunk)
+        except (OSError, UnicodeError) as e:
+            error = f"❌ Reading the URL list failed: {e}"
+        finally:
+            scheduler.stop_feeding()
+            # Queued after every "queued" event of this feed, so the batch can't end before them
+            events.put((0, "", error, 0.0, "fed"))
+
+    feeding = feed is not None
+    if feeding:
+        scheduler.start_feeding()
+        threading.Thread(target=feed_batch, daemon=True).start()
+
+    for _ in range(workers):
+        threading.Thread(
+            target=_bulk_worker,
+            args=(scheduler, jobs, store, events, stop, download_kwargs, speeds, attempts, add_entry),
+            daemon=True
+        ).start()
+
+    # Per-URL progress is merged into one overall fraction
+    progress_by_url: Dict[int, float] = {}
+    progress_sum = 0.0
+    active = {}
+    finished_lines = LogBuffer()
+    finished = 0
+    throttle = UpdateThrottle()
+    # Tells other processes (a restarted UI, the API) that this batch is running here
+    held = hold_batch(store, batch_id) if store and batch_id else None
+
+    try:
+        while feeding or finished < total_urls:
+            try:
+                i, url, output, progress, result = events.get(timeout=WATCHDOG_TICK)
+            except queue.Empty:
+                if stop.is_set():
+                    return
+                continue
+            if result == "queued":
+                total_urls += 1
+                continue
+            if result == "fed":
+                feeding = False
+                if output:
+                    finished_lines.append(output)
+                continue
+            progress_sum += progress - progress_by_url.get(i, 0.0)
+            progress_by_url[i] = progress
+
+            if result is None:
+                active[i] = _last_line(output)
+            else:
+                finished += 1
+                active.pop(i, None)
+                # Track success/failure
+                if result == "expanded":
+                    expanded_lists += 1
+                    finished_lines.append(f"[{i}/{total_urls}] 📃 {url} ({_last_line(output)[2:]})")
+                elif result == "done":
+                    successful_downloads += 1
+                    finished_lines.append(f"[{i}/{total_urls}] ✅ {url}")
+                elif result == "skipped":
+                    skipped_downloads += 1
+                    finished_lines.append(f"[{i}/{total_urls}] ⏭️ {url} (already downloaded)")
+                else:
+                    failed_downloads += 1
+                    failed_urls.append(f"{url} — {_last_line(output)}")
+                    finished_lines.append(f"[{i}/{total_urls}] ❌ {url}\n    {_last_line(output)}")
+
+            overall_progress = progress_sum / max(1, total_urls)
+            if result is None and not throttle.ready(overall_progress):
+                continue
+            running = "".join(f"[{n}/{total_urls}] {line}\n" for n, line in sorted(active.items()))
+            speed = f"⚡ {format_bytes(sum(speeds.values()))}/s across {len(active)} active\n" if active else ""
+            yield header + speed + finished_lines.text() + running, overall_progress
+    finally:
+        # Stops workers from picking up new URLs if the caller goes away
+        stop.set()
+        scheduler.close()
+        if store and batch_id and not feeding:
+            # A list file that wasn't read to the end is read again on resume
+            store.finish_batch(batch_id)
+        if held:
+            held.set()
     
-    # Add URL
-    cmd.append(url)
+    result = BatchResult(
+        total_urls - expanded_lists, successful_downloads, skipped_downloads, failed_downloads,
+        sum(attempts.values()) - len(attempts), failed_urls
+    )
+    yield batch_summary(result, expanded_lists, duplicates[0]), 1.0
+    return result
+
+def batch_summary(result: BatchResult, expanded_lists: int = 0, duplicates: int = 0) -> str:
+    """The summary text that ends a bulk batch's log."""
+    summary = f"\n📊 BULK DOWNLOAD SUMMARY:\n"
+    summary += f"Total URLs: {result.total}\n"
+    if expanded_lists:
+        summary += f"📃 Playlists/channels listed: {expanded_lists}\n"
+    summary += f"✅ Succeeded: {result.succeeded}\n"
+    summary += f"⏭️ Skipped (already downloaded): {result.skipped}\n"
+    summary += f"❌ Failed: {result.failed}\n"
+    summary += f"🔁 Retries: {result.retries}\n"
+    if duplicates:
+        summary += f"♊ Duplicate links ignored: {duplicates}\n"
+    
+    if result.failed_urls:
+        summary += f"\n❌ Failed URLs:\n"
+        for failed_url in result.failed_urls:
+            summary += f"• {failed_url}\n"
     
-    # Execute command
+    summary += f"\n✅ Bulk download process completed!\n"
+    return summary
+
+def _watch_distributed_batch(
+    store: JobStore,
+    batch_id: str,
+    header: str,
+    cancel: Optional[threading.Event] = None,
+    feed: Optional[Iterable[str]] = None
+) -> Generator[Tuple[str, float], None, Optional[BatchResult]]:
+    """Follow a distributed batch that worker nodes run, yielding (log, overall progress) like _run_batch.
+
+    URLs from feed are queued as they are read. Cancelling pauses the batch: nodes stop its
+    jobs and hand them back, and resuming continues it.
+    """
+    stop = cancel if cancel is not None else threading.Event()
+    feeding = [feed is not None]
+    duplicates = [0]
+    feed_error: List[str] = []
+
+    def feed_batch() -> None:
+        # Links the batch already has, e.g. the list file read again on resume, are not queued again
+        earlier = store.batch_digests(batch_id)
+        seen = set(earlier)
+        chunk: List[Tuple[str, int]] = []
+        flushed = 0.0
+        try:
+            for url in feed:
+                if stop.is_set():
+                    return
+                key = url_digest(url)
+                if key in seen:
+                    if key not in earlier:  # re-read on resume, not a duplicate
+                        duplicates[0] += 1
+                    continue
+                seen.add(key)
+                chunk.append((url, key))
+                if len(chunk) >= INGEST_CHUNK or time.monotonic() - flushed >= INGEST_FLUSH_INTERVAL:
+                    store.append_jobs(batch_id, chunk)
+                    chunk, flushed = [], time.monotonic()
+            if chunk:
+                store.append_jobs(batch_id, chunk)
+            feeding[0] = False
+        except (OSError, UnicodeError, sqlite3.Error) as e:
+            feed_error.append(f"❌ Reading the URL list failed: {e}")
+            feeding[0] = False
+
+    if feed is not None:
+        threading.Thread(target=feed_batch, daemon=True).start()
+
+    finished_lines = LogBuffer()
+    failed_urls: List[str] = []
+    last_seq = 0
+    throttle = UpdateThrottle()
+    completed = False
+    held = hold_batch(store, batch_id)
     try:
-        yield f"🚀 Starting download: {url}\n", 0.0, True
-        proc = subprocess.Popen(
-            cmd, 
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT, 
-            text=True,
-            bufsize=1
-        )
-    except Exception as e:
-        yield f"❌ Launch failed: {e}", 0.0, False
-        clean_temp_files(uid)
-        return
+        while not stop.is_set():
+            reading = feeding[0]
+            counts, retries, finished, running = store.batch_snapshot(batch_id, last_seq)
+            total = sum(counts.values())
+            for seq, position, url, state, error, log in finished:
+                last_seq = seq
+                if state == "expanded":
+                    finished_lines.append(f"[{position}/{total}] 📃 {url} ({log or 'listed'})")
+                elif state == "done":
+                    finished_lines.append(f"[{position}/{total}] ✅ {url}")
+                elif state == "skipped":
+                    finished_lines.append(f"[{position}/{total}] ⏭️ {url} (already downloaded)")
+                else:
+                    failed_urls.append(f"{url} — {error or log or 'failed'}")
+                    finished_lines.append(f"[{position}/{total}] ❌ {url}\n    {error or log or ''}")
+            for line in feed_error:
+                finished_lines.append(line)
+            feed_error.clear()
+
+            done = total - counts["pending"] - counts["running"]
+            progress = (done + sum(row[3] for row in running)) / max(1, total)
+            nodes = store.live_nodes()
+            if not reading and total and done == total:
+                completed = True
+                break
+            if throttle.ready(progress) or finished:
+                node_line = (f"🖧 {len(nodes)} worker node(s): " + ", ".join(f"{node} ({n})" for node, n in nodes) + "\n"
+                             if nodes else "⏳ Waiting for worker nodes (python app.py worker)\n")
+                active = "".join(f"[{position}/{total}] {node}: {log or 'starting'}\n"
+                                 for position, url, node, fraction, log in running)
+                yield header + node_line + finished_lines.text() + active, progress
+            stop.wait(NODE_POLL_INTERVAL)
+    finally:
+        held.set()
+        if completed:
+            store.finish_batch(batch_id)
+        else:
+            # Closed or cancelled: nodes give the running jobs back, resume continues the batch
+            store.set_batch_state(batch_id, "paused")
+    if not completed:
+        return None
+
+    counts, retries, _, _ = store.batch_snapshot(batch_id, last_seq)
+    result = BatchResult(
+        sum(counts.values()) - counts["expanded"], counts["done"], counts["skipped"], counts["failed"],
+        retries, failed_urls
+    )
+    yield batch_summary(result, counts["expanded"], duplicates[0]), 1.0
+    return result
+
+class WorkerNode:
+    """Runs the leased jobs of distributed batches on this machine (python app.py worker).
+
+    Per-site limits apply per node, as each node usually has its own address. A heartbeat thread
+    extends the leases and reports progress; jobs the node lost or whose batch was paused are stopped.
+    """
+
+    def __init__(self, store: JobStore, workers: int = DEFAULT_MAX_WORKERS, node_id: Optional[str] = None,
+                 out_dir: Optional[str] = None) -> None:
+        self.store = store
+        self.workers = max(1, min(int(workers), MAX_WORKERS_LIMIT))
+        self.id = node_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.out_dir = out_dir
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+        self.cancels: Dict[int, threading.Event] = {}
+        self.progress: Dict[int, Tuple[float, str]] = {}
+        self.running: Counter = Counter()
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.finished: Counter = Counter()
 
-    # Stream progress
-    output = ""
-    if proc.stdout:
-        for line in proc.stdout:
-            output += line
-            # Extract progress percentage
-            m = re.search(r"\[download\]\s+([0-9.]+)%", line)
-            prog = float(m.group(1))/100 if m else None
-            
-            # Format and yield the line with progress
-            if prog is not None:
-                yield output, prog, True
+    def _allowed(self, url: str) -> bool:
+        host = host_key(url)
+        concurrency, per_minute = HOST_LIMITS.get(host, DEFAULT_HOST_LIMIT)
+        bucket = self.buckets.setdefault(host, TokenBucket(per_minute, concurrency))
+        return self.running[host] < concurrency and bucket.delay() == 0
+
+    def _lease(self) -> Optional[Tuple[Job, str, dict]]:
+        # One lease at a time per node, so the per-site caps hold
+        with self.lock:
+            leased = self.store.lease_job(self.id, self._allowed)
+            if leased:
+                host = host_key(leased[0].url)
+                self.running[host] += 1
+                self.buckets[host].take()
+                self.cancels[leased[0].id] = threading.Event()
+                self.progress[leased[0].id] = (0.0, "🚀 Starting")
+        return leased
+
+    def _warn(self, message: str) -> None:
+        """Node problems go to stderr, apart from the stdout status lines of run_worker_node."""
+        print(f"⚠️ {self.id}: {message}", file=sys.stderr, flush=True)
+
+    def _set_progress(self, job_id: int, fraction: float, line: str) -> None:
+        with self.lock:
+            if job_id in self.progress:
+                self.progress[job_id] = (fraction, line)
+
+    def _heartbeat(self) -> None:
+        while not self.stop.wait(HEARTBEAT_INTERVAL):
+            with self.lock:
+                progress = dict(self.progress)
+            try:
+                lost = self.store.heartbeat(self.id, progress)
+            except sqlite3.Error as e:
+                self._warn(f"Heartbeat failed: {e}")
+                continue
+            with self.lock:
+                for job_id in lost:
+                    if job_id in self.cancels:
+                        self.cancels[job_id].set()
+
+    def _work(self) -> None:
+        while not self.stop.is_set():
+            try:
+                leased = self._lease()
+            except sqlite3.Error as e:
+                self._warn(f"Queue unavailable: {e}")
+                leased = None
+            if leased is None:
+                self.stop.wait(NODE_POLL_INTERVAL)
+                continue
+            self._run_job(*leased)
+
+    def _expand(self, job: Job, batch_id: str, download_kwargs: dict, cancel: threading.Event) -> Tuple[str, str]:
+        """List a playlist/channel job into the shared batch. Returns (outcome, log line)."""
+        seen = self.store.batch_digests(batch_id)
+        chunk: List[Tuple[str, int]] = []
+        added = 0
+        flushed = time.monotonic()
+        try:
+            for entry in expand_collection(job.url, download_kwargs.get("engine", DOWNLOAD_ENGINE), cancel):
+                key = url_digest(entry)
+                if key in seen:
+                    continue
+                seen.add(key)
+                chunk.append((entry, key))
+                if len(chunk) >= INGEST_CHUNK or time.monotonic() - flushed >= INGEST_FLUSH_INTERVAL:
+                    self.store.append_jobs(batch_id, chunk)
+                    added, chunk, flushed = added + len(chunk), [], time.monotonic()
+                    self._set_progress(job.id, 0.0, f"📃 Listing playlist: {added} new entries queued")
+            if chunk:
+                self.store.append_jobs(batch_id, chunk)
+                added += len(chunk)
+        except (RuntimeError, OSError) as e:
+            return "failed", f"📃 Listed {added} new entries\nERROR: {e}"
+        return "expanded", f"listed {added} new entries"
+
+    def _run_job(self, job: Job, batch_id: str, options: dict) -> None:
+        cancel = self.cancels[job.id]
+        results: List[dict] = []
+        output = ""
+        try:
+            download_kwargs = _batch_download_kwargs(options, "")
+            if self.out_dir:
+                download_kwargs["out_dir"] = self.out_dir
+            if is_collection_url(job.url):
+                outcome, output = self._expand(job, batch_id, download_kwargs, cancel)
             else:
-                yield output, 0.0, True
-    
-    # Wait for process to complete
-    return_code = proc.wait()
-    
-    # Clean up temporary files and report completion
-    if return_code == 0:
-        # Success
-        if cookie_path:
-            clean_temp_files(uid)
-            yield f"{output}\n✅ Download completed. Cookies securely deleted.\n", 1.0, True
-        else:
-            yield f"{output}\n✅ Download completed.\n", 1.0, True
-    else:
-        # Failure
-        if cookie_path:
-            clean_temp_files(uid)
-            yield f"{output}\n❌ Download Failed. Cookies securely deleted.\n", 0.0, False
-        else:
-            yield f"{output}\n❌ Download Failed.\n", 0.0, False
+                success = False
+                for output, fraction, success in download_stream(
+                    job.url, uid=job.uid, on_complete=results.extend, cancel=cancel,
+                    trace=JobTrace(job.url, attempt=job.attempts, priority="bulk"), **download_kwargs
+                ):
+                    self._set_progress(job.id, fraction, _last_line(output))
+                outcome = download_outcome(output, success)
+
+            if cancel.is_set() or self.stop.is_set():
+                # Lease lost, batch paused, or this node is shutting down
+                self.store.release_job(job.id, self.id)
+                return
+            error = None
+            if outcome == "failed":
+                failure = classify_failure(output)
+                if failure.can_retry(job.attempts):
+                    self.store.release_job(job.id, self.id, retry_delay(job.attempts, failure), failure.reason)
+                    return
+                error = failure.reason
+            output_path = results[-1].get("filepath") if results else None
+            if self.store.finish_leased(job.id, self.id, outcome, output_path, error, _last_line(output)):
+                self.finished[outcome] += 1
+        except sqlite3.Error as e:
+            # The lease runs out and another node picks the job up
+            self._warn(f"Couldn't report job {job.id}: {e}")
+        except Exception as e:
+            # A broken job must not take this worker thread (and its share of the node) down
+            self._warn(f"Job {job.id} failed unexpectedly: {e}")
+            try:
+                if self.store.finish_leased(job.id, self.id, "failed", error=f"{type(e).__name__}: {e}",
+                                            log=_last_line(output)):
+                    self.finished["failed"] += 1
+            except sqlite3.Error:
+                pass
+        finally:
+            with self.lock:
+                self.cancels.pop(job.id, None)
+                self.progress.pop(job.id, None)
+                self.running[host_key(job.url)] -= 1
+
+    def run(self) -> None:
+        """Work until stop is set, then hand the unfinished jobs back to the queue."""
+        self.store.heartbeat(self.id, {})
+        threads = [threading.Thread(target=self._heartbeat, daemon=True)]
+        threads += [threading.Thread(target=self._work, daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads[1:]):
+                self.stop.wait(1.0)
+        finally:
+            self.stop.set()
+            with self.lock:
+                for event in self.cancels.values():
+                    event.set()
+            for thread in threads[1:]:
+                thread.join(timeout=WATCHDOG_TICK * 10)
+            self.store.stop_node(self.id)
 
 def bulk_wrapper(
     urls: str, 
@@ -215,107 +3612,895 @@ def bulk_wrapper(
     video_only: bool, 
     extra_args: str, 
     use_cookies: bool, 
-    cookies_txt: str
-) -> Generator[Tuple[str, float], None, None]:
-    """Process multiple URLs from a list with success/failure tracking."""
+    cookies_txt: str,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    skip_duplicates: bool = True,
+    cancel: Optional[threading.Event] = None,
+    url_files: Iterable[str] = (),
+    distributed: bool = False
+) -> Generator[Tuple[str, float], None, Optional[BatchResult]]:
+    """Process multiple URLs concurrently with success/failure tracking.
+
+    Every URL is recorded in the durable job queue first, so an interrupted batch can be resumed.
+    url_files (one URL per line, "-" for stdin) are read as a stream while the batch runs.
+    A distributed batch goes to the shared queue and is run by worker nodes instead of here.
+    """
     if audio_only and video_only:
         yield "❌ Cannot select both 'Audio Only' and 'Video Only'", 0.0
         return
 
-    if not urls or not urls.strip():
+    url_files = [path if path == "-" else os.path.abspath(path) for path in url_files or () if path]
+    missing = [path for path in url_files if path != "-" and not os.path.isfile(path)]
+    if missing:
+        yield f"❌ URL list file not found: {missing[0]}", 0.0
+        return
+
+    if (not urls or not urls.strip()) and not url_files:
         yield "❌ URL list cannot be empty!", 0.0
         return
         
-    url_list = [line.strip() for line in urls.splitlines() if line.strip()]
-    total_urls = len(url_list)
+    # Same video twice (short link, tracking parameters...) is only downloaded once. The digests
+    # are kept with the jobs so nothing works them out again
+    lines = [line.strip() for line in (urls or "").splitlines() if line.strip()]
+    if len(lines) > INGEST_CHUNK:
+        yield f"🔍 Checking {len(lines)} links for duplicates...", 0.0
+    url_list, digests, seen, duplicates = [], [], set(), 0
+    for url in lines:
+        key = url_digest(url)
+        if key in seen:
+            duplicates += 1
+            continue
+        seen.add(key)
+        url_list.append(url)
+        digests.append(key)
+    entries = [(i, url, key) for i, (url, key) in enumerate(zip(url_list, digests), 1)]
     
-    if total_urls == 0:
+    if len(url_list) == 0 and not url_files:
         yield "❌ No valid URLs found!", 0.0
         return
-    
-    yield f"🔄 Processing {total_urls} URLs\n", 0.0
-    
-    successful_downloads = 0
-    failed_downloads = 0
-    failed_urls = []
-    
-    for i, url in enumerate(url_list, 1):
-        yield f"\n[{i}/{total_urls}] Processing: {url}\n", (i-1)/total_urls
-        
-        # Get generator for single download
-        download_gen = download_stream(
-            url, out_dir, audio_only, video_only, 
-            extra_args, use_cookies, cookies_txt
+
+    if distributed:
+        if use_cookies:
+            yield "❌ Cookies are never sent to worker nodes; run this batch without Distribute", 0.0
+            return
+        store = open_job_store(QUEUE_DB_PATH)
+        if store is None:
+            yield f"❌ Shared queue unavailable: {QUEUE_DB_PATH}", 0.0
+            return
+        options = dict(
+            out_dir=out_dir, audio_only=audio_only, video_only=video_only, extra_args=extra_args,
+            use_cookies=False, skip_duplicates=skip_duplicates, max_workers=max_workers,
+            url_files=[path for path in url_files if path != "-"]
         )
-        
-        # Process output from the generator
-        output = ""
-        download_success = False
-        for line, progress, success in download_gen:
-            # Calculate overall progress
-            overall_progress = ((i-1) + progress) / total_urls
-            output = line
-            download_success = success
-            yield f"[{i}/{total_urls}] {output}", overall_progress
-        
-        # Track success/failure
-        if download_success and "✅ Download completed" in output:
-            successful_downloads += 1
-        else:
-            failed_downloads += 1
-            failed_urls.append(url)
-    
-    # Final summary
-    summary = f"\n📊 BULK DOWNLOAD SUMMARY:\n"
-    summary += f"Total URLs: {total_urls}\n"
-    summary += f"✅ Succeeded: {successful_downloads}\n"
-    summary += f"❌ Failed: {failed_downloads}\n"
-    
-    if failed_urls:
-        summary += f"\n❌ Failed URLs:\n"
-        for failed_url in failed_urls:
-            summary += f"• {failed_url}\n"
-    
-    summary += f"\n✅ Bulk download process completed!\n"
-    
-    yield summary, 1.0
+        batch_id = store.create_batch(options, distributed=True)
+        store.add_jobs(batch_id, entries)
+        header = f"🖧 Distributed batch {batch_id}: {len(url_list)} URLs queued for worker nodes"
+        header += ", more as the list file(s) are read\n" if url_files else "\n"
+        if duplicates:
+            header += f"♊ {duplicates} duplicate link(s) ignored\n"
+        with _active_batches_lock:
+            _active_batches.add(batch_id)
+        try:
+            return (yield from _watch_distributed_batch(
+                store, batch_id, header, cancel, iter_url_files(url_files) if url_files else None
+            ))
+        finally:
+            with _active_batches_lock:
+                _active_batches.discard(batch_id)
 
-def generate_tunnel(port: str) -> str:
-    """Generate a Cloudflare tunnel for remote access."""
-    if not port or not port.strip() or not port.isdigit():
-        return "❌ Invalid port number"
-    
-    cmd = ["cloudflared", "tunnel", "--url", f"http://localhost:{port}", "--no-autoupdate"]
-    
+    # One validated cookie jar for the whole batch instead of a temp file per link
+    cookie_session = None
+    if use_cookies:
+        if not cookies_txt or not cookies_txt.strip():
+            yield "❌ Cookie data required but not provided", 0.0
+            return
+        try:
+            cookie_session = CookieSession(cookies_txt)
+        except ValueError as e:
+            yield f"❌ Invalid cookies: {e}", 0.0
+            return
+
+    options = dict(
+        out_dir=out_dir, audio_only=audio_only, video_only=video_only, extra_args=extra_args,
+        use_cookies=use_cookies, skip_duplicates=skip_duplicates, max_workers=max_workers,
+        url_files=[path for path in url_files if path != "-"]
+    )
+    header = cookie_session.describe(url_list) if cookie_session else ""
+    if duplicates:
+        header += f"♊ {duplicates} duplicate link(s) ignored\n"
+    store = open_job_store()
+    batch_id = None
+    if store:
+        batch_id = store.create_batch(options)
+        job_list = store.add_jobs(batch_id, entries)
+    else:
+        header += "⚠️ Job queue unavailable, this batch can't be resumed if interrupted\n"
+        job_list = [Job(0, i, url, uuid.uuid4().hex[:8], 0, digest=key) for i, url, key in entries]
+
+    with _active_batches_lock:
+        _active_batches.add(batch_id)
+    download_kwargs = _batch_download_kwargs(options, cookies_txt)
+    if cookie_session:
+        download_kwargs["cookie_session"] = cookie_session
     try:
-        proc = subprocess.Popen(
-            cmd, 
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT, 
-            text=True
+        return (yield from _run_batch(
+            store, batch_id, job_list, download_kwargs, max_workers, header, cancel,
+            iter_url_files(url_files) if url_files else None
+        ))
+    finally:
+        with _active_batches_lock:
+            _active_batches.discard(batch_id)
+        if cookie_session:
+            cookie_session.close()
+
+def _batch_download_kwargs(options: dict, cookies_txt: str) -> dict:
+    """download_stream keyword arguments for a batch's stored options."""
+    return dict(
+        out_dir=options["out_dir"], audio_only=options["audio_only"], video_only=options["video_only"],
+        extra_args=options["extra_args"], use_cookies=options["use_cookies"], cookies_txt=cookies_txt,
+        skip_duplicates=options.get("skip_duplicates", True), priority="bulk"
+    )
+
+def resume_unfinished_batches(cancel: Optional[threading.Event] = None) -> Generator[Tuple[str, float], None, None]:
+    """Resume every bulk batch that was interrupted by a crash, restart or disconnect."""
+    store = open_job_store()
+    if store is None:
+        yield "❌ Job queue unavailable", 0.0
+        return
+    store.prune()
+
+    resumed = busy = 0
+    for batch_id, options in store.unfinished_batches():
+        with _active_batches_lock:
+            if batch_id in _active_batches:
+                continue
+            _active_batches.add(batch_id)
+        try:
+            if not store.claim_batch(batch_id):
+                busy += 1  # still running in another process (CLI, API, another UI)
+                continue
+            job_list = store.unfinished_jobs(batch_id)
+            if options.get("use_cookies"):
+                # Cookies are never stored, so these jobs can't run unattended
+                for job in job_list:
+                    store.finish_job(job.id, "failed", error="Cookies are not stored; run this link again with cookies")
+                store.finish_batch(batch_id)
+                continue
+            # A list file the batch didn't finish reading is read again; queued links are skipped
+            url_files = [path for path in options.get("url_files", []) if os.path.isfile(path)]
+            if not job_list and not url_files:
+                store.finish_batch(batch_id)
+                continue
+
+            resumed += 1
+            header = f"♻️ Resuming batch {batch_id} ({len(job_list)} unfinished URLs)\n"
+            yield from _run_batch(
+                store, batch_id, job_list, _batch_download_kwargs(options, ""),
+                options.get("max_workers", DEFAULT_MAX_WORKERS), header, cancel,
+                iter_url_files(url_files) if url_files else None
+            )
+            if cancel is not None and cancel.is_set():
+                return
+        finally:
+            with _active_batches_lock:
+                _active_batches.discard(batch_id)
+
+    # Distributed batches run on the worker nodes; resuming un-pauses them and follows their progress
+    queue_store = open_job_store(QUEUE_DB_PATH)
+    for batch_id, options in queue_store.unfinished_batches(distributed=True) if queue_store else []:
+        with _active_batches_lock:
+            if batch_id in _active_batches:
+                continue
+            _active_batches.add(batch_id)
+        try:
+            if not queue_store.claim_batch(batch_id):
+                busy += 1
+                continue
+            resumed += 1
+            queue_store.set_batch_state(batch_id, "running")
+            url_files = [path for path in options.get("url_files", []) if os.path.isfile(path)]
+            yield from _watch_distributed_batch(
+                queue_store, batch_id, f"♻️ Resuming distributed batch {batch_id}\n", cancel,
+                iter_url_files(url_files) if url_files else None
+            )
+            if cancel is not None and cancel.is_set():
+                return
+        finally:
+            with _active_batches_lock:
+                _active_batches.discard(batch_id)
+
+    if busy:
+        yield f"⏳ {busy} unfinished batch(es) are still running in another process\n", 1.0
+    elif not resumed:
+        yield "✅ No unfinished batches to resume\n", 1.0
+
+def resume_in_background() -> None:
+    """Startup hook: resume interrupted batches and report the summaries on the console."""
+    for text, progress in resume_unfinished_batches():
+        if progress >= 1.0 and "BULK DOWNLOAD SUMMARY" in text:
+            print(text)
+
+def run_to_completion(gen: Generator, on_item: Optional[Callable] = None):
+    """Exhaust a generator, handing every item to on_item, and return its return value."""
+    while True:
+        try:
+            item = next(gen)
+        except StopIteration as done:
+            return done.value
+        if on_item:
+            on_item(item)
+
+def check_api_extra_args(extra_args: str) -> Optional[str]:
+    """Why extra_args can't be run for an API caller (an option outside API_EXTRA_OPTIONS), or None."""
+    tokens = extra_args.split()
+    i = 0
+    while i < len(tokens):
+        name = tokens[i].split("=", 1)[0]
+        if name not in API_EXTRA_OPTIONS:
+            return f"yt-dlp option not allowed: {tokens[i]}"
+        if API_EXTRA_OPTIONS[name] and "=" not in tokens[i]:
+            i += 1  # its value
+            if i >= len(tokens):
+                return f"{name} needs a value"
+        i += 1
+    return None
+
+def check_api_url_file(path: str) -> Optional[str]:
+    """Why a url_files entry can't be read for an API caller, or None."""
+    root = os.path.realpath(API_LIST_DIR)
+    real = os.path.realpath(path if os.path.isabs(path) else os.path.join(root, path))
+    if os.path.commonpath([root, real]) != root:
+        return f"url_files must be inside {API_LIST_DIR}"
+    if not os.path.isfile(real):
+        return f"url file not found: {path}"
+    return None
+
+class ApiJob:
+    """A bulk job submitted through the HTTP API, running on its own thread."""
+
+    def __init__(self, urls: str, options: dict, cookies_txt: str = "") -> None:
+        self.id = uuid.uuid4().hex[:12]
+        self.options = options
+        self.state = "running"
+        self.progress = 0.0
+        self.log = ""
+        self.result: Optional[BatchResult] = None
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.cancel = threading.Event()
+        threading.Thread(target=self._run, args=(urls, cookies_txt), daemon=True).start()
+
+    def _update(self, item: Tuple[str, float]) -> None:
+        text, self.progress = item
+        # The summary arrives on its own; keep the log it follows
+        self.log = self.log + text if "BULK DOWNLOAD SUMMARY" in text else text
+
+    def _run(self, urls: str, cookies_txt: str) -> None:
+        o = self.options
+        try:
+            self.result = run_to_completion(bulk_wrapper(
+                urls, o["out_dir"], o["audio_only"], o["video_only"], o["extra_args"], bool(cookies_txt),
+                cookies_txt, o["max_workers"], o["skip_duplicates"], self.cancel, o.get("url_files", ()),
+                o.get("distributed", False)
+            ), self._update)
+        except Exception as e:
+            self.log += f"\n❌ {e}\n"
+        finally:
+            self.state = ("cancelled" if self.cancel.is_set() else
+                          "finished" if self.result is not None else "failed")
+            self.finished = time.time()
+
+    def to_dict(self, with_log: bool = False) -> dict:
+        data = {
+            "id": self.id, "state": self.state, "progress": round(self.progress, 4),
+            "created": self.created, "finished": self.finished, "options": self.options,
+            "result": self.result._asdict() if self.result else None,
+        }
+        if with_log:
+            data["log"] = self.log
+        return data
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """JSON API: POST /jobs, GET /jobs, GET /jobs/<id>, POST /jobs/<id>/cancel (or DELETE /jobs/<id>).
+
+    GET /metrics serves the Prometheus text metrics. GET /library?q=... searches the media catalog,
+    POST /library/rescan reconciles it with the disk. GET /tunnels shows the Cloudflare tunnels.
+    """
+
+    jobs: Dict[str, ApiJob] = {}
+    metrics_only = False
+    jobs_lock = threading.Lock()
+
+    def log_message(self, format: str, *args) -> None:
+        pass  # Job logs are the interesting output, not access logs
+
+    def _send(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self) -> bool:
+        if API_TOKEN:
+            if self.headers.get("Authorization") != f"Bearer {API_TOKEN}":
+                self._send(401, {"error": "unauthorized"})
+                return False
+            return True
+        # No token: only local clients (a DNS-rebound page reaches us under a foreign Host name)
+        # and no requests sent by a web page from another origin
+        host = urlparse(f"//{self.headers.get('Host') or ''}").hostname or ""
+        origin = self.headers.get("Origin")
+        if host not in LOCAL_HOSTS or (origin and (urlparse(origin).hostname or "") not in LOCAL_HOSTS):
+            self._send(403, {"error": "forbidden; set YOUOWN_API_TOKEN to use the API from other hosts"})
+            return False
+        return True
+
+    def _read_json(self) -> Optional[dict]:
+        """The request's JSON object body; sends the error response and returns None if it isn't one."""
+        if self.headers.get_content_type() != "application/json":
+            self._send(415, {"error": "Content-Type must be application/json"})
+            return None
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            self._send(400, {"error": "bad Content-Length"})
+            return None
+        if length > API_MAX_BODY:
+            self._send(413, {"error": "request too large"})
+            return None
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            body = None
+        if not isinstance(body, dict):
+            self._send(400, {"error": "body must be a JSON object"})
+            return None
+        return body
+
+    @classmethod
+    def _prune_jobs(cls) -> None:
+        """Forget finished jobs past API_JOB_TTL, and the oldest beyond API_JOB_HISTORY."""
+        now = time.time()
+        with cls.jobs_lock:
+            finished = sorted((job for job in cls.jobs.values() if job.finished is not None),
+                              key=lambda job: job.finished)
+            for i, job in enumerate(finished):
+                if now - job.finished > API_JOB_TTL or i < len(finished) - API_JOB_HISTORY:
+                    del cls.jobs[job.id]
+
+    def _job(self, job_id: str) -> Optional[ApiJob]:
+        with self.jobs_lock:
+            job = self.jobs.get(job_id)
+        if job is None:
+            self._send(404, {"error": "no such job"})
+        return job
+
+    def do_GET(self) -> None:
+        parts = [p for p in urlparse(self.path).path.split("/") if p]
+        # Metrics are plain counters; without a token any host may scrape them
+        if (API_TOKEN or parts != ["metrics"]) and not self._authorized():
+            return
+        if parts == ["metrics"]:
+            body = METRICS.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.metrics_only:
+            self._send(404, {"error": "not found"})
+        elif parts == ["health"]:
+            self._send(200, {"ok": True})
+        elif parts == ["tunnels"]:
+            self._send(200, {"tunnels": [tunnel.to_dict() for tunnel in TUNNELS.status()]})
+        elif parts == ["jobs"]:
+            with self.jobs_lock:
+                jobs = [job.to_dict() for job in self.jobs.values()]
+            self._send(200, {"jobs": jobs})
+        elif len(parts) == 2 and parts[0] == "jobs":
+            job = self._job(parts[1])
+            if job:
+                self._send(200, job.to_dict(with_log=True))
+        elif parts == ["library"]:
+            catalog = open_catalog()
+            if catalog is None:
+                self._send(503, {"error": "media catalog unavailable"})
+                return
+            params = dict(parse_qsl(urlparse(self.path).query))
+            limit = int(params["limit"]) if params.get("limit", "").isdigit() else 50
+            self._send(200, {"items": catalog.search(params.get("q", ""), limit)})
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self) -> None:
+        if self.metrics_only:
+            self._send(404, {"error": "not found"})
+            return
+        if not self._authorized():
+            return
+        parts = [p for p in urlparse(self.path).path.split("/") if p]
+        if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+            self._cancel(parts[1])
+            return
+        if parts not in (["jobs"], ["library", "rescan"]):
+            self._send(404, {"error": "not found"})
+            return
+
+        body = self._read_json()
+        if body is None:
+            return
+        if parts == ["library", "rescan"]:
+            catalog = open_catalog()
+            if catalog is None:
+                self._send(503, {"error": "media catalog unavailable"})
+                return
+            dirs = body.get("dirs") or []
+            if isinstance(dirs, str):
+                dirs = [dirs]
+            if not isinstance(dirs, list) or not all(isinstance(d, str) for d in dirs):
+                self._send(400, {"error": "dirs must be a list of paths"})
+                return
+            self._send(200, dict(catalog.rescan(dirs)))
+            return
+
+        urls = body.get("urls") or ""
+        if isinstance(urls, list) and all(isinstance(u, str) for u in urls):
+            urls = "\n".join(urls)
+        # Large lists: files in API_LIST_DIR (one URL per line), streamed while the job runs
+        url_files = body.get("url_files") or []
+        if isinstance(url_files, str):
+            url_files = [url_files]
+        if not isinstance(urls, str) or not isinstance(url_files, list) \
+                or not all(isinstance(path, str) for path in url_files):
+            self._send(400, {"error": "urls and url_files must be strings or lists of strings"})
+            return
+        if not urls.strip() and not url_files:
+            self._send(400, {"error": "urls or url_files is required"})
+            return
+        for path in url_files:
+            error = check_api_url_file(path)
+            if error:
+                self._send(400, {"error": error})
+                return
+        url_files = [os.path.realpath(os.path.join(API_LIST_DIR, path)) for path in url_files]
+
+        strings = {"out_dir": DEFAULT_OUT_DIR, "extra_args": "", "cookies": ""}
+        flags = {"audio_only": False, "video_only": False, "skip_duplicates": True, "distributed": False}
+        for key, default in list(strings.items()):
+            value = body.get(key)
+            if value is not None and not isinstance(value, str):
+                self._send(400, {"error": f"{key} must be a string"})
+                return
+            strings[key] = value or default
+        for key, default in list(flags.items()):
+            value = body.get(key, default)
+            if not isinstance(value, bool):
+                self._send(400, {"error": f"{key} must be true or false"})
+                return
+            flags[key] = value
+        max_workers = body.get("max_workers", DEFAULT_MAX_WORKERS)
+        if isinstance(max_workers, bool) or not isinstance(max_workers, int) \
+                or not 1 <= max_workers <= MAX_WORKERS_LIMIT:
+            self._send(400, {"error": f"max_workers must be a number from 1 to {MAX_WORKERS_LIMIT}"})
+            return
+        error = check_api_extra_args(strings["extra_args"])
+        if error:
+            self._send(400, {"error": error})
+            return
+        if flags["audio_only"] and flags["video_only"]:
+            self._send(400, {"error": "audio_only and video_only are exclusive"})
+            return
+        options = dict(
+            out_dir=strings["out_dir"], extra_args=strings["extra_args"], max_workers=max_workers,
+            url_files=url_files, audio_only=flags["audio_only"], video_only=flags["video_only"],
+            skip_duplicates=flags["skip_duplicates"], distributed=flags["distributed"],
         )
-    except Exception as e:
-        return f"❌ cloudflared failed: {e}"
-    
-    if proc.stdout:
+        self._prune_jobs()
+        job = ApiJob(urls, options, strings["cookies"])
+        with self.jobs_lock:
+            self.jobs[job.id] = job
+        self._send(202, job.to_dict())
+
+    def do_DELETE(self) -> None:
+        if self.metrics_only:
+            self._send(404, {"error": "not found"})
+            return
+        if not self._authorized():
+            return
+        parts = [p for p in urlparse(self.path).path.split("/") if p]
+        if len(parts) == 2 and parts[0] == "jobs":
+            self._cancel(parts[1])
+        else:
+            self._send(404, {"error": "not found"})
+
+    def _cancel(self, job_id: str) -> None:
+        job = self._job(job_id)
+        if job:
+            # Running downloads are killed and stay pending in the job queue for a later resume
+            job.cancel.set()
+            self._send(202, job.to_dict())
+
+def serve_api(host: str = API_HOST, port: int = API_PORT) -> int:
+    """Run the JSON HTTP API until interrupted."""
+    if not API_TOKEN and host not in LOCAL_HOSTS:
+        print(f"❌ Set YOUOWN_API_TOKEN before serving the API on {host}")
+        return 1
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    print(f"🛰️ YouOwn API listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for job in list(ApiHandler.jobs.values()):
+            job.cancel.set()
+    return 0
+
+class MetricsHandler(ApiHandler):
+    """Only GET /metrics, for the web UI (which has no job API)."""
+
+    metrics_only = True
+
+def serve_metrics(host: str = API_HOST, port: int = METRICS_PORT) -> ThreadingHTTPServer:
+    """Serve /metrics on a background thread."""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"📈 Metrics on http://{host}:{port}/metrics")
+    return server
+
+def split_url_sources(sources: List[str]) -> Tuple[str, List[str]]:
+    """Split sources into URLs given directly and list files (stdin as "-"), which are streamed."""
+    urls, files = [], []
+    for source in sources:
+        if source == "-" or os.path.isfile(source):
+            files.append(source)
+        else:
+            urls.append(source)
+    return "\n".join(urls), files
+
+def run_cli_download(args: argparse.Namespace) -> int:
+    """Run a bulk download from the command line; exit code 1 if any URL failed."""
+    cookies_txt = ""
+    if args.cookies:
+        with open(args.cookies, encoding="utf-8") as f:
+            cookies_txt = f.read()
+    cancel = threading.Event()
+    last: List[str] = [""]
+
+    def show(item: Tuple[str, float]) -> None:
+        text, progress = item
+        if "BULK DOWNLOAD SUMMARY" in text:
+            print(last[0].rstrip())
+            print(text)
+        else:
+            last[0] = text
+            if not args.quiet and sys.stderr.isatty():
+                sys.stderr.write(f"\r⏳ {progress * 100:5.1f}%")
+                sys.stderr.flush()
+        if text.startswith("❌"):
+            print(text)
+
+    urls, url_files = split_url_sources(args.sources)
+    gen = bulk_wrapper(
+        urls, args.out_dir, args.audio_only, args.video_only, args.extra_args,
+        bool(cookies_txt), cookies_txt, args.workers, args.skip_duplicates, cancel, url_files,
+        args.distributed
+    )
+    try:
+        result = run_to_completion(gen, show)
+    except KeyboardInterrupt:
+        cancel.set()
+        gen.close()
+        print("\n⛔ Cancelled; unfinished URLs can be resumed with: python app.py resume")
+        return 130
+    return 0 if result is not None and result.failed == 0 else 1
+
+def run_worker_node(args: argparse.Namespace) -> int:
+    """Run this machine as a worker node until interrupted."""
+    store = open_job_store(args.queue)
+    if store is None:
+        print(f"❌ Shared queue unavailable: {args.queue}")
+        return 1
+    node = WorkerNode(store, args.workers, args.node_id, args.out_dir)
+    print(f"🖧 Worker node {node.id} running {node.workers} downloads at a time from {args.queue}")
+    if hasattr(signal, "SIGTERM"):
+        # Service managers stop with SIGTERM: hand the jobs back instead of waiting out the lease
+        signal.signal(signal.SIGTERM, lambda signum, frame: node.stop.set())
+    try:
+        node.run()
+    except KeyboardInterrupt:
+        pass
+    print(f"⛔ Worker node stopped; {sum(node.finished.values())} jobs finished here, unfinished ones went back to the queue")
+    return 0
+
+def describe_media(item: dict) -> str:
+    """One catalog entry as "title · uploader · site · 03:12 · 12.00MiB" plus its path."""
+    details = [item.get("uploader"), item.get("extractor"),
+               format_eta(item["duration"]) if item.get("duration") else None, format_bytes(item.get("size"))]
+    return f"🎞️ {item.get('title') or os.path.basename(item['path'])} · " \
+           f"{' · '.join(str(d) for d in details if d)}\n   {item['path']}"
+
+def describe_rescan(counts: Counter) -> str:
+    return (f"🔄 Catalog rescanned: {counts['added']} added, {counts['updated']} updated, "
+            f"{counts['moved']} moved, {counts['removed']} removed, {counts['unchanged']} unchanged")
+
+def run_library(args: argparse.Namespace) -> int:
+    """Search the media catalog from the command line, optionally rescanning it first."""
+    catalog = open_catalog()
+    if catalog is None:
+        print("❌ Media catalog unavailable (YOUOWN_CATALOG)")
+        return 1
+    if args.rescan is not None:
+        print(describe_rescan(catalog.rescan(args.rescan)))
+        if not args.query:
+            return 0
+    items = catalog.search(" ".join(args.query), args.limit)
+    for item in items:
+        print(json.dumps(item) if args.json else describe_media(item))
+    if not items and not args.json:
+        print("🔍 Nothing found")
+    return 0
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point: the web UI by default, or headless download/resume/serve."""
+    parser = argparse.ArgumentParser(description="Secure Media Downloader")
+    commands = parser.add_subparsers(dest="command")
+    # "gradio" is what older launchers pass
+    commands.add_parser("ui", aliases=["gradio"], help="start the web UI (default)")
+
+    download = commands.add_parser("download", help="download URLs without the web UI")
+    download.add_argument("sources", nargs="+", help="URLs, files with one URL per line, or - for stdin")
+    download.add_argument("-o", "--out-dir", default=DEFAULT_OUT_DIR, help="save location")
+    download.add_argument("--audio-only", action="store_true")
+    download.add_argument("--video-only", action="store_true")
+    download.add_argument("--extra-args", default="", help="extra yt-dlp options, e.g. \"--limit-rate 5M\"")
+    download.add_argument("-w", "--workers", type=int, default=DEFAULT_MAX_WORKERS, help="parallel downloads")
+    download.add_argument("--no-skip-duplicates", dest="skip_duplicates", action="store_false",
+                          help="download links already in the save location again")
+    download.add_argument("--cookies", help="Netscape cookies file (copied to a temp file that is deleted after use)")
+    download.add_argument("-q", "--quiet", action="store_true", help="no progress line")
+    download.add_argument("--distributed", action="store_true",
+                          help="queue the batch for worker nodes (YOUOWN_QUEUE) instead of downloading here")
+
+    commands.add_parser("resume", help="resume interrupted bulk batches")
+
+    serve = commands.add_parser("serve", help="run the JSON HTTP API")
+    serve.add_argument("--host", default=API_HOST)
+    serve.add_argument("--port", type=int, default=API_PORT)
+
+    worker = commands.add_parser("worker", help="run distributed batches from the shared queue on this machine")
+    worker.add_argument("--queue", default=QUEUE_DB_PATH, help="shared queue database (YOUOWN_QUEUE)")
+    worker.add_argument("-w", "--workers", type=int, default=DEFAULT_MAX_WORKERS, help="parallel downloads on this node")
+    worker.add_argument("-o", "--out-dir", help="save here instead of the batch's save location")
+    worker.add_argument("--node-id", help="name shown in the batch log (default: host-pid)")
+
+    library = commands.add_parser("library", help="search the catalog of downloaded files")
+    library.add_argument("query", nargs="*", help="words to look for (prefixes match), or a video URL")
+    library.add_argument("--rescan", nargs="*", metavar="DIR",
+                         help="first pick up files added or removed outside the app (default: every save location)")
+    library.add_argument("-n", "--limit", type=int, default=50)
+    library.add_argument("--json", action="store_true", help="print one JSON object per file")
+
+    args = parser.parse_args(argv)
+    if args.command == "download":
+        return run_cli_download(args)
+    if args.command == "resume":
+        for text, progress in resume_unfinished_batches():
+            if progress >= 1.0:
+                print(text)
+        return 0
+    if args.command == "serve":
+        return serve_api(args.host, args.port)
+    if args.command == "worker":
+        return run_worker_node(args)
+    if args.command == "library":
+        return run_library(args)
+    launch_ui()
+    return 0
+
+class Tunnel:
+    """One supervised cloudflared quick tunnel to a local port."""
+
+    def __init__(self, port: int) -> None:
+        self.port = port
+        self.state = "starting"  # starting, running, restarting, failed, stopped
+        self.url: Optional[str] = None
+        self.error = ""
+        self.restarts = 0
+        self.since = time.time()
+        self.log: deque = deque(maxlen=TUNNEL_LOG_LINES)
+        self.proc: Optional[subprocess.Popen] = None
+        self.stopping = threading.Event()
+        self.changed = threading.Condition()
+
+    @property
+    def alive(self) -> bool:
+        return self.state in ("starting", "running", "restarting")
+
+    def _set(self, state: str, url: Optional[str] = None, error: str = "") -> None:
+        with self.changed:
+            self.state, self.url, self.error, self.since = state, url, error, time.time()
+            self.changed.notify_all()
+
+    def _run_once(self) -> Optional[str]:
+        """Run cloudflared until it exits; returns why it couldn't start (None once it was up)."""
+        cmd = ["cloudflared", "tunnel", "--url", f"http://localhost:{self.port}", "--no-autoupdate"]
+        group = ({"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP} if os.name == "nt"
+                 else {"start_new_session": True})
+        try:
+            self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                         text=True, errors="replace", **group)
+        except FileNotFoundError:
+            # Nothing to retry
+            self._set("failed", error="cloudflared not installed. Install with 'brew install cloudflared' (Mac) "
+                                      "or download from Cloudflare website.")
+            self.stopping.set()
+            return None
+        except OSError as e:
+            return f"cloudflared failed: {e}"
+
+        # Exit is watched on the process, not on its output (a leftover child can keep that open)
+        threading.Thread(target=self._read, args=(self.proc,), daemon=True).start()
+        deadline = time.monotonic() + TUNNEL_START_TIMEOUT
+        while True:
+            try:
+                self.proc.wait(timeout=WATCHDOG_TICK)
+                break
+            except subprocess.TimeoutExpired:
+                if self.url is None and time.monotonic() > deadline:
+                    kill_process_tree(self.proc)
+        self._kill_leftovers(self.proc)
+        if self.url is None and not self.stopping.is_set():
+            return f"no tunnel URL within {TUNNEL_START_TIMEOUT:.0f}s: {self.log[-1] if self.log else 'no output'}"
+        return None
+
+    def _read(self, proc: subprocess.Popen) -> None:
         for line in proc.stdout:
-            m = re.search(r"(https://[^\s]+\.trycloudflare\.com)", line)
-            if m:
-                tunnel_url = m.group(1)
-                return f"🔗 Tunnel URL: {tunnel_url}"
-            
-            # If cloudflared not found
-            if "command not found" in line:
-                return "❌ cloudflared not installed. Install with 'brew install cloudflared' (Mac) or download from Cloudflare website."
-    
-    return "❌ Tunnel creation failed. Check logs for details."
+            self.log.append(line.rstrip())
+            match = TUNNEL_URL.search(line)
+            if match and self.url is None and proc is self.proc and proc.poll() is None:
+                self._set("running", match.group(0))
+
+    def supervise(self) -> None:
+        """Keep cloudflared running, restarting it with backoff when it dies, until stopped."""
+        failures = 0
+        while not self.stopping.is_set():
+            started = time.monotonic()
+            error = self._run_once()
+            if self.stopping.is_set():
+                break
+            if time.monotonic() - started > TUNNEL_STABLE_SECONDS:
+                failures = 0  # it had been up for a while, not a crash loop
+            failures += 1
+            if failures > TUNNEL_MAX_RESTARTS:
+                self._set("failed", error=error or f"cloudflared exited {failures} times in a row")
+                return
+            self.restarts += 1
+            self._set("restarting", error=error or f"cloudflared exited with code {self.proc.returncode}")
+            self.stopping.wait(min(2 ** failures, 60))
+        if self.state != "failed":
+            self._set("stopped")
+
+    @staticmethod
+    def _kill_leftovers(proc: subprocess.Popen) -> None:
+        """Kill whatever an exited cloudflared left running in its process group."""
+        if os.name != "nt":
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except OSError:
+                pass
+
+    def stop(self) -> None:
+        self.stopping.set()
+        if self.proc is not None:
+            kill_process_tree(self.proc)
+            self._kill_leftovers(self.proc)
+
+    def describe(self) -> str:
+        if self.state == "running":
+            return f"🔗 Tunnel URL: {self.url}  (port {self.port}, up {format_eta(time.time() - self.since)}" \
+                   f"{f', restarted {self.restarts}x' if self.restarts else ''})"
+        if self.state == "starting":
+            return f"⏳ Starting tunnel to port {self.port}..."
+        if self.state == "restarting":
+            return f"🔁 Tunnel to port {self.port} went down ({self.error}), restarting..."
+        if self.state == "failed":
+            return f"❌ Tunnel to port {self.port} failed: {self.error}"
+        return f"⛔ Tunnel to port {self.port} stopped"
+
+    def to_dict(self) -> dict:
+        return {"port": self.port, "state": self.state, "url": self.url, "error": self.error,
+                "restarts": self.restarts, "since": self.since}
+
+class TunnelManager:
+    """At most one supervised tunnel per local port, all stopped when the app exits."""
 
-def show_readme() -> gr.Markdown:
+    def __init__(self) -> None:
+        self.tunnels: Dict[int, Tunnel] = {}
+        self.lock = threading.Lock()
+
+    def start(self, port: int) -> Tunnel:
+        """The port's tunnel; started in the background unless one is already up or starting."""
+        with self.lock:
+            tunnel = self.tunnels.get(port)
+            if tunnel is not None and tunnel.alive:
+                return tunnel
+            tunnel = self.tunnels[port] = Tunnel(port)
+        threading.Thread(target=tunnel.supervise, name=f"youown-tunnel-{port}", daemon=True).start()
+        return tunnel
+
+    def restart(self, port: int) -> Tunnel:
+        self.stop(port)
+        return self.start(port)
+
+    def stop(self, port: int) -> Optional[Tunnel]:
+        with self.lock:
+            tunnel = self.tunnels.pop(port, None)
+        if tunnel is not None:
+            tunnel.stop()
+        return tunnel
+
+    def status(self) -> List[Tunnel]:
+        with self.lock:
+            return list(self.tunnels.values())
+
+    def shutdown(self) -> None:
+        for tunnel in self.status():
+            tunnel.stop()
+
+TUNNELS = TunnelManager()
+atexit.register(TUNNELS.shutdown)
+
+def parse_port(port: str) -> Optional[int]:
+    port = (port or "").strip()
+    return int(port) if port.isdigit() and 0 < int(port) < 65536 else None
+
+async def generate_tunnel(port: str) -> AsyncGenerator[str, None]:
+    """Start (or reuse) the Cloudflare tunnel for a port and show its status until it's up.
+
+    Waits on the event loop, so no server worker thread is held while cloudflared connects.
+    """
+    number = parse_port(port)
+    if number is None:
+        yield "❌ Invalid port number"
+        return
+    tunnel = TUNNELS.start(number)
+    deadline = time.monotonic() + TUNNEL_START_TIMEOUT + 5
+    while True:
+        text = tunnel.describe()
+        yield text
+        if tunnel.state in ("running", "failed", "stopped") or time.monotonic() > deadline:
+            return
+        await asyncio.sleep(0.5)
+
+async def restart_tunnel(port: str) -> AsyncGenerator[str, None]:
+    """Replace the port's tunnel with a fresh cloudflared (new URL) and show its status."""
+    number = parse_port(port)
+    if number is not None:
+        TUNNELS.stop(number)
+    async for text in generate_tunnel(port):
+        yield text
+
+def stop_tunnel(port: str) -> str:
+    number = parse_port(port)
+    if number is None:
+        return "❌ Invalid port number"
+    return f"⛔ Tunnel to port {number} stopped" if TUNNELS.stop(number) else f"No tunnel to port {number}"
+
+def tunnel_status() -> str:
+    return "\n".join(tunnel.describe() for tunnel in TUNNELS.status()) or "No tunnels running"
+
+def show_readme() -> dict:
     """Toggle README visibility."""
+    import gradio as gr
     return gr.update(value=README_CONTENT, visible=True)
 
-def hide_readme() -> gr.Markdown:
+def hide_readme() -> dict:
     """Hide README content."""
+    import gradio as gr
     return gr.update(value="", visible=False)
 
 # CSS for styling the UI
@@ -428,225 +4613,373 @@ body {
 </style>
 """
 
-# Modify the download_stream function to handle progress tracking through output text
-def download_stream_with_progress(
-    url: str, 
-    out_dir: str, 
-    audio_only: bool, 
-    video_only: bool, 
-    extra_args: str, 
-    use_cookies: bool, 
-    cookies_txt: str
-) -> str:
-    """Modified version that uses text-based progress instead of gr.Progress"""
-    output_text = ""
-    
-    # Process download and collect output
-    for text, _, success in download_stream(
-        url, out_dir, audio_only, video_only, 
-        extra_args, use_cookies, cookies_txt
-    ):
-        output_text = text
-    
-    return output_text
+async def _iterate_in_thread(gen: Generator, cancel: Optional[threading.Event] = None) -> AsyncGenerator:
+    """Drive a blocking generator on its own thread so UI handlers don't hold server worker threads.
 
-def bulk_wrapper_with_progress(
-    urls: str, 
-    out_dir: str, 
-    audio_only: bool, 
-    video_only: bool, 
-    extra_args: str, 
-    use_cookies: bool, 
-    cookies_txt: str
-) -> str:
-    """Modified version that uses text-based progress instead of gr.Progress"""
-    output_text = ""
-    
-    # Process download and collect output
-    for text, _ in bulk_wrapper(
-        urls, out_dir, audio_only, video_only, 
-        extra_args, use_cookies, cookies_txt
-    ):
-        output_text = text
-    
-    return output_text
+    cancel is set when the client goes away, so a generator blocked on yt-dlp can stop it promptly.
+    """
+    loop = asyncio.get_running_loop()
+    items: asyncio.Queue = asyncio.Queue()
+    stop = cancel if cancel is not None else threading.Event()
+    done = object()
 
-# Create the Gradio interface
-with gr.Blocks(css=css, title="Secure Media Downloader") as app:
-    gr.HTML('<div class="warning-header">⚠️ <b>FOR PERSONAL USE ONLY - DO NOT USE WITH MAIN ACCOUNTS</b> ⚠️ <br><span style="font-size: 16px;">Developed By VOIID</span></div>')
-    gr.HTML(f'<div class="duplicate-warning">{DUPLICATE_WARNING}</div>')
-    
-    with gr.Row():
-        with gr.Column(scale=4):
-            with gr.Tabs() as tabs:
-                # Single Video Tab
-                with gr.Tab("🎯 Single Download", id="single"):
-                    url = gr.Textbox(
-                        label="Video URL",
-                        placeholder="https://www.youtube.com/watch?v=..."
-                    )
-                    
-                    with gr.Row():
-                        with gr.Column():
-                            out_dir = gr.Textbox(
-                                label="Save Location", 
-                                value=DEFAULT_OUT_DIR,
-                                placeholder="Path to save downloads"
-                            )
-                        with gr.Column():
-                            with gr.Row():
-                                audio_only = gr.Checkbox(label="Audio Only")
-                                video_only = gr.Checkbox(label="Video Only")
-                    
-                    extra_args = gr.Textbox(
-                        label="Advanced Options",
-                        placeholder="--limit-rate 5M --geo-bypass"
-                    )
-                    
-                    console = gr.Textbox(
-                        label="Progress Log", 
-                        lines=12,
-                        elem_classes="console-output"
-                    )
-                    
-                    gr.Button("⏬ Download").click(
-                        fn=download_stream_with_progress,
-                        inputs=[url, out_dir, audio_only, video_only,
-                              extra_args, gr.Checkbox(False, visible=False), gr.Textbox("", visible=False)],
-                        outputs=console
-                    )
+    def put(item) -> None:
+        try:
+            loop.call_soon_threadsafe(items.put_nowait, item)
+        except RuntimeError:
+            # Event loop already closed (server shutting down)
+            stop.set()
 
-                # Bulk Download Tab
-                with gr.Tab("📦 Bulk Download", id="bulk"):
-                    bulk_urls = gr.Textbox(
-                        label="URL List (One per line)", 
-                        lines=8,
-                        placeholder="https://www.youtube.com/watch?v=...\nhttps://Instagram.com/..."
-                    )
-                    
-                    with gr.Row():
-                        with gr.Column():
-                            out_dir2 = gr.Textbox(
-                                label="Save Location", 
-                                value=DEFAULT_OUT_DIR
+    def pump() -> None:
+        try:
+            for item in gen:
+                if stop.is_set():
+                    break
+                put(item)
+        except Exception as e:
+            put(e)
+        finally:
+            # Runs the generator's cleanup (stops bulk workers, deletes cookies)
+            gen.close()
+            put(done)
+
+    threading.Thread(target=pump, daemon=True).start()
+    try:
+        while True:
+            item = await items.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Client disconnected or the run finished
+        stop.set()
+
+def build_ui():
+    """Build the Gradio interface (Gradio is only imported when the UI is wanted)."""
+    import gradio as gr
+
+    async def download_stream_with_progress(
+        url: str, 
+        out_dir: str, 
+        audio_only: bool, 
+        video_only: bool, 
+        extra_args: str, 
+        use_cookies: bool, 
+        cookies_txt: str,
+        skip_duplicates: bool = True,
+        progress=gr.Progress()
+    ) -> AsyncGenerator[str, None]:
+        """Stream the download log to the UI while gr.Progress shows the parsed percentage."""
+        cancel = threading.Event()
+        if url and is_collection_url(url.strip()):
+            # A playlist/channel runs as a bulk batch, so entries download in parallel and resume
+            async for text, prog in _iterate_in_thread(bulk_wrapper(
+                url, out_dir, audio_only, video_only, extra_args, use_cookies, cookies_txt,
+                DEFAULT_MAX_WORKERS, skip_duplicates, cancel
+            ), cancel):
+                progress(prog, desc="Playlist")
+                yield text
+            return
+        async for text, prog, _ in _iterate_in_thread(download_with_retry(
+            url, out_dir, audio_only, video_only, 
+            extra_args, use_cookies, cookies_txt, skip_duplicates=skip_duplicates, cancel=cancel
+        ), cancel):
+            progress(prog, desc="Downloading")
+            yield text
+
+    async def bulk_wrapper_with_progress(
+        urls: str, 
+        out_dir: str, 
+        audio_only: bool, 
+        video_only: bool, 
+        extra_args: str, 
+        use_cookies: bool, 
+        cookies_txt: str,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        skip_duplicates: bool = True,
+        url_file: Optional[str] = None,
+        distributed: bool = False,
+        progress=gr.Progress()
+    ) -> AsyncGenerator[str, None]:
+        """Stream the bulk log to the UI while gr.Progress shows overall completion."""
+        cancel = threading.Event()
+        async for text, prog in _iterate_in_thread(bulk_wrapper(
+            urls, out_dir, audio_only, video_only, 
+            extra_args, use_cookies, cookies_txt, max_workers, skip_duplicates, cancel,
+            [url_file] if url_file else (), distributed
+        ), cancel):
+            progress(prog, desc="Bulk download")
+            yield text
+
+    def search_library(query: str) -> str:
+        catalog = open_catalog()
+        if catalog is None:
+            return "❌ Media catalog unavailable (YOUOWN_CATALOG)"
+        items = catalog.search(query or "")
+        return "\n".join(describe_media(item) for item in items) or "🔍 Nothing found"
+
+    def rescan_library(query: str, out_dir: str) -> str:
+        catalog = open_catalog()
+        if catalog is None:
+            return "❌ Media catalog unavailable (YOUOWN_CATALOG)"
+        dirs = [out_dir] if out_dir and os.path.isdir(out_dir) else []
+        return describe_rescan(catalog.rescan(dirs + catalog.roots())) + "\n\n" + search_library(query)
+
+    async def resume_wrapper_with_progress(progress=gr.Progress()) -> AsyncGenerator[str, None]:
+        """Stream resumed batches to the UI while gr.Progress shows overall completion."""
+        cancel = threading.Event()
+        async for text, prog in _iterate_in_thread(resume_unfinished_batches(cancel), cancel):
+            progress(prog, desc="Resuming")
+            yield text
+
+    with gr.Blocks(title="Secure Media Downloader") as app:
+        gr.HTML('<div class="warning-header">⚠️ <b>FOR PERSONAL USE ONLY - DO NOT USE WITH MAIN ACCOUNTS</b> ⚠️ <br><span style="font-size: 16px;">Developed By VOIID</span></div>')
+        gr.HTML(f'<div class="duplicate-warning">{DUPLICATE_WARNING}</div>')
+
+        with gr.Row():
+            with gr.Column(scale=4):
+                with gr.Tabs() as tabs:
+                    # Single Video Tab
+                    with gr.Tab("🎯 Single Download", id="single"):
+                        url = gr.Textbox(
+                            label="Video URL",
+                            placeholder="https://www.youtube.com/watch?v=..."
+                        )
+
+                        with gr.Row():
+                            with gr.Column():
+                                out_dir = gr.Textbox(
+                                    label="Save Location", 
+                                    value=DEFAULT_OUT_DIR,
+                                    placeholder="Path to save downloads"
+                                )
+                            with gr.Column():
+                                with gr.Row():
+                                    audio_only = gr.Checkbox(label="Audio Only")
+                                    video_only = gr.Checkbox(label="Video Only")
+                                    skip_dupes = gr.Checkbox(label="Skip Already Downloaded", value=True)
+
+                        extra_args = gr.Textbox(
+                            label="Advanced Options",
+                            placeholder="--limit-rate 5M --geo-bypass"
+                        )
+
+                        console = gr.Textbox(
+                            label="Progress Log", 
+                            lines=12,
+                            elem_classes="console-output"
+                        )
+
+                        gr.Button("⏬ Download").click(
+                            fn=download_stream_with_progress,
+                            inputs=[url, out_dir, audio_only, video_only,
+                                  extra_args, gr.Checkbox(False, visible=False), gr.Textbox("", visible=False), skip_dupes],
+                            outputs=console
+                        )
+
+                    # Bulk Download Tab
+                    with gr.Tab("📦 Bulk Download", id="bulk"):
+                        bulk_urls = gr.Textbox(
+                            label="URL List (One per line)", 
+                            lines=8,
+                            placeholder="https://www.youtube.com/watch?v=...\nhttps://Instagram.com/..."
+                        )
+                        # Large lists: read on the server as a stream instead of through the browser
+                        url_file2 = gr.File(
+                            label="Or upload a URL list file (one per line)",
+                            file_types=[".txt", ".csv", ".list"],
+                            type="filepath"
+                        )
+
+                        with gr.Row():
+                            with gr.Column():
+                                out_dir2 = gr.Textbox(
+                                    label="Save Location", 
+                                    value=DEFAULT_OUT_DIR
+                                )
+                            with gr.Column():
+                                with gr.Row():
+                                    audio2 = gr.Checkbox(label="Audio Only")
+                                    video2 = gr.Checkbox(label="Video Only")
+                                    skip_dupes2 = gr.Checkbox(label="Skip Already Downloaded", value=True)
+                                    distributed2 = gr.Checkbox(label="Distribute to Worker Nodes")
+
+                        extra2 = gr.Textbox(
+                            label="Advanced Options",
+                            placeholder="--limit-rate 5M --geo-bypass"
+                        )
+
+                        workers2 = gr.Slider(
+                            label="Parallel Downloads",
+                            minimum=1,
+                            maximum=MAX_WORKERS_LIMIT,
+                            step=1,
+                            value=DEFAULT_MAX_WORKERS
+                        )
+
+                        console2 = gr.Textbox(
+                            label="Progress Log", 
+                            lines=12,
+                            elem_classes="console-output"
+                        )
+
+                        gr.Button("⏬ Start Bulk Download").click(
+                            fn=bulk_wrapper_with_progress,
+                            inputs=[bulk_urls, out_dir2, audio2, video2,
+                                  extra2, gr.Checkbox(False, visible=False), gr.Textbox("", visible=False), workers2, skip_dupes2,
+                                  url_file2, distributed2],
+                            outputs=console2
+                        )
+
+                        gr.Button("♻️ Resume Unfinished Batches").click(
+                            fn=resume_wrapper_with_progress,
+                            outputs=console2
+                        )
+
+                    # Restricted Access Tab
+                    with gr.Tab("🔒 Restricted Content", id="restricted"):
+                        gr.HTML(f'<div class="security-alert">{COOKIE_WARNING}</div>')
+
+                        with gr.Row():
+                            with gr.Column():
+                                cookies3 = gr.Textbox(
+                                    label="Cookies.txt Content",
+                                    lines=10,
+                                    placeholder="Paste Netscape-format cookies here\n\n# WARNING: Use temporary accounts only!",
+                                    info="Data will be destroyed after use!"
+                                )
+                                gr.HTML('<div class="cookie-note">💡 Browser extensions like "CookieEditor" or "EditThisCookie" can export cookies in NetScape Format</div>')
+
+                            with gr.Column():
+                                url3 = gr.Textbox(
+                                    label="Protected URL (Youtube / Other Social Platform Age-Restricted Videos Etc...)",
+                                    placeholder="https://www.youtube.com/watch?v=..."
+                                )
+
+                                with gr.Row():
+                                    with gr.Column():
+                                        out_dir3 = gr.Textbox(
+                                            label="Save Location", 
+                                            value=DEFAULT_OUT_DIR
+                                        )
+                                    with gr.Column():
+                                        with gr.Row():
+                                            audio3 = gr.Checkbox(label="Audio Only")
+                                            video3 = gr.Checkbox(label="Video Only")
+                                            skip_dupes3 = gr.Checkbox(label="Skip Already Downloaded", value=True)
+
+                                extra3 = gr.Textbox(
+                                    label="Advanced Options",
+                                    placeholder="--limit-rate 5M --geo-bypass"
+                                )
+
+                        console3 = gr.Textbox(
+                            label="Security Log", 
+                            lines=12,
+                            elem_classes="console-output"
+                        )
+
+                        gr.Button("⏬ Download Content (I Accept All Risks)", 
+                                 variant="stop", 
+                                 elem_classes="danger-button").click(
+                            fn=download_stream_with_progress,
+                            inputs=[url3, out_dir3, audio3, video3,
+                                  extra3, gr.Checkbox(True, visible=False), cookies3, skip_dupes3],
+                            outputs=console3
+                        )
+
+                    # Media Library Tab
+                    with gr.Tab("📚 Library", id="library"):
+                        with gr.Row():
+                            query4 = gr.Textbox(
+                                label="Search Downloads",
+                                placeholder="Title, uploader, site or a video URL",
+                                scale=4
                             )
-                        with gr.Column():
-                            with gr.Row():
-                                audio2 = gr.Checkbox(label="Audio Only")
-                                video2 = gr.Checkbox(label="Video Only")
-                    
-                    extra2 = gr.Textbox(
-                        label="Advanced Options",
-                        placeholder="--limit-rate 5M --geo-bypass"
-                    )
-                    
-                    console2 = gr.Textbox(
-                        label="Progress Log", 
-                        lines=12,
-                        elem_classes="console-output"
-                    )
-                    
-                    gr.Button("⏬ Start Bulk Download").click(
-                        fn=bulk_wrapper_with_progress,
-                        inputs=[bulk_urls, out_dir2, audio2, video2,
-                              extra2, gr.Checkbox(False, visible=False), gr.Textbox("", visible=False)],
-                        outputs=console2
-                    )
+                            out_dir4 = gr.Textbox(label="Save Location", value=DEFAULT_OUT_DIR, scale=1)
 
-                # Restricted Access Tab
-                with gr.Tab("🔒 Restricted Content", id="restricted"):
-                    gr.HTML(f'<div class="security-alert">{COOKIE_WARNING}</div>')
-                    
-                    with gr.Row():
-                        with gr.Column():
-                            cookies3 = gr.Textbox(
-                                label="Cookies.txt Content",
-                                lines=10,
-                                placeholder="Paste Netscape-format cookies here\n\n# WARNING: Use temporary accounts only!",
-                                info="Data will be destroyed after use!"
+                        library4 = gr.Textbox(
+                            label="Results",
+                            lines=15,
+                            elem_classes="console-output"
+                        )
+
+                        with gr.Row():
+                            gr.Button("🔍 Search", variant="primary").click(
+                                fn=search_library, inputs=query4, outputs=library4
                             )
-                            gr.HTML('<div class="cookie-note">💡 Browser extensions like "CookieEditor" or "EditThisCookie" can export cookies in NetScape Format</div>')
-                        
-                        with gr.Column():
-                            url3 = gr.Textbox(
-                                label="Protected URL (Youtube / Other Social Platform Age-Restricted Videos Etc...)",
-                                placeholder="https://www.youtube.com/watch?v=..."
+                            gr.Button("🔄 Rescan Folders").click(
+                                fn=rescan_library, inputs=[query4, out_dir4], outputs=library4
                             )
-                            
-                            with gr.Row():
-                                with gr.Column():
-                                    out_dir3 = gr.Textbox(
-                                        label="Save Location", 
-                                        value=DEFAULT_OUT_DIR
-                                    )
-                                with gr.Column():
-                                    with gr.Row():
-                                        audio3 = gr.Checkbox(label="Audio Only")
-                                        video3 = gr.Checkbox(label="Video Only")
-                            
-                            extra3 = gr.Textbox(
-                                label="Advanced Options",
-                                placeholder="--limit-rate 5M --geo-bypass"
+                        query4.submit(fn=search_library, inputs=query4, outputs=library4)
+
+                    # Cloudflare Tunnel Tab
+                    with gr.Tab("☁️ Tunnel", id="tunnel"):
+                        gr.Markdown(
+                            "### Generate public URL via Cloudflare for remote access\n"
+                            "Check your port number in the CMD before proceeding.\n"
+                            "Default is usually **7860**, but if it's already occupied, or if this program is running in multiple instances,\n"
+                            "it might be **7861**, **7862**, etc.\n"
+                            "Verify the correct port in your terminal output and enter it below."
+                        )
+
+
+                        port_in = gr.Textbox(
+                            label="Local Port", 
+                            value="7860",
+                            placeholder="Port number (e.g. 7860)"
+                        )
+
+                        tunnel_out = gr.Textbox(
+                            label="Public URL",
+                            placeholder="Your tunnel URL will appear here",
+                            lines=2
+                        )
+
+                        with gr.Row():
+                            gr.Button("🔗 Create Tunnel").click(
+                                fn=generate_tunnel,
+                                inputs=port_in,
+                                outputs=tunnel_out
                             )
-                    
-                    console3 = gr.Textbox(
-                        label="Security Log", 
-                        lines=12,
-                        elem_classes="console-output"
-                    )
-                    
-                    gr.Button("⏬ Download Content (I Accept All Risks)", 
-                             variant="stop", 
-                             elem_classes="danger-button").click(
-                        fn=download_stream_with_progress,
-                        inputs=[url3, out_dir3, audio3, video3,
-                              extra3, gr.Checkbox(True, visible=False), cookies3],
-                        outputs=console3
-                    )
+                            gr.Button("🔁 Restart").click(fn=restart_tunnel, inputs=port_in, outputs=tunnel_out)
+                            gr.Button("⛔ Stop").click(fn=stop_tunnel, inputs=port_in, outputs=tunnel_out)
+                            gr.Button("📡 Status").click(fn=tunnel_status, outputs=tunnel_out)
 
-                # Cloudflare Tunnel Tab
-                with gr.Tab("☁️ Tunnel", id="tunnel"):
-                    gr.Markdown(
-                        "### Generate public URL via Cloudflare for remote access\n"
-                        "Check your port number in the CMD before proceeding.\n"
-                        "Default is usually **7860**, but if it's already occupied, or if this program is running in multiple instances,\n"
-                        "it might be **7861**, **7862**, etc.\n"
-                        "Verify the correct port in your terminal output and enter it below."
-                    )
+            # Right side - README button and content with close button
+            with gr.Column(scale=1):
+                readme_button = gr.Button("📚 HELP / README", elem_classes="readme-button")
+                with gr.Column(visible=False) as readme_container:
+                    readme_output = gr.Markdown(value="", elem_id="readme_content")
+                    close_button = gr.Button("Close Help", elem_classes="readme-close-button")
 
-                    
-                    port_in = gr.Textbox(
-                        label="Local Port", 
-                        value="7860",
-                        placeholder="Port number (e.g. 7860)"
-                    )
-                    
-                    tunnel_out = gr.Textbox(
-                        label="Public URL",
-                        placeholder="Your tunnel URL will appear here"
-                    )
-                    
-                    gr.Button("🔗 Create Tunnel").click(
-                        fn=generate_tunnel,
-                        inputs=port_in,
-                        outputs=tunnel_out
-                    )
-        
-        # Right side - README button and content with close button
-        with gr.Column(scale=1):
-            readme_button = gr.Button("📚 HELP / README", elem_classes="readme-button")
-            with gr.Column(visible=False) as readme_container:
-                readme_output = gr.Markdown(value="", elem_id="readme_content")
-                close_button = gr.Button("Close Help", elem_classes="readme-close-button")
-            
-            readme_button.click(
-                fn=lambda: [gr.update(visible=True), README_CONTENT],
-                outputs=[readme_container, readme_output]
-            )
-            
-            close_button.click(
-                fn=lambda: gr.update(visible=False),
-                outputs=readme_container
-            )
+                readme_button.click(
+                    fn=lambda: [gr.update(visible=True), README_CONTENT],
+                    outputs=[readme_container, readme_output]
+                )
+
+                close_button.click(
+                    fn=lambda: gr.update(visible=False),
+                    outputs=readme_container
+                )
+
+    return app
+
+def launch_ui() -> None:
+    """Start the web UI, resuming interrupted bulk batches in the background."""
+    app = build_ui()
+
+    # Pick up bulk batches interrupted by a crash or restart
+    if RESUME_ON_START:
+        threading.Thread(target=resume_in_background, daemon=True).start()
+    if METRICS_PORT:
+        serve_metrics()
+
+    # Downloads stream through the queue; each one runs on its own thread, not a server worker
+    app.queue(default_concurrency_limit=UI_CONCURRENCY_LIMIT, max_size=UI_QUEUE_MAX_SIZE)
+    app.launch(share=False, inbrowser=False, inline=False, css=css)
 
-    app.launch(share=False, inbrowser=False, inline=False)
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
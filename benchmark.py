@@ -0,0 +1,482 @@
+"""Offline benchmark for YouOwn's download path.
+
+Serves synthetic media from a local server (progressive MP4, HLS, DASH, slow/flaky endpoints,
+429s) that yt-dlp's generic extractor downloads like any site, then runs single, bulk and
+concurrent scenarios through app.py and reports throughput, time to first byte, CPU and peak RSS.
+
+    python benchmark.py
+    python benchmark.py --scenarios single-mp4,bulk --repeat 3 --json after.json --baseline before.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, NamedTuple, Optional
+
+try:
+    import psutil  # Optional: per-scenario peak RSS including yt-dlp/ffmpeg children
+except ImportError:
+    psutil = None
+
+try:
+    import resource  # POSIX only
+except ImportError:
+    resource = None
+
+# Server behaviour per URL mode (/<mode>/<job>/<asset>)
+SLOW_TTFB = 0.5  # seconds before the first byte
+SLOW_RATE = 2 * 1024 * 1024  # bytes/s
+CHUNK_SIZE = 64 * 1024
+MANIFEST_EXTS = (".m3u8", ".mpd")
+CONTENT_TYPES = {
+    ".mp4": "video/mp4", ".m4a": "audio/mp4", ".m4s": "video/iso.segment", ".ts": "video/mp2t",
+    ".m3u8": "application/vnd.apple.mpegurl", ".mpd": "application/dash+xml",
+}
+
+# Synthetic media
+DEFAULT_SIZE_MB = 8
+CLIP_SECONDS = 10
+SEGMENT_SECONDS = 1
+
+# Scenario name -> (kind, mode, asset, jobs); assets needing real media are skipped without ffmpeg
+SCENARIOS = {
+    "single-mp4": ("single", "fast", "clip.mp4", 1),
+    "single-hls": ("single", "fast", "hls/index.m3u8", 1),
+    "single-dash": ("single", "fast", "dash/manifest.mpd", 1),
+    "slow-mp4": ("single", "slow", "clip.mp4", 1),
+    "flaky-hls": ("single", "flaky", "hls/index.m3u8", 1),
+    "rate-limited": ("single", "limited", "clip.mp4", 1),
+    "bulk": ("bulk", "mixed", "", 12),
+    "concurrent": ("concurrent", "fast", "clip.mp4", 4),
+}
+BULK_ASSETS = [("fast", "clip.mp4"), ("fast", "hls/index.m3u8"), ("fast", "dash/manifest.mpd"),
+               ("slow", "clip.mp4"), ("flaky", "hls/index.m3u8"), ("limited", "clip.mp4")]
+
+class MediaHandler(BaseHTTPRequestHandler):
+    """Static media under /<mode>/<job>/<asset>, plus /_stats and /_reset for the harness.
+
+    fast serves as is, slow delays the first byte and throttles, flaky answers 503 to every
+    first request for a file, limited answers 429 to the first request of each job.
+    """
+
+    root = ""
+    stats_lock = threading.Lock()
+    stats = {"bytes": 0, "requests": 0, "errors": 0, "first_byte": {}}
+    seen: set = set()
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def _send_json(self, payload: dict) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, headers: Optional[Dict[str, str]] = None) -> None:
+        with self.stats_lock:
+            self.stats["errors"] += 1
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self) -> None:
+        if self.path == "/_reset":
+            with self.stats_lock:
+                self.stats.update(bytes=0, requests=0, errors=0, first_byte={})
+                self.seen.clear()
+            self._send_json({"ok": True})
+        else:
+            self._error(404)
+
+    def do_HEAD(self) -> None:
+        self.do_GET(head=True)
+
+    def do_GET(self, head: bool = False) -> None:
+        if self.path == "/_stats":
+            with self.stats_lock:
+                self._send_json(dict(self.stats, first_byte=dict(self.stats["first_byte"])))
+            return
+
+        parts = self.path.split("?")[0].strip("/").split("/")
+        if len(parts) < 3:
+            self._error(404)
+            return
+        mode, job, asset = parts[0], parts[1], "/".join(parts[2:])
+        path = os.path.normpath(os.path.join(self.root, asset))
+        if not path.startswith(self.root + os.sep) or not os.path.isfile(path):
+            self._error(404)
+            return
+
+        with self.stats_lock:
+            self.stats["requests"] += 1
+            first_for_file = (mode, job, asset) not in self.seen
+            first_for_job = not any(key[:2] == (mode, job) for key in self.seen)
+            self.seen.add((mode, job, asset))
+        if mode == "flaky" and first_for_file:
+            self._error(503)
+            return
+        if mode == "limited" and first_for_job:
+            self._error(429, {"Retry-After": "1"})
+            return
+        if mode == "slow":
+            time.sleep(SLOW_TTFB)
+
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        match = re.match(r"bytes=(\d*)-(\d*)$", self.headers.get("Range") or "")
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), end) if match.group(2) else end
+            else:
+                start = max(0, size - int(match.group(2)))
+            if start > end:
+                self._error(416, {"Content-Range": f"bytes */{size}"})
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPES.get(os.path.splitext(path)[1], "application/octet-stream"))
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        if head:
+            return
+
+        is_media = not path.endswith(MANIFEST_EXTS)
+        remaining = end - start + 1
+        try:
+            with open(path, "rb") as f:
+                f.seek(start)
+                while remaining > 0:
+                    chunk = f.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    started = time.monotonic()
+                    self.wfile.write(chunk)
+                    remaining -= len(chunk)
+                    with self.stats_lock:
+                        self.stats["bytes"] += len(chunk)
+                        if is_media:
+                            self.stats["first_byte"].setdefault(f"/{mode}/{job}", time.time())
+                    if mode == "slow":
+                        time.sleep(max(0.0, len(chunk) / SLOW_RATE - (time.monotonic() - started)))
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # yt-dlp often only probes the headers
+
+def serve(root: str, ready: "multiprocessing.Queue") -> None:
+    """Run the media server (in its own process, so its CPU isn't billed to the downloader)."""
+    MediaHandler.root = os.path.abspath(root)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MediaHandler)
+    server.daemon_threads = True
+    ready.put(server.server_address[1])
+    server.serve_forever()
+
+def make_media(root: str, size_mb: int) -> List[str]:
+    """Write the synthetic clip, HLS and DASH renditions; returns the assets that exist."""
+    clip = os.path.join(root, "clip.mp4")
+    hls_dir, dash_dir = os.path.join(root, "hls"), os.path.join(root, "dash")
+    os.makedirs(hls_dir, exist_ok=True)
+    os.makedirs(dash_dir, exist_ok=True)
+    run = lambda cmd: subprocess.run(["ffmpeg", "-y", "-hide_banner", "-loglevel", "error"] + cmd,
+                                     capture_output=True).returncode == 0
+
+    bitrate = f"{size_mb * 8 * 1024 // CLIP_SECONDS}k"
+    source = ["-f", "lavfi", "-i", f"testsrc2=size=1280x720:rate=30:duration={CLIP_SECONDS}",
+              "-f", "lavfi", "-i", f"sine=frequency=440:duration={CLIP_SECONDS}"]
+    encoded = shutil.which("ffmpeg") and any(
+        run(source + ["-c:v", codec, "-b:v", bitrate, "-g", "30", "-c:a", "aac", "-shortest",
+                      "-movflags", "+faststart", clip])
+        for codec in ("libx264", "mpeg4")
+    )
+    if encoded and run(["-i", clip, "-c", "copy", "-f", "hls", "-hls_time", str(SEGMENT_SECONDS),
+                        "-hls_playlist_type", "vod", "-hls_segment_filename",
+                        os.path.join(hls_dir, "seg%03d.ts"), os.path.join(hls_dir, "index.m3u8")]):
+        dash_ok = run(["-i", clip, "-map", "0:v", "-map", "0:a", "-c", "copy", "-f", "dash",
+                       "-seg_duration", str(SEGMENT_SECONDS), "-use_template", "1", "-use_timeline", "0",
+                       os.path.join(dash_dir, "manifest.mpd")])
+        return ["clip.mp4", "hls/index.m3u8"] + (["dash/manifest.mpd"] if dash_ok else [])
+
+    # No ffmpeg: opaque bytes are enough for progressive and HLS downloads (nothing to merge)
+    size = size_mb * 1024 * 1024
+    with open(clip, "wb") as f:
+        f.write(os.urandom(size))
+    segments = CLIP_SECONDS // SEGMENT_SECONDS
+    playlist = ["#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{SEGMENT_SECONDS}",
+                "#EXT-X-PLAYLIST-TYPE:VOD", "#EXT-X-MEDIA-SEQUENCE:0"]
+    for n in range(segments):
+        with open(os.path.join(hls_dir, f"seg{n:03d}.ts"), "wb") as f:
+            f.write(os.urandom(size // segments))
+        playlist += [f"#EXTINF:{SEGMENT_SECONDS}.0,", f"seg{n:03d}.ts"]
+    with open(os.path.join(hls_dir, "index.m3u8"), "w") as f:
+        f.write("\n".join(playlist + ["#EXT-X-ENDLIST", ""]))
+    return ["clip.mp4", "hls/index.m3u8"]
+
+class ResourceSampler:
+    """CPU seconds and peak RSS of this process and its children (yt-dlp, ffmpeg) over a scenario."""
+
+    def __init__(self, exclude_pid: int, interval: float = 0.1) -> None:
+        self.exclude_pid = exclude_pid
+        self.interval = interval
+        self.peak_rss = 0
+        self.child_cpu: Dict[int, float] = {}
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self) -> None:
+        me = psutil.Process()
+        while not self.done.is_set():
+            rss = 0
+            for proc in [me] + me.children(recursive=True):
+                if proc.pid == self.exclude_pid:
+                    continue
+                try:
+                    rss += proc.memory_info().rss
+                    if proc.pid != me.pid:
+                        times = proc.cpu_times()
+                        self.child_cpu[proc.pid] = times.user + times.system
+                except psutil.Error:
+                    continue
+            self.peak_rss = max(self.peak_rss, rss)
+            self.done.wait(self.interval)
+
+    def __enter__(self) -> "ResourceSampler":
+        self.cpu_start = time.process_time()
+        self.children_start = self._children_cpu()
+        if psutil is not None:
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.done.set()
+        if psutil is not None:
+            self.thread.join()
+        self.cpu = time.process_time() - self.cpu_start
+        children = self._children_cpu()
+        # Finished children are in the rusage totals; psutil samples cover them where rusage is missing
+        self.cpu += children - self.children_start if children is not None else sum(self.child_cpu.values())
+
+    @staticmethod
+    def _children_cpu() -> Optional[float]:
+        if resource is None:
+            return None
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return usage.ru_utime + usage.ru_stime
+
+    def peak_rss_mb(self) -> Optional[float]:
+        if psutil is not None:
+            return self.peak_rss / 1024 / 1024
+        if resource is not None:
+            # Lifetime peak of the largest single process, not per scenario
+            scale = 1 if sys.platform == "darwin" else 1024
+            peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                       resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+            return peak * scale / 1024 / 1024
+        return None
+
+class Result(NamedTuple):
+    scenario: str
+    seconds: float
+    bytes: int
+    throughput: float  # MiB/s
+    ttfb: Optional[float]  # median seconds from scenario start to the first media byte, per job
+    ttfb_max: Optional[float]
+    cpu: float
+    peak_rss: Optional[float]  # MiB
+    ok: int
+    failed: int
+
+class Benchmark:
+    """Runs scenarios against the local media server through app.py's download functions."""
+
+    def __init__(self, app, base_url: str, work_dir: str, assets: List[str], args) -> None:
+        self.app = app
+        self.base_url = base_url
+        self.work_dir = work_dir
+        self.assets = assets
+        self.args = args
+        self.server_pid = 0
+        self.runs = 0
+
+    def _request(self, method: str, path: str) -> dict:
+        from urllib.request import Request, urlopen
+        with urlopen(Request(self.base_url + path, method=method), timeout=10) as response:
+            return json.load(response)
+
+    def _single(self, url: str, out_dir: str) -> bool:
+        output, success = "", False
+        for output, _, success in self.app.download_with_retry(
+            url, out_dir, False, False, "", False, "", skip_duplicates=False
+        ):
+            pass
+        return self.app.download_outcome(output, success) == "done"
+
+    def run(self, name: str) -> Optional[Result]:
+        kind, mode, asset, jobs = SCENARIOS[name]
+        if kind == "bulk":
+            jobs = self.args.bulk_count
+            picks = [(m, a) for m, a in BULK_ASSETS if a in self.assets]
+            urls = [f"{self.base_url}/{picks[n % len(picks)][0]}/j{n}/{picks[n % len(picks)][1]}" for n in range(jobs)]
+        elif asset not in self.assets:
+            print(f"⏭️ {name}: skipped ({asset} needs ffmpeg)")
+            return None
+        else:
+            if kind == "concurrent":
+                jobs = self.args.concurrency
+            urls = [f"{self.base_url}/{mode}/j{n}/{asset}" for n in range(jobs)]
+
+        self.runs += 1
+        out_dir = os.path.join(self.work_dir, "out", f"{name}-{self.runs}")
+        os.makedirs(out_dir)
+        self._request("POST", "/_reset")
+        outcomes: List[bool] = []
+
+        started_wall = time.time()
+        started = time.perf_counter()
+        with ResourceSampler(self.server_pid) as sampler:
+            if kind == "bulk":
+                gen = self.app.bulk_wrapper("\n".join(urls), out_dir, False, False, "", False, "",
+                                            max_workers=self.args.workers, skip_duplicates=False)
+                summary = self.app.run_to_completion(gen)
+                outcomes = [True] * (summary.succeeded + summary.skipped) + [False] * summary.failed
+            else:
+                threads = [threading.Thread(target=lambda u=url: outcomes.append(self._single(u, out_dir)))
+                           for url in urls]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+        seconds = time.perf_counter() - started
+
+        stats = self._request("GET", "/_stats")
+        first = sorted(t - started_wall for t in stats["first_byte"].values())
+        return Result(
+            scenario=name, seconds=seconds, bytes=stats["bytes"],
+            throughput=stats["bytes"] / 1024 / 1024 / seconds if seconds else 0.0,
+            ttfb=statistics.median(first) if first else None, ttfb_max=first[-1] if first else None,
+            cpu=sampler.cpu, peak_rss=sampler.peak_rss_mb(),
+            ok=sum(outcomes), failed=len(outcomes) - sum(outcomes),
+        )
+
+def median_result(results: List[Result]) -> Result:
+    """Combine repeats of one scenario (median of every measurement)."""
+    def med(values: List[Optional[float]]) -> Optional[float]:
+        values = [v for v in values if v is not None]
+        return statistics.median(values) if values else None
+    fields = {f: med([getattr(r, f) for r in results]) for f in ("seconds", "throughput", "ttfb", "ttfb_max", "cpu", "peak_rss")}
+    return results[0]._replace(bytes=int(statistics.median(r.bytes for r in results)),
+                               ok=sum(r.ok for r in results), failed=sum(r.failed for r in results), **fields)
+
+def print_table(results: List[Result]) -> None:
+    fmt = lambda v, spec: format(v, spec) if v is not None else "n/a"
+    print(f"\n{'scenario':<14}{'time s':>9}{'MiB':>9}{'MiB/s':>9}{'TTFB s':>9}{'TTFB max':>10}"
+          f"{'CPU s':>8}{'CPU %':>7}{'RSS MiB':>9}{'ok/fail':>9}")
+    for r in results:
+        print(f"{r.scenario:<14}{r.seconds:>9.2f}{r.bytes / 1024 / 1024:>9.1f}{r.throughput:>9.2f}"
+              f"{fmt(r.ttfb, '>9.2f')}{fmt(r.ttfb_max, '>10.2f')}{r.cpu:>8.2f}"
+              f"{100 * r.cpu / r.seconds if r.seconds else 0:>7.0f}{fmt(r.peak_rss, '>9.1f')}"
+              f"{f'{r.ok}/{r.failed}':>9}")
+
+def compare(results: List[Result], baseline_path: str, tolerance: float) -> List[str]:
+    """Scenarios that got slower than the baseline run by more than tolerance."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {r["scenario"]: r for r in json.load(f)["results"]}
+    regressions = []
+    for r in results:
+        base = baseline.get(r.scenario)
+        if not base:
+            continue
+        if r.seconds > base["seconds"] * (1 + tolerance):
+            regressions.append(f"{r.scenario}: {r.seconds:.2f}s vs {base['seconds']:.2f}s")
+        if r.failed > base["failed"]:
+            regressions.append(f"{r.scenario}: {r.failed} failed vs {base['failed']}")
+    return regressions
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline YouOwn download benchmark")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"comma separated, from: {', '.join(SCENARIOS)}")
+    parser.add_argument("--engine", choices=["subprocess", "inprocess"], default=os.environ.get("YOUOWN_ENGINE", "subprocess"))
+    parser.add_argument("--repeat", type=int, default=1, help="runs per scenario, the median is reported")
+    parser.add_argument("--size-mb", type=int, default=DEFAULT_SIZE_MB, help="size of the synthetic clip")
+    parser.add_argument("--bulk-count", type=int, default=SCENARIOS["bulk"][3], help="URLs in the bulk scenario")
+    parser.add_argument("--workers", type=int, default=4, help="bulk workers")
+    parser.add_argument("--concurrency", type=int, default=SCENARIOS["concurrent"][3], help="parallel single downloads")
+    parser.add_argument("--json", help="write the results here")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against the baseline (0.2 = 20%%)")
+    parser.add_argument("--keep", action="store_true", help="keep the media and downloaded files")
+    args = parser.parse_args(argv)
+
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(unknown)}")
+
+    work_dir = tempfile.mkdtemp(prefix="youown_bench_")
+    # Fresh app state (metadata cache, archive, job queue) and no production limits or long backoffs
+    os.environ["YOUOWN_DATA_DIR"] = os.path.join(work_dir, "state")
+    os.environ["YOUOWN_ENGINE"] = args.engine
+    os.environ.setdefault("YOUOWN_HOST_LIMITS", "localhost=16/6000")
+    os.environ.setdefault("YOUOWN_RETRY_DELAY", "0.5")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app
+
+    media_dir = os.path.join(work_dir, "media")
+    os.makedirs(media_dir)
+    print(f"🎞️ Generating {args.size_mb} MiB of synthetic media...")
+    assets = make_media(media_dir, args.size_mb)
+
+    ready = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(media_dir, ready), daemon=True)
+    server.start()
+    port = ready.get(timeout=30)
+    bench = Benchmark(app, f"http://localhost:{port}", work_dir, assets, args)
+    bench.server_pid = server.pid
+    print(f"🛰️ Media server on http://localhost:{port}, engine {args.engine}, psutil "
+          f"{'available' if psutil else 'not installed (RSS is a lifetime peak)'}")
+
+    results = []
+    try:
+        for name in names:
+            runs = [r for r in (bench.run(name) for _ in range(args.repeat)) if r is not None]
+            if runs:
+                results.append(median_result(runs))
+                print(f"✅ {name}: {results[-1].seconds:.2f}s")
+    finally:
+        server.terminate()
+        server.join()
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_table(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"engine": args.engine, "size_mb": args.size_mb, "time": time.time(),
+                       "results": [r._asdict() for r in results]}, f, indent=2)
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"🐢 Regression: {line}")
+        if regressions:
+            return 1
+        print("✅ No regressions against the baseline")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
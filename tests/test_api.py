@@ -0,0 +1,103 @@
+import http.client
+import json
+import os
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import app
+
+@pytest.mark.parametrize("extra_args", [
+    "",
+    "-f best --limit-rate 1M",
+    "--format=bestaudio -x --audio-format mp3",
+    "--add-header Referer:https://example.com -N 4",
+])
+def test_allowed_extra_args(extra_args):
+    assert app.check_api_extra_args(extra_args) is None
+
+@pytest.mark.parametrize("extra_args, error", [
+    ("--exec rm", "yt-dlp option not allowed: --exec"),
+    ("--exe rm", "yt-dlp option not allowed: --exe"),
+    ("--exec=rm", "yt-dlp option not allowed: --exec=rm"),
+    ("-f best --downloader curl", "yt-dlp option not allowed: --downloader"),
+    ("--config-locations /etc/passwd", "yt-dlp option not allowed: --config-locations"),
+    ("-o /tmp/x", "yt-dlp option not allowed: -o"),
+    ("--limit-rate", "--limit-rate needs a value"),
+])
+def test_rejected_extra_args(extra_args, error):
+    assert app.check_api_extra_args(extra_args) == error
+
+def test_option_values_are_not_checked_as_options():
+    # "--exec" here is the value of --referer, which yt-dlp won't run
+    assert app.check_api_extra_args("--referer --exec") is None
+
+@pytest.fixture
+def list_dir(tmp_path, monkeypatch):
+    root = tmp_path / "lists"
+    root.mkdir()
+    (root / "urls.txt").write_text("https://example.com/a.mp4\n")
+    (tmp_path / "secret.txt").write_text("x")
+    monkeypatch.setattr(app, "API_LIST_DIR", str(root))
+    return root
+
+def test_url_files_inside_the_list_folder(list_dir):
+    assert app.check_api_url_file("urls.txt") is None
+    assert app.check_api_url_file(str(list_dir / "urls.txt")) is None
+    assert app.check_api_url_file("missing.txt") == "url file not found: missing.txt"
+
+@pytest.mark.parametrize("path", ["../secret.txt", "/etc/passwd"])
+def test_url_files_outside_the_list_folder(list_dir, path):
+    assert app.check_api_url_file(path) == f"url_files must be inside {list_dir}"
+
+@pytest.mark.skipif(not hasattr(os, "symlink") or os.name == "nt", reason="needs symlinks")
+def test_url_files_may_not_link_out_of_the_list_folder(list_dir):
+    os.symlink(list_dir.parent / "secret.txt", list_dir / "link.txt")
+    assert app.check_api_url_file("link.txt") == f"url_files must be inside {list_dir}"
+
+@pytest.fixture
+def api(monkeypatch, list_dir):
+    monkeypatch.setattr(app, "API_TOKEN", "")
+    monkeypatch.setattr(app.ApiHandler, "jobs", {})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), app.ApiHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+def post(port: int, body: dict, headers: dict = None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    headers = dict({"Host": f"localhost:{port}", "Content-Type": "application/json"}, **(headers or {}))
+    conn.request("POST", "/jobs", json.dumps(body), headers)
+    response = conn.getresponse()
+    payload = json.loads(response.read())
+    conn.close()
+    return response.status, payload
+
+def test_api_rejects_extra_args_outside_the_allowlist(api):
+    status, payload = post(api, {"urls": ["https://example.com/a.mp4"], "extra_args": "--exec touch /tmp/x"})
+    assert (status, payload) == (400, {"error": "yt-dlp option not allowed: --exec"})
+    assert app.ApiHandler.jobs == {}
+
+def test_api_rejects_url_files_outside_the_list_folder(api):
+    status, payload = post(api, {"url_files": ["../secret.txt"]})
+    assert status == 400 and payload["error"].startswith("url_files must be inside")
+
+@pytest.mark.parametrize("headers", [
+    {"Host": "attacker.example"},
+    {"Origin": "https://attacker.example"},
+])
+def test_api_without_token_only_serves_local_pages(api, headers):
+    status, _ = post(api, {"urls": ["https://example.com/a.mp4"]}, headers)
+    assert status == 403
+    assert app.ApiHandler.jobs == {}
+
+def test_api_requires_the_token_when_set(api, monkeypatch):
+    monkeypatch.setattr(app, "API_TOKEN", "s3cret")
+    status, _ = post(api, {"urls": ["https://example.com/a.mp4"]})
+    assert status == 401
+    status, payload = post(api, {"urls": ["https://example.com/a.mp4"], "extra_args": "--exec x"},
+                           {"Authorization": "Bearer s3cret", "Host": "attacker.example"})
+    # Authorized, but the allowlist still applies
+    assert (status, payload) == (400, {"error": "yt-dlp option not allowed: --exec"})
@@ -0,0 +1,193 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+from contextlib import closing
+
+import pytest
+
+import app
+
+OTHER_OWNER = "other-host:4242"
+
+@pytest.fixture
+def store(tmp_path):
+    return app.JobStore(str(tmp_path / "jobs.sqlite3"))
+
+def as_owner(store: app.JobStore, owner: str) -> app.JobStore:
+    """A second handle on the same database, as another process would open it."""
+    other = app.JobStore(store.path)
+    other.OWNER = owner
+    return other
+
+def batch_row(store: app.JobStore, batch_id: str):
+    with closing(sqlite3.connect(store.path)) as db:
+        return db.execute("SELECT owner, heartbeat FROM batches WHERE id = ?", (batch_id,)).fetchone()
+
+def set_heartbeat(store: app.JobStore, batch_id: str, heartbeat) -> None:
+    with closing(sqlite3.connect(store.path)) as db, db:
+        db.execute("UPDATE batches SET heartbeat = ? WHERE id = ?", (heartbeat, batch_id))
+
+def test_migrates_databases_from_before_distributed_batches(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    with closing(sqlite3.connect(path)) as db, db:
+        db.executescript("""
+            CREATE TABLE batches (id TEXT PRIMARY KEY, created REAL NOT NULL, options TEXT NOT NULL,
+                                  state TEXT NOT NULL DEFAULT 'running');
+            CREATE TABLE jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, batch_id TEXT NOT NULL,
+                               position INTEGER NOT NULL, url TEXT NOT NULL, uid TEXT NOT NULL,
+                               state TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0,
+                               output_path TEXT, error TEXT, updated REAL NOT NULL);
+            INSERT INTO batches VALUES ('old', 0, '{}', 'running');
+            INSERT INTO jobs (batch_id, position, url, uid, updated) VALUES ('old', 1, 'https://example.com/a.mp4', 'abcd1234', 0);
+        """)
+
+    store = app.JobStore(path)
+    with closing(sqlite3.connect(path)) as db:
+        batch_columns = {row[1] for row in db.execute("PRAGMA table_info(batches)")}
+        job_columns = {row[1] for row in db.execute("PRAGMA table_info(jobs)")}
+    assert {"distributed", "owner", "heartbeat"} <= batch_columns
+    assert {"lease_owner", "lease_expires", "not_before", "finished_seq", "volume", "digest"} <= job_columns
+
+    assert store.unfinished_batches() == [("old", {})]
+    job, = store.unfinished_jobs("old")
+    assert (job.url, job.uid, job.volume, job.digest) == ("https://example.com/a.mp4", "abcd1234", None, None)
+    # Jobs queued before digests were stored get one computed
+    assert store.batch_digests("old") == {app.url_digest("https://example.com/a.mp4")}
+    # Opening it again doesn't try to add the columns twice
+    app.JobStore(path)
+
+def test_appended_jobs_continue_after_the_last_position(store):
+    batch_id = store.create_batch({})
+    store.add_jobs(batch_id, [(1, "https://a.example/1", 11), (2, "https://a.example/2", 12)])
+    appended = store.append_jobs(batch_id, [("https://a.example/3", 13)])
+    assert [job.position for job in appended] == [3]
+    assert [job.position for job in store.unfinished_jobs(batch_id)] == [1, 2, 3]
+    assert store.batch_digests(batch_id) == {11, 12, 13}
+
+def test_claim_refuses_a_batch_whose_owner_is_alive(store):
+    batch_id = store.create_batch({})
+    assert batch_row(store, batch_id)[0] == store.OWNER
+    assert not as_owner(store, OTHER_OWNER).claim_batch(batch_id)
+    # The owner itself may claim it again
+    assert store.claim_batch(batch_id)
+
+def test_claim_takes_over_once_the_owner_stops_heartbeating(store):
+    batch_id = as_owner(store, OTHER_OWNER).create_batch({})
+    set_heartbeat(store, batch_id, time.time() - app.LEASE_SECONDS - 1)
+    assert store.claim_batch(batch_id)
+    assert batch_row(store, batch_id)[0] == store.OWNER
+
+def test_claim_takes_over_a_released_batch(store):
+    other = as_owner(store, OTHER_OWNER)
+    batch_id = other.create_batch({})
+    other.release_batch(batch_id)
+    assert batch_row(store, batch_id) == (None, None)
+    assert store.claim_batch(batch_id)
+
+def test_claim_is_compare_and_set(store, monkeypatch):
+    batch_id = as_owner(store, OTHER_OWNER).create_batch({})
+    set_heartbeat(store, batch_id, time.time() - app.LEASE_SECONDS - 1)
+    rival = as_owner(store, "rival-host:7")
+
+    def rival_claims_first(owner, heartbeat):
+        # Another process claims the batch between our read and our update
+        monkeypatch.setattr(app, "owner_gone", lambda *args: True)
+        assert rival.claim_batch(batch_id)
+        return True
+
+    monkeypatch.setattr(app, "owner_gone", rival_claims_first)
+    assert not store.claim_batch(batch_id)
+    assert batch_row(store, batch_id)[0] == "rival-host:7"
+
+def test_claim_of_a_missing_batch_fails(store):
+    assert not store.claim_batch("nope")
+
+def test_only_the_owner_heartbeats_and_releases(store):
+    batch_id = store.create_batch({})
+    set_heartbeat(store, batch_id, 1.0)
+    other = as_owner(store, OTHER_OWNER)
+    other.beat_batch(batch_id)
+    other.release_batch(batch_id)
+    assert batch_row(store, batch_id) == (store.OWNER, 1.0)
+    store.beat_batch(batch_id)
+    assert batch_row(store, batch_id)[1] > 1.0
+
+def test_hold_batch_heartbeats_until_done_then_releases(store, monkeypatch):
+    monkeypatch.setattr(app, "HEARTBEAT_INTERVAL", 0.01)
+    batch_id = store.create_batch({})
+    set_heartbeat(store, batch_id, 1.0)
+    done = app.hold_batch(store, batch_id)
+    deadline = time.time() + 5
+    while batch_row(store, batch_id)[1] == 1.0 and time.time() < deadline:
+        time.sleep(0.01)
+    assert batch_row(store, batch_id)[1] > 1.0
+    done.set()
+    while batch_row(store, batch_id)[0] is not None and time.time() < deadline:
+        time.sleep(0.01)
+    assert batch_row(store, batch_id) == (None, None)
+
+def test_owner_gone_after_the_lease_time_without_heartbeat():
+    assert app.owner_gone(OTHER_OWNER, None)
+    assert app.owner_gone(OTHER_OWNER, time.time() - app.LEASE_SECONDS - 1)
+    # A process on another machine can't be probed, so only the heartbeat counts
+    assert not app.owner_gone(OTHER_OWNER, time.time())
+    assert not app.owner_gone(app.JobStore.OWNER, time.time())
+
+@pytest.mark.skipif(os.name == "nt", reason="PIDs are only probed on POSIX")
+def test_owner_gone_when_its_pid_exited_on_this_machine():
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    owner = f"{app.socket.gethostname()}:{proc.pid}"
+    assert app.owner_gone(owner, time.time())
+
+def test_expired_lease_is_taken_over_by_another_node(store):
+    batch_id = store.create_batch({"out_dir": "x"}, distributed=True)
+    store.add_jobs(batch_id, [(1, "https://a.example/1", 1)])
+
+    job, leased_batch, options = store.lease_job("node-a", lambda url: True, lease_seconds=60)
+    assert (job.attempts, leased_batch, options) == (1, batch_id, {"out_dir": "x"})
+    # Nothing else to lease while node-a holds it
+    assert store.lease_job("node-b", lambda url: True) is None
+    assert store.heartbeat("node-a", {job.id: (0.5, "half")}) == []
+
+    with closing(sqlite3.connect(store.path)) as db, db:
+        db.execute("UPDATE jobs SET lease_expires = ? WHERE id = ?", (time.time() - 1, job.id))
+    taken, _, _ = store.lease_job("node-b", lambda url: True)
+    assert (taken.id, taken.attempts) == (job.id, 2)
+
+    # node-a finds out on its next heartbeat, and its late result is ignored
+    assert store.heartbeat("node-a", {job.id: (0.9, "almost")}) == [job.id]
+    assert not store.finish_leased(job.id, "node-a", "done")
+    assert store.finish_leased(taken.id, "node-b", "done")
+    assert store.unfinished_jobs(batch_id) == []
+
+def test_expired_lease_fails_the_job_after_too_many_attempts(store, monkeypatch):
+    monkeypatch.setattr(app, "RETRY_LIMIT", 0)
+    batch_id = store.create_batch({}, distributed=True)
+    store.add_jobs(batch_id, [(1, "https://a.example/1", 1)])
+    job, _, _ = store.lease_job("node-a", lambda url: True)
+    with closing(sqlite3.connect(store.path)) as db, db:
+        db.execute("UPDATE jobs SET lease_expires = ? WHERE id = ?", (time.time() - 1, job.id))
+    assert store.lease_job("node-b", lambda url: True) is None
+    counts, _, finished, _ = store.batch_snapshot(batch_id, 0)
+    assert counts == {"failed": 1}
+    assert finished[0][4] == "Worker node stopped responding"
+
+def test_lease_skips_jobs_the_node_does_not_allow(store):
+    batch_id = store.create_batch({}, distributed=True)
+    store.add_jobs(batch_id, [(1, "https://busy.example/1", 1), (2, "https://free.example/2", 2)])
+    job, _, _ = store.lease_job("node-a", lambda url: "free" in url)
+    assert job.position == 2
+
+def test_paused_batch_takes_back_its_leases(store):
+    batch_id = store.create_batch({}, distributed=True)
+    store.add_jobs(batch_id, [(1, "https://a.example/1", 1)])
+    job, _, _ = store.lease_job("node-a", lambda url: True)
+    store.set_batch_state(batch_id, "paused")
+    assert store.heartbeat("node-a", {job.id: (0.1, "")}) == [job.id]
+    store.release_job(job.id, "node-a")
+    assert store.lease_job("node-a", lambda url: True) is None
+    store.set_batch_state(batch_id, "running")
+    assert store.lease_job("node-a", lambda url: True)[0].id == job.id
@@ -0,0 +1,108 @@
+import json
+
+import pytest
+
+import app
+
+class Clock:
+    def __init__(self, now: float = 1_000_000.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(app.time, "time", clock)
+    return clock
+
+def info(video_id: str, **extra) -> bytes:
+    return json.dumps(dict({"id": video_id, "title": "x" * 2000 + video_id}, **extra)).encode()
+
+def test_round_trip_without_credentials(tmp_path, clock):
+    cache = app.MetadataCache(str(tmp_path / "info.sqlite3"))
+    cache.put("youtube a", info("a", cookies="SID=1", http_headers={"Cookie": "SID=1", "User-Agent": "ua"},
+                                formats=[{"url": "https://cdn/a", "http_headers": {"Authorization": "Bearer t"}}]))
+    cached = cache.get_info("youtube a")
+    assert "cookies" not in cached
+    assert cached["http_headers"] == {"User-Agent": "ua"}
+    assert cached["formats"] == [{"url": "https://cdn/a", "http_headers": {}}]
+
+def test_entries_expire_after_the_ttl(tmp_path, clock):
+    cache = app.MetadataCache(str(tmp_path / "info.sqlite3"), ttl=60)
+    cache.put("k", info("a"))
+    clock.now += 59
+    assert cache.get_info("k")["id"] == "a"
+    clock.now += 2
+    assert cache.get("k") is None
+
+def test_entries_expire_with_their_stream_urls(tmp_path, clock):
+    cache = app.MetadataCache(str(tmp_path / "info.sqlite3"), ttl=3600)
+    expire = int(clock.now) + 600
+    cache.put("k", info("a", formats=[{"url": f"https://cdn/v?expire={expire}&sig=x"}]))
+    clock.now += 299
+    assert cache.get("k") is not None
+    # Five minutes of margin before the stream URL itself stops working
+    clock.now += 2
+    assert cache.get("k") is None
+
+def test_least_recently_used_entries_are_evicted_first(tmp_path, clock):
+    path = str(tmp_path / "info.sqlite3")
+    size = len(app.zlib.compress(json.dumps(app.strip_credentials(json.loads(info("a")))).encode()))
+    cache = app.MetadataCache(path, max_bytes=size * 2 + size // 2)
+    cache.put("a", info("a"))
+    clock.now += 1
+    cache.put("b", info("b"))
+    clock.now += 1
+    cache.get("a")
+    clock.now += 1
+    cache.put("c", info("c"))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+def test_playlists_and_bad_json_are_not_cached(tmp_path, clock):
+    cache = app.MetadataCache(str(tmp_path / "info.sqlite3"))
+    cache.put("p", json.dumps({"_type": "playlist", "entries": []}).encode())
+    cache.put("bad", b"{not json")
+    assert cache.get("p") is None and cache.get("bad") is None
+
+def test_invalidate(tmp_path, clock):
+    cache = app.MetadataCache(str(tmp_path / "info.sqlite3"))
+    cache.put("k", info("a"))
+    cache.invalidate("k")
+    assert cache.get("k") is None
+
+def test_normalize_url_drops_tracking_parameters_and_fragments():
+    assert app.normalize_url(" HTTPS://Example.COM/v.mp4?utm_source=x&b=2&si=abc#t=3 ") \
+        == "https://example.com/v.mp4?b=2"
+    assert app.normalize_url("example.com") == "https://example.com/"
+
+def test_url_digest_matches_variants_of_the_same_link():
+    assert app.url_digest("https://example.com/v.mp4?utm_source=news&fbclid=1") \
+        == app.url_digest("https://EXAMPLE.com/v.mp4#top")
+    assert app.url_digest("https://example.com/v.mp4") != app.url_digest("https://example.com/w.mp4")
+
+def test_url_digest_matches_the_same_video_on_other_urls():
+    pytest.importorskip("yt_dlp")
+    digest = app.url_digest("https://www.youtube.com/watch?v=dQw4w9WgXcQ")
+    assert app.url_digest("https://youtu.be/dQw4w9WgXcQ?si=abc") == digest
+    assert app.url_digest("https://m.youtube.com/watch?v=dQw4w9WgXcQ&feature=share") == digest
+    assert app.url_digest("https://www.youtube.com/watch?v=oHg5SJYRHA0") != digest
+
+@pytest.mark.parametrize("url", [
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "https://www.youtube.com/playlist?list=PLBB231211A4F62143",
+    "https://www.reddit.com/r/videos/comments/abc123/title/",
+    "https://vimeo.com/76979871",
+    "https://example.com/a.mp4",
+    "https://www.bbc.co.uk/iplayer/episode/b0000000/title",
+])
+def test_archive_id_agrees_with_yt_dlp_extractor_matching(url):
+    yt_dlp = pytest.importorskip("yt_dlp")
+    for ie in yt_dlp.extractor.gen_extractor_classes():
+        if ie.suitable(url):
+            break
+    temp_id = ie.get_temp_id(url)
+    expected = None if ie.ie_key() == "Generic" or not temp_id else app.make_archive_id(ie.ie_key(), temp_id)
+    assert app.archive_id_for_url(url) == expected
@@ -0,0 +1,129 @@
+import time
+
+import pytest
+
+import app
+
+@pytest.mark.parametrize("url, key", [
+    ("https://www.youtube.com/watch?v=x", "youtube.com"),
+    ("https://youtu.be/x", "youtube.com"),
+    ("https://m.youtube.com/watch?v=x", "youtube.com"),
+    ("redd.it/abc", "reddit.com"),
+    ("https://www.bbc.co.uk/news", "bbc.co.uk"),
+    ("https://news.bbc.co.uk/a", "bbc.co.uk"),
+    ("https://itv.co.uk/a", "itv.co.uk"),
+    ("https://abc.net.au/a", "abc.net.au"),
+    ("https://cdn.example.de/a", "example.de"),
+    ("http://192.168.1.10:8080/a", "192.168.1.10"),
+    ("http://[::1]/a", "::1"),
+])
+def test_host_key(url, key):
+    assert app.host_key(url) == key
+
+def test_parse_host_limits_skips_bad_entries():
+    limits = app.parse_host_limits("A.com=2/30, b.com=3, bad, c.com=x/1, d.com=0/0")
+    assert limits == {"a.com": (2, 30), "b.com": (3, app.DEFAULT_HOST_LIMIT[1]), "d.com": (1, 1)}
+
+def scheduler(jobs, limits):
+    return app.HostScheduler(enumerate(jobs), limits)
+
+def test_host_concurrency_cap_until_release():
+    hosts = scheduler(["https://a.com/1", "https://a.com/2", "https://b.com/1"],
+                      {"a.com": (1, 6000), "b.com": (1, 6000)})
+    first = hosts.next_job()
+    second = hosts.next_job()
+    # Round-robin: b.com isn't kept waiting behind a.com's list
+    assert [first[2], second[2]] == ["a.com", "b.com"]
+    assert hosts.running == {"a.com": 1, "b.com": 1}
+    assert list(hosts.pending["a.com"]) == [(1, "https://a.com/2")]
+
+    hosts.release(first[0])
+    assert hosts.next_job() == (1, "https://a.com/2", "a.com")
+
+def test_release_twice_frees_one_slot():
+    hosts = scheduler(["https://a.com/1", "https://a.com/2", "https://a.com/3"], {"a.com": (2, 6000)})
+    i, _, _ = hosts.next_job()
+    hosts.next_job()
+    hosts.release(i)
+    hosts.release(i)
+    hosts.release(99)  # never started
+    assert hosts.running["a.com"] == 1
+
+def test_rate_limit_delays_the_next_start():
+    hosts = scheduler(["https://a.com/1", "https://a.com/2"], {"a.com": (1, 600)})
+    i, _, _ = hosts.next_job()
+    hosts.release(i)
+    started = time.monotonic()
+    assert hosts.next_job()[0] == 1
+    # 600 per minute: one token every 0.1s once the burst of one is spent
+    assert time.monotonic() - started >= 0.05
+
+def test_queue_wait_counts_from_when_the_job_was_queued():
+    hosts = scheduler(["https://a.com/1"], {})
+    time.sleep(0.02)
+    i, _, _ = hosts.next_job()
+    assert hosts.queue_wait(i) >= 0.02
+    # Asked again it has nothing left to report
+    assert hosts.queue_wait(i) < 0.01
+
+def test_retry_comes_back_after_its_delay_without_holding_a_slot():
+    hosts = scheduler(["https://a.com/1"], {"a.com": (1, 6000)})
+    i, url, _ = hosts.next_job()
+    hosts.release(i)
+    hosts.retry(i, url, 0.05)
+    assert hosts.running["a.com"] == 0
+    started = time.monotonic()
+    assert hosts.next_job() == (i, url, "a.com")
+    assert time.monotonic() - started >= 0.04
+
+def test_next_job_ends_when_nothing_is_left():
+    hosts = scheduler([], {})
+    assert hosts.next_job() is None
+
+MIB = 1024 * 1024
+
+def bandwidth(limit=10 * MIB):
+    return app.BandwidthScheduler(limit, {"interactive": 3.0, "bulk": 1.0})
+
+def test_bandwidth_split_by_priority_weight():
+    scheduler = bandwidth()
+    interactive = scheduler.register("interactive", live=True)
+    bulk = scheduler.register("bulk", live=True)
+    assert scheduler.share(interactive) == pytest.approx(7.5 * MIB)
+    assert scheduler.share(bulk) == pytest.approx(2.5 * MIB)
+    scheduler.unregister(interactive)
+    assert scheduler.share(bulk) == pytest.approx(10 * MIB)
+
+def test_bandwidth_unused_share_goes_to_the_others():
+    scheduler = bandwidth()
+    applied = {}
+    slow = scheduler.register("interactive", live=True)
+    fast = scheduler.register("bulk", live=True)
+    scheduler.set_apply(slow, lambda rate: applied.__setitem__("slow", rate))
+    scheduler.set_apply(fast, lambda rate: applied.__setitem__("fast", rate))
+    scheduler._last_rebalance = 0  # let report() rebalance straight away
+    scheduler.report(slow, 1 * MIB)
+    assert applied["slow"] == pytest.approx(1.25 * MIB)
+    assert applied["fast"] == pytest.approx(8.75 * MIB)
+
+def test_bandwidth_subprocess_download_keeps_its_starting_rate():
+    scheduler = bandwidth()
+    live = scheduler.register("interactive", live=True)
+    fixed = scheduler.register("bulk", live=False)
+    assert scheduler.share(fixed) == pytest.approx(2.5 * MIB)
+    # The running subprocess can't be sped up, so the freed budget isn't counted as its
+    scheduler.unregister(live)
+    assert scheduler.share(fixed) == pytest.approx(2.5 * MIB)
+
+def test_bandwidth_never_rates_a_download_below_the_minimum():
+    scheduler = app.BandwidthScheduler(100 * 1024, {"interactive": 3.0, "bulk": 1.0})
+    scheduler.register("interactive", live=True)
+    bulk = scheduler.register("bulk", live=True)
+    assert scheduler.share(bulk) == app.MIN_JOB_RATE
+
+def test_bandwidth_report_for_unknown_or_fixed_jobs_is_ignored():
+    scheduler = bandwidth()
+    fixed = scheduler.register("bulk", live=False)
+    scheduler.report(fixed, 1.0)
+    scheduler.report(12345, 1.0)
+    assert scheduler.share(fixed) == pytest.approx(10 * MIB)